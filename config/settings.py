@@ -48,6 +48,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'ipmanager.middleware.ForcePasswordChangeMiddleware',
+    'ipmanager.metrics.MetricsMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -87,6 +88,26 @@ DATABASES = {
 }
 
 
+# Cache
+# Probe results ("probes") and the subnet-trie stamp ("default") are shared between
+# workers through these aliases. Outside DEBUG both default to a file cache, shared
+# by the workers of one host; across hosts point them at Redis
+# (django.core.cache.backends.redis.RedisCache) or a db cache.
+_LOCAL_CACHE = "django.core.cache.backends.locmem.LocMemCache"
+_SHARED_CACHE = "django.core.cache.backends.filebased.FileBasedCache"
+IPAM_CACHE_DIR = os.getenv("IPAM_CACHE_DIR", "/var/tmp/ipam-cache")
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv("IPAM_CACHE_BACKEND", _LOCAL_CACHE if DEBUG else _SHARED_CACHE),
+        "LOCATION": os.getenv("IPAM_CACHE_LOCATION", os.path.join(IPAM_CACHE_DIR, "default")),
+    },
+    "probes": {
+        "BACKEND": os.getenv("IPAM_PROBE_CACHE_BACKEND", _LOCAL_CACHE if DEBUG else _SHARED_CACHE),
+        "LOCATION": os.getenv("IPAM_PROBE_CACHE_LOCATION", os.path.join(IPAM_CACHE_DIR, "probes")),
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -130,4 +151,31 @@ LOGOUT_REDIRECT_URL = "login"
 LOGIN_URL = "login"
 IPAM_PROBE_IFACE = "wlo1"
 IPAM_PROBE_TIMEOUT = 0.7
-
+IPAM_PROBE_WINDOW = 16        # candidates probed in parallel per batch
+IPAM_PROBE_DEADLINE = None    # seconds per batch; None = 2x probe timeout
+IPAM_PROBE_CACHE = "probes"   # cache alias for probe results
+IPAM_PROBE_TTL_USED = 30      # seconds an "in use" probe result is reused
+IPAM_PROBE_TTL_FREE = 5       # seconds a "free" probe result is reused
+IPAM_BULK_CLAIM_MAX = 1000    # max addresses per claim-many request
+IPAM_RESERVATION_TTL = 60     # seconds before an unconfirmed (PENDING) claim is undone; > probe deadline
+IPAM_SPARSE_CANDIDATES = 256  # IPv6 candidates tried per claim before giving up
+IPAM_METRICS = os.getenv("IPAM_METRICS", "0") == "1"            # counters/histograms at /metrics/
+IPAM_METRICS_LOG = os.getenv("IPAM_METRICS_LOG", "0") == "1"    # one log line per instrumented request
+IPAM_METRICS_TOKEN = os.getenv("IPAM_METRICS_TOKEN", "")        # bearer token for scrapers
+IPAM_SWEEP_INTERVAL = 300     # seconds between discovery sweeps (sweep_network)
+IPAM_SWEEP_CHUNK = 256        # addresses pinged at once by the sweeper
+IPAM_SWEEP_FRESH = 900        # seconds a sweep sighting lets claims skip an address
+IPAM_RECONCILE_HOURS = 24     # sightings older than this count as silent in the reconcile report
+IPAM_TRIE_MAX_AGE = 60        # seconds before the subnet prefix trie is rebuilt regardless
+
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "ipmanager.metrics": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
+}
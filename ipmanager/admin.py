@@ -1,17 +1,27 @@
 from django.contrib import admin
-from .models import IPAddressAllocation, Subnet
+from .models import DiscoveredHost, IPAddressAllocation, Subnet
 
 @admin.register(Subnet)
 class SubnetAdmin(admin.ModelAdmin):
-    list_display = ("name", "cidr", "gateway", "is_active")
+    list_display = ("name", "cidr", "gateway", "is_active", "is_supernet", "parent", "allocation_strategy")
     search_fields = ("name", "cidr", "gateway")
-    list_filter = ("is_active",)
+    list_filter = ("is_active", "is_supernet", "allocation_strategy")
+    list_select_related = ("parent",)
 
 @admin.register(IPAddressAllocation)
 class IPAllocationAdmin(admin.ModelAdmin):
     list_display = ("ip", "subnet", "status", "owner", "hostname", "claimed_at", "released_at")
     search_fields = ("ip", "hostname", "owner__username", "subnet__name")
     list_filter = ("status", "subnet")
+    ordering = ("subnet", "ip_int", "ip")
+
+@admin.register(DiscoveredHost)
+class DiscoveredHostAdmin(admin.ModelAdmin):
+    list_display = ("ip", "subnet", "mac", "first_seen", "last_seen")
+    search_fields = ("ip", "mac", "subnet__name")
+    list_filter = ("subnet",)
+    ordering = ("subnet", "ip_int", "ip")
+    readonly_fields = ("subnet", "ip", "ip_int", "mac", "first_seen", "last_seen")
 
 
 admin.site.site_header = "IP Manager"
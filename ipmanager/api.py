@@ -0,0 +1,338 @@
+"""
+Versioned JSON API (mounted at /api/v1/).
+
+Thin layer over `services`: reads use .values() rows instead of model
+instances, list/detail endpoints answer conditional GETs with an ETag
+derived from SubnetStats.last_change and the newest allocation change.
+
+Clients authenticate with `Authorization: Bearer <token>` (manage.py
+api_token) or, from the browser, with the session cookie plus CSRF token.
+"""
+import hashlib
+import ipaddress
+import json
+import secrets
+from functools import wraps
+
+from django.db.models import Count, Max, Q
+from django.core.exceptions import ValidationError
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from django.shortcuts import get_object_or_404
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET, require_POST
+
+from .filters import filter_allocations
+from .models import IPAddressAllocation, Subnet, SubnetLayout, SubnetStats, UserProfile, exact_free
+from .pagination import keyset_page
+from .supernets import carve_subnet, subnet_for_ip
+from .services import (
+    claim_first_free_ip,
+    claim_specific_ip,
+    rebuild_subnet_stats,
+    release_allocation,
+    stale_cutoff,
+)
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+ALLOCATION_FIELDS = (
+    "id", "subnet_id", "ip", "status", "owner__username", "hostname",
+    "description", "claimed_at", "released_at",
+)
+
+
+def hash_api_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def new_api_token() -> tuple[str, str]:
+    """
+    A fresh (token, hash) pair; store the hash on UserProfile.api_token, hand out the token.
+    """
+    token = secrets.token_urlsafe(32)
+    return token, hash_api_token(token)
+
+
+def _token_user(request):
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    profile = (
+        UserProfile.objects.select_related("user")
+        .filter(api_token=hash_api_token(token.strip()), user__is_active=True)
+        .first()
+    )
+    return profile.user if profile else None
+
+
+def _csrf_rejected(request) -> bool:
+    # the views are csrf_exempt so token clients need no cookie; session requests are checked here
+    return CsrfViewMiddleware(lambda r: None).process_view(request, None, (), {}) is not None
+
+
+def api_login_required(view):
+    """
+    Bearer token or session auth, 401/403 JSON instead of redirects.
+    Session requests still need the CSRF token and a changed password
+    (ForcePasswordChangeMiddleware leaves /api/ to this check).
+    """
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if "Authorization" in request.headers:
+            user = _token_user(request)
+            if user is None:
+                return JsonResponse({"error": "Invalid API token."}, status=401)
+            request.user = user
+            return view(request, *args, **kwargs)
+
+        if not request.user.is_authenticated:
+            return JsonResponse({"error": "Authentication required."}, status=401)
+        profile = getattr(request.user, "userprofile", None)
+        if profile and profile.must_change_password:
+            return JsonResponse({"error": "Password change required."}, status=403)
+        if _csrf_rejected(request):
+            return JsonResponse({"error": "CSRF check failed."}, status=403)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _stats_etag(request, subnet_id=None):
+    """
+    Changes whenever a claim/release/subnet edit touches the relevant SubnetStats rows,
+    an allocation in scope is edited, or (stale=1) a row ages past the stale cutoff.
+    Two aggregate queries; the path and user are mixed in because filters and `mine` vary the body.
+    """
+    stats = SubnetStats.objects.all()
+    allocs = IPAddressAllocation.objects.all()
+    if subnet_id is not None:
+        stats = stats.filter(subnet_id=subnet_id)
+        allocs = allocs.filter(subnet_id=subnet_id)
+    agg = stats.aggregate(last=Max("last_change"), n=Count("subnet"))
+    edits = {"edited": Max("updated_at")}
+    if request.GET.get("stale") == "1":
+        # newest claim already past the cutoff: moves exactly when a row ages into the filter
+        edits["aged"] = Max("claimed_at", filter=Q(claimed_at__lte=stale_cutoff()))
+    edits = allocs.aggregate(**edits)
+    raw = f"{agg['last']}|{agg['n']}|{edits.get('edited')}|{edits.get('aged')}|{request.user.pk}|{request.get_full_path()}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _limit(request) -> int:
+    try:
+        limit = int(request.GET.get("limit") or DEFAULT_LIMIT)
+    except ValueError:
+        return DEFAULT_LIMIT
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _json_body(request):
+    try:
+        payload = json.loads(request.body or b"{}")
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+def _subnet_row(row: dict) -> dict:
+    layout = SubnetLayout.parse(row["cidr"], row["gateway"], row["excluded_ips"], row["reserved_pools"])
+    first, last = layout.first_usable(), layout.last_usable()
+    usable = layout.usable_count()
+    return {
+        "id": row["id"],
+        "name": row["name"],
+        "cidr": row["cidr"],
+        "gateway": row["gateway"],
+        "is_supernet": row["is_supernet"],
+        "parent": row["parent_id"],
+        "allocation_strategy": row["allocation_strategy"],
+        "pools": [{"name": p.name, "ranges": p.text, "size": p.size} for p in layout.pools],
+        "usable_count": usable,
+        "first_ip": None if first is None else str(ipaddress.ip_address(first)),
+        "last_ip": None if last is None else str(ipaddress.ip_address(last)),
+        "used": row["stats__used"],
+        "released": row["stats__released"],
+        "stale": row["stats__stale"],
+        "free": exact_free(row["stats__free"], usable, row["stats__used"]),
+    }
+
+
+def _subnet_rows(qs) -> list[dict]:
+    fields = (
+        "id", "name", "cidr", "gateway", "excluded_ips", "reserved_pools", "is_supernet", "parent_id", "allocation_strategy",
+        "stats__used", "stats__released", "stats__stale", "stats__free",
+    )
+    rows = list(qs.values(*fields))
+    missing = [r["id"] for r in rows if r["stats__used"] is None]
+    if missing:
+        rebuild_subnet_stats(missing)
+        rows = list(qs.values(*fields))
+    return [_subnet_row(r) for r in rows]
+
+
+def _allocation_row(row: dict) -> dict:
+    row = dict(row)
+    row["subnet"] = row.pop("subnet_id")
+    row["owner"] = row.pop("owner__username")
+    return row
+
+
+def _allocation_page(request, qs) -> JsonResponse:
+    rows, next_cursor = keyset_page(qs.values(*ALLOCATION_FIELDS), request.GET.get("after"), _limit(request), descending=True)
+    return JsonResponse({
+        "results": [_allocation_row(r) for r in rows],
+        "next": next_cursor,
+    })
+
+
+@require_GET
+@api_login_required
+@condition(etag_func=_stats_etag)
+def subnet_list(request):
+    qs = Subnet.objects.filter(is_active=True).order_by("name")
+    return JsonResponse({"results": _subnet_rows(qs)})
+
+
+@require_GET
+@api_login_required
+@condition(etag_func=_stats_etag)
+def subnet_detail(request, subnet_id: int):
+    rows = _subnet_rows(Subnet.objects.filter(id=subnet_id, is_active=True))
+    if not rows:
+        return JsonResponse({"error": "Not found."}, status=404)
+    return JsonResponse(rows[0])
+
+
+@require_GET
+@api_login_required
+@condition(etag_func=_stats_etag)
+def subnet_allocations(request, subnet_id: int):
+    """
+    Same filters as the subnet page: q, mine=1, used=1, stale=1; plus status=USED|RELEASED.
+    Keyset paged: pass the returned `next` back as `after`.
+    """
+    subnet = get_object_or_404(Subnet, id=subnet_id, is_active=True)
+    qs = filter_allocations(
+        IPAddressAllocation.objects.filter(subnet=subnet),
+        q=(request.GET.get("q") or "").strip(),
+        owner=request.user if request.GET.get("mine") == "1" else None,
+        used_only=request.GET.get("used") == "1",
+        stale_cutoff=stale_cutoff() if request.GET.get("stale") == "1" else None,
+    )
+    if request.GET.get("status"):
+        qs = qs.filter(status=request.GET["status"].upper())
+    return _allocation_page(request, qs)
+
+
+@require_GET
+@api_login_required
+@condition(etag_func=_stats_etag)
+def allocation_list(request):
+    """
+    Allocations across subnets: subnet=<id> (repeatable), owner=<username>, status, q.
+    """
+    qs = IPAddressAllocation.objects.filter(subnet__is_active=True)
+    subnet_ids = [int(s) for s in request.GET.getlist("subnet") if s.isdigit()]
+    if subnet_ids:
+        qs = qs.filter(subnet_id__in=subnet_ids)
+    if request.GET.get("owner"):
+        qs = qs.filter(owner__username=request.GET["owner"])
+    if request.GET.get("status"):
+        qs = qs.filter(status=request.GET["status"].upper())
+    qs = filter_allocations(qs, q=(request.GET.get("q") or "").strip())
+    return _allocation_page(request, qs)
+
+
+@require_POST
+@api_login_required
+def claim(request, subnet_id: int):
+    """
+    {"ip": optional, "hostname": "...", "description": "...", "mac": optional} -> 201 with the allocation, or 409.
+    `mac` picks the address on IPv6 subnets with the EUI-64 strategy.
+    """
+    subnet = get_object_or_404(Subnet, id=subnet_id, is_active=True)
+    if subnet.is_supernet:
+        return JsonResponse({"error": f"{subnet.name} is a supernet; claim from one of its subnets."}, status=409)
+    payload = _json_body(request)
+    if payload is None:
+        return JsonResponse({"error": "Body must be a JSON object."}, status=400)
+
+    requested_ip = str(payload.get("ip") or "").strip()
+    hostname = str(payload.get("hostname") or "").strip()
+    description = str(payload.get("description") or "").strip()
+    mac = str(payload.get("mac") or "").strip()
+
+    if requested_ip:
+        alloc = claim_specific_ip(
+            subnet_id=subnet.id, ip=requested_ip, user=request.user,
+            hostname=hostname, description=description,
+        )
+    else:
+        alloc = claim_first_free_ip(
+            subnet_id=subnet.id, user=request.user,
+            hostname=hostname, description=description, mac=mac,
+        )
+
+    if not alloc:
+        return JsonResponse({"error": "No claimable IP."}, status=409)
+
+    row = IPAddressAllocation.objects.filter(id=alloc.id).values(*ALLOCATION_FIELDS).get()
+    return JsonResponse(_allocation_row(row), status=201)
+
+
+@require_POST
+@api_login_required
+def release(request, allocation_id: int):
+    allocation = get_object_or_404(IPAddressAllocation, id=allocation_id)
+    if not (request.user.is_staff or request.user.id == allocation.owner_id):
+        return JsonResponse({"error": "Forbidden."}, status=403)
+
+    release_allocation(allocation, released_by=request.user)
+    return JsonResponse({"id": allocation.id, "ip": allocation.ip, "status": allocation.status})
+
+
+@require_GET
+@api_login_required
+def lookup(request):
+    """
+    ?ip=<address> -> the most specific active subnet containing it (prefix-trie lookup).
+    """
+    entry = subnet_for_ip(request.GET.get("ip") or "")
+    if entry is None:
+        return JsonResponse({"error": "No subnet contains this address."}, status=404)
+    rows = _subnet_rows(Subnet.objects.filter(id=entry.id))
+    if not rows:
+        return JsonResponse({"error": "No subnet contains this address."}, status=404)
+    return JsonResponse(rows[0])
+
+
+@require_POST
+@api_login_required
+def carve(request, subnet_id: int):
+    """
+    Staff: {"prefixlen": 26, "name": "...", "gateway": optional} -> 201 with the new child subnet,
+    cut from the lowest free block of this supernet; 409 when it is full.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Forbidden."}, status=403)
+    supernet = get_object_or_404(Subnet, id=subnet_id, is_active=True)
+    payload = _json_body(request)
+    if payload is None:
+        return JsonResponse({"error": "Body must be a JSON object."}, status=400)
+
+    prefixlen = payload.get("prefixlen")
+    name = str(payload.get("name") or "").strip()
+    if not isinstance(prefixlen, int) or not name:
+        return JsonResponse({"error": "prefixlen (int) and name are required."}, status=400)
+
+    try:
+        subnet = carve_subnet(supernet, prefixlen, name, gateway=payload.get("gateway") or None)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except ValidationError as e:
+        return JsonResponse({"error": e.message_dict}, status=400)
+    if subnet is None:
+        return JsonResponse({"error": f"No free /{prefixlen} left in {supernet.cidr}."}, status=409)
+    return JsonResponse(_subnet_rows(Subnet.objects.filter(id=subnet.id))[0], status=201)
@@ -0,0 +1,15 @@
+from django.urls import path
+from . import api, views
+
+urlpatterns = [
+    path("subnets/", api.subnet_list, name="api_subnet_list"),
+    path("subnets/<int:subnet_id>/", api.subnet_detail, name="api_subnet_detail"),
+    path("subnets/<int:subnet_id>/allocations/", api.subnet_allocations, name="api_subnet_allocations"),
+    path("subnets/<int:subnet_id>/claim/", api.claim, name="api_claim"),
+    path("subnets/<int:subnet_id>/carve/", api.carve, name="api_carve"),
+    path("subnets/<int:subnet_id>/claim-many/", api.api_login_required(views.claim_many_ips), name="api_claim_many"),
+    path("lookup/", api.lookup, name="api_lookup"),
+    path("allocations/", api.allocation_list, name="api_allocation_list"),
+    path("allocations/<int:allocation_id>/release/", api.release, name="api_release"),
+    path("allocations/release-many/", api.api_login_required(views.release_many_ips), name="api_release_many"),
+]
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class IpmanagerConfig(AppConfig):
     name = 'ipmanager'
+
+    def ready(self):
+        from . import checks  # noqa: F401
@@ -0,0 +1,155 @@
+"""
+Helpers shared by the bench_ipam and loadtest_claims management commands:
+a deterministic fake LAN to stand in for netprobe, scratch-subnet seeding
+and latency summaries. Only meant for scratch databases.
+"""
+from __future__ import annotations
+
+import ipaddress
+import math
+import random
+import threading
+import time
+import zlib
+from typing import Optional
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from .models import IPAddressAllocation, Subnet, UserProfile
+from .services import rebuild_subnet_stats
+
+BENCH_PREFIX = "bench-"
+SEED_BATCH_SIZE = 2000
+
+
+class FakeNetwork:
+    """
+    Stand-in for netprobe.probe_many(): an address "answers" when a hash of
+    (seed, ip) falls under `alive` (0..1), and every call sleeps `latency`
+    seconds, like one concurrent probe window would.
+    """
+
+    def __init__(self, alive: float = 0.0, latency: float = 0.0, seed: int = 1):
+        self.alive = alive
+        self.latency = latency
+        self.seed = seed
+        self.calls = 0
+        self.addresses = 0
+        self._lock = threading.Lock()
+
+    def is_alive(self, ip: str) -> bool:
+        return zlib.crc32(f"{self.seed}:{ip}".encode()) % 10000 < self.alive * 10000
+
+    def probe_many(self, ips, iface: str = "", timeout: float = 1.0, deadline: Optional[float] = None) -> dict[str, bool]:
+        ips = list(dict.fromkeys(ips))
+        with self._lock:
+            self.calls += 1
+            self.addresses += len(ips)
+        if self.latency:
+            time.sleep(self.latency)
+        return {ip: self.is_alive(ip) for ip in ips}
+
+
+def is_scratch_database() -> bool:
+    """
+    True for the test runner's database (test_*) or an in-memory SQLite one.
+    """
+    name = str(connection.settings_dict.get("NAME") or "")
+    test_name = (connection.settings_dict.get("TEST") or {}).get("NAME")
+    return name.startswith("test_") or name == test_name or name == ":memory:" or "mode=memory" in name
+
+
+def scratch_database_refusal(confirmed: bool) -> Optional[str]:
+    """
+    Why bench_ipam / loadtest_claims must not run here, or None when they may.
+    """
+    if confirmed or is_scratch_database():
+        return None
+    name = connection.settings_dict.get("NAME")
+    return (
+        f"refusing to run against database {name!r}: this deletes every '{BENCH_PREFIX}*' subnet. "
+        "Point DATABASES at a scratch database or pass --yes-i-mean-it."
+    )
+
+
+def bench_user(username: str = "bench"):
+    """
+    Owner for the seeded rows: no usable password and not staff, so it can't log in.
+    Never borrows an existing real account.
+    """
+    User = get_user_model()
+    user, created = User.objects.get_or_create(username=username)
+    if not created and user.password and user.has_usable_password():
+        raise ValueError(f"user {username!r} is a real account; pick another bench user name")
+    # also demotes a passwordless staff "bench" user left behind by older versions
+    user.set_unusable_password()
+    user.is_staff = user.is_superuser = False
+    user.save(update_fields=["password", "is_staff", "is_superuser"])
+    UserProfile.objects.filter(user=user).update(must_change_password=False)
+    return user
+
+
+def drop_bench_user(user) -> None:
+    # rows in kept bench subnets still reference it (PROTECT): leave it then
+    if not IPAddressAllocation.objects.filter(owner=user).exists():
+        user.delete()
+
+
+def drop_bench_subnets() -> int:
+    subnets = Subnet.objects.filter(name__startswith=BENCH_PREFIX)
+    IPAddressAllocation.objects.filter(subnet__in=subnets).delete()
+    return subnets.delete()[0]
+
+
+def seed_subnet(name: str, cidr: str, fill: float, owner, seed: int = 1) -> Subnet:
+    """
+    Subnet `BENCH_PREFIX + name` with `fill` (0..1) of its hosts USED, at
+    deterministic random offsets; rows written with bulk_create in batches.
+    """
+    net = ipaddress.ip_network(cidr)
+    subnet = Subnet.objects.create(
+        name=BENCH_PREFIX + name,
+        cidr=str(net),
+        gateway=str(net.network_address + 1),
+    )
+    layout = subnet.layout
+    hosts = [n for lo, hi in layout.excluded.gaps(layout.first_host, layout.last_host) for n in range(lo, hi + 1)]
+    picked = random.Random(seed).sample(hosts, int(len(hosts) * fill))
+
+    for start in range(0, len(picked), SEED_BATCH_SIZE):
+        IPAddressAllocation.objects.bulk_create(
+            IPAddressAllocation(
+                subnet=subnet,
+                ip=str(ipaddress.ip_address(n)),
+                ip_int=n,
+                owner=owner,
+                hostname=f"bench-{n - layout.base}",
+            )
+            for n in picked[start:start + SEED_BATCH_SIZE]
+        )
+    rebuild_subnet_stats([subnet.id])
+    return subnet
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Nearest-rank percentile, q in 0..100.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(q / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def summarize_ms(seconds: list[float]) -> dict:
+    ms = [s * 1000 for s in seconds]
+    return {
+        "n": len(ms),
+        "mean_ms": round(sum(ms) / len(ms), 3) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 3),
+        "p95_ms": round(percentile(ms, 95), 3),
+        "p99_ms": round(percentile(ms, 99), 3),
+        "max_ms": round(max(ms), 3) if ms else 0.0,
+    }
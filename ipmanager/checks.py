@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+_LOCAL_BACKENDS = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """
+    Probe results and the subnet-trie stamp only reach the other workers through a
+    shared cache; a per-process one is fine for runserver, not for production.
+    """
+    if settings.DEBUG:
+        return []
+    warnings = []
+    for alias in sorted({"default", getattr(settings, "IPAM_PROBE_CACHE", "default")}):
+        backend = settings.CACHES.get(alias, {}).get("BACKEND", "")
+        if backend in _LOCAL_BACKENDS:
+            warnings.append(Warning(
+                f'Cache "{alias}" ({backend}) is local to each process: workers will not share '
+                "probe results or notice each other's subnet changes.",
+                hint="Use a file, db or Redis cache for it (see CACHES in config/settings.py).",
+                id="ipmanager.W001",
+            ))
+    return warnings
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from typing import Optional
+
+from django.db.models import Q
+
+from .models import IPAddressAllocation
+
+
+def ip_prefix_ranges(text: str) -> Optional[list[tuple[int, int]]]:
+    """
+    Integer ranges covering every IPv4 address whose dotted form starts with `text`.
+    "10.1.2." -> 10.1.2.0-10.1.2.255; "10.1.2" additionally covers 10.1.20-29.x and 10.1.200-255.x.
+    None if `text` cannot be the start of an IPv4 address.
+    """
+    parts = text.strip().split(".")
+    if not 1 <= len(parts) <= 4:
+        return None
+    complete, partial = parts[:-1], parts[-1]
+
+    base = 0
+    for part in complete:
+        if not part.isdigit() or int(part) > 255 or str(int(part)) != part:
+            return None
+        base = base * 256 + int(part)
+
+    # values of the partial octet whose decimal form starts with `partial`
+    if partial == "":
+        values = [(0, 255)]
+    else:
+        if not partial.isdigit() or str(int(partial)) != partial:
+            return None
+        p = int(partial)
+        values = [(p, p)] if p <= 255 else []
+        if p:
+            for width in (10, 100):
+                lo = p * width
+                if lo > 255:
+                    break
+                values.append((lo, min(lo + width - 1, 255)))
+    if not values:
+        return None
+
+    shift = 8 * (3 - len(complete))
+    return [
+        ((base * 256 + lo) << shift, ((base * 256 + hi) << shift) | ((1 << shift) - 1))
+        for lo, hi in values
+    ]
+
+
+def allocation_search(q: str) -> Q:
+    """
+    Search condition for the allocation `q` box.
+    Dotted input is treated as an address prefix and becomes ip_int range scans
+    on the (subnet, ip_int) index; anything else is a substring search.
+    """
+    ranges = ip_prefix_ranges(q) if "." in q else None
+    if ranges:
+        cond = Q()
+        for lo, hi in ranges:
+            cond |= Q(ip_int__range=(lo, hi))
+        return cond
+
+    return (
+        Q(ip__icontains=q) |
+        Q(owner__username__icontains=q) |
+        Q(hostname__icontains=q) |
+        Q(description__icontains=q)
+    )
+
+
+def filter_allocations(qs, *, q: str = "", owner=None, used_only: bool = False, stale_cutoff=None):
+    """
+    The subnet_detail filters (q / mine / used / stale), shared with the API and exports.
+    `stale_cutoff` set means "stale only": USED and claimed at or before it.
+    Claims still waiting on their LAN probe (PENDING) are never listed.
+    """
+    qs = qs.exclude(status=IPAddressAllocation.Status.PENDING)
+
+    if q:
+        qs = qs.filter(allocation_search(q))
+
+    if owner is not None:
+        qs = qs.filter(owner=owner)
+
+    if used_only:
+        qs = qs.filter(status=IPAddressAllocation.Status.USED)
+
+    if stale_cutoff is not None:
+        qs = qs.filter(
+            status=IPAddressAllocation.Status.USED,
+            claimed_at__lte=stale_cutoff
+        )
+    return qs
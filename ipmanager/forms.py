@@ -4,7 +4,18 @@ class ClaimForm(forms.Form):
     requested_ip = forms.CharField(
         required=False,
         label="IP (optional)",
-        widget=forms.TextInput(attrs={"placeholder": "e.g. 192.168.1.50"})
+        widget=forms.TextInput(attrs={"placeholder": "e.g. 192.168.1.50 or 2001:db8::50"})
     )
     hostname = forms.CharField(required=False)
+    mac = forms.CharField(
+        required=False,
+        label="MAC (EUI-64 subnets)",
+        widget=forms.TextInput(attrs={"placeholder": "e.g. 52:54:00:12:34:56"})
+    )
     description = forms.CharField(required=False, widget=forms.Textarea(attrs={"rows": 3}))
+
+
+class ImportForm(forms.Form):
+    kind = forms.ChoiceField(choices=[("allocations", "Allocations"), ("subnets", "Subnets")])
+    format = forms.ChoiceField(choices=[("csv", "CSV"), ("json", "JSON / NDJSON")])
+    file = forms.FileField()
@@ -0,0 +1,332 @@
+"""
+Bulk import of subnets and allocations from CSV or JSON.
+
+Records are streamed (CSV and NDJSON line by line; a JSON array is parsed
+whole), validated one by one, and written in batches with
+bulk_create(update_conflicts=True), one short transaction per batch, so
+existing rows are upserted and the table is never locked for the whole file.
+"""
+from __future__ import annotations
+
+import csv
+import io
+import ipaddress
+import json
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, Optional
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import IPAddressAllocation, Subnet, ip6_key, ip_to_int, network_bounds
+from .services import rebuild_subnet_stats
+from .supernets import SubnetEntry, db_trie, invalidate_subnet_tries, nested_ids, sync_parents
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+@dataclass
+class ImportReport:
+    written: int = 0
+    failed: int = 0
+    errors: list[tuple[int, str]] = field(default_factory=list)
+
+    def error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+@dataclass(frozen=True)
+class RecordError:
+    """
+    Stands in for an NDJSON line that is not valid JSON, so the importers can
+    report it against its line and carry on with the rest of the file.
+    """
+    message: str
+
+
+def _record_error(record) -> Optional[str]:
+    if isinstance(record, RecordError):
+        return record.message
+    if not isinstance(record, dict):
+        return f"expected an object, got {type(record).__name__}"
+    return None
+
+
+def iter_records(stream: Iterable[str], fmt: str) -> Iterator[tuple[int, dict | RecordError]]:
+    """
+    (line number, record) pairs from a text stream. fmt: "csv", "ndjson" or "json" (array or NDJSON).
+    A JSON array that does not parse raises ValueError; a bad NDJSON line yields a RecordError.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, {k.strip(): (v or "").strip() for k, v in record.items() if k}
+        return
+
+    if fmt == "json":
+        stream = iter(stream)
+        first = next(stream, "")
+        if first.lstrip().startswith("["):
+            # a JSON array has to be parsed as one document
+            for n, record in enumerate(json.loads(first + "".join(stream)), start=1):
+                yield n, record
+            return
+        stream = _chain_first(first, stream)
+
+    for n, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield n, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield n, RecordError(f"invalid JSON: {e.msg}")
+
+
+def _chain_first(first: str, rest: Iterator[str]) -> Iterator[str]:
+    yield first
+    yield from rest
+
+
+def open_text(fileobj) -> io.TextIOBase:
+    # uploaded files and `open(..., "rb")` give bytes
+    if isinstance(fileobj, io.TextIOBase):
+        return fileobj
+    return io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+
+
+def _str(record: dict, key: str) -> str:
+    value = record.get(key)
+    return "" if value is None else str(value).strip()
+
+
+def _network(cidr: Optional[str]):
+    try:
+        return ipaddress.ip_network(cidr, strict=False) if cidr else None
+    except ValueError:
+        return None
+
+
+def _bool(value: str, default: bool = True) -> bool:
+    if value == "":
+        return default
+    return value.lower() in ("1", "true", "yes", "y")
+
+
+def _datetime(value: str):
+    if not value:
+        return None
+    dt = parse_datetime(value)
+    if dt is None:
+        raise ValueError(f"bad datetime {value!r}")
+    if timezone.is_naive(dt):
+        dt = timezone.make_aware(dt)
+    return dt
+
+
+def import_subnets(records: Iterable[tuple[int, dict]], batch_size: int = DEFAULT_BATCH_SIZE) -> ImportReport:
+    """
+    Columns: name, cidr, gateway, excluded_ips, reserved_pools, is_active, is_supernet,
+    allocation_strategy. Upserts on name.
+    Overlaps are checked against the subnets in the DB and every row accepted
+    earlier in the file, through one trie per family that grows as rows pass.
+    """
+    report = ImportReport()
+    batch: list[Subnet] = []
+    names: set[str] = set()
+    tries = {4: db_trie(4), 6: db_trie(6)}
+    existing = {name: (pk, cidr) for pk, name, cidr in Subnet.objects.values_list("id", "name", "cidr")}
+
+    def flush():
+        if not batch:
+            return
+        # bulk_create skips save(), which derives the network bounds
+        for s in batch:
+            s.net_start, s.net_end = network_bounds(s.cidr)
+        with transaction.atomic():
+            Subnet.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=["name"],
+                update_fields=[
+                    "cidr", "gateway", "excluded_ips", "reserved_pools", "is_active", "is_supernet", "allocation_strategy",
+                    "net_start", "net_end",
+                ],
+            )
+            # bulk_create skips post_save: recount stats and re-derive the hierarchy here
+            ids = list(Subnet.objects.filter(name__in=[s.name for s in batch]).values_list("id", flat=True))
+            rebuild_subnet_stats(ids)
+        invalidate_subnet_tries()
+        sync_parents(ids + [n for s in batch for n in nested_ids(s)])
+        report.written += len(batch)
+        batch.clear()
+
+    for line, record in records:
+        error = _record_error(record)
+        if error:
+            report.error(line, error)
+            continue
+        subnet = Subnet(
+            name=_str(record, "name"),
+            cidr=_str(record, "cidr"),
+            gateway=_str(record, "gateway") or None,
+            excluded_ips=_str(record, "excluded_ips"),
+            reserved_pools=_str(record, "reserved_pools"),
+            is_active=_bool(_str(record, "is_active")),
+            is_supernet=_bool(_str(record, "is_supernet"), default=False),
+            allocation_strategy=_str(record, "allocation_strategy").lower() or Subnet.Strategy.SEQUENTIAL,
+        )
+        if subnet.name in names:
+            report.error(line, f"duplicate subnet name {subnet.name!r} in file")
+            continue
+        # an upsert may keep (or move) its own network: compare against its existing row
+        pk, old_cidr = existing.get(subnet.name, (None, None))
+        subnet.pk = pk
+        try:
+            # field validation + Subnet.clean rules; name uniqueness is the upsert key
+            subnet.clean_fields()
+            subnet.clean(tries=tries)
+        except ValidationError as e:
+            report.error(line, "; ".join(f"{k}: {', '.join(v)}" for k, v in e.message_dict.items()))
+            continue
+        finally:
+            subnet.pk = None
+        # parent links are re-derived from the DB by sync_parents() in flush()
+        subnet.parent_id = None
+
+        # later rows are checked against this one
+        old = _network(old_cidr)
+        if old is not None and getattr(tries[old.version].get(old), "id", None) == pk:
+            tries[old.version].remove(old)
+        net = _network(subnet.cidr)
+        if subnet.is_active:
+            tries[net.version].insert(net, SubnetEntry(pk or -line, subnet.name, subnet.cidr, subnet.is_supernet))
+
+        names.add(subnet.name)
+        batch.append(subnet)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    return report
+
+
+def import_allocations(
+    records: Iterable[tuple[int, dict]],
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    default_owner=None,
+) -> ImportReport:
+    """
+    Columns: subnet (name or CIDR), ip, status, owner (username), hostname,
+    description, claimed_at, released_at. Upserts on (subnet, ip).
+    """
+    User = get_user_model()
+    report = ImportReport()
+
+    subnets: dict[str, Subnet] = {}
+    for s in Subnet.objects.all():
+        subnets.setdefault(s.name, s)
+        subnets.setdefault(s.cidr, s)
+    owners: dict[str, Optional[int]] = {}
+    seen: set[tuple[int, int]] = set()
+    touched: set[int] = set()
+    batch: list[tuple[int, IPAddressAllocation, str]] = []
+
+    def resolve_owners():
+        wanted = {name for _, _, name in batch if name and name not in owners}
+        if wanted:
+            found = dict(User.objects.filter(username__in=wanted).values_list("username", "id"))
+            for name in wanted:
+                owners[name] = found.get(name)
+
+    def flush():
+        if not batch:
+            return
+        resolve_owners()
+        rows = []
+        for line, row, owner_name in batch:
+            owner_id = owners.get(owner_name) if owner_name else getattr(default_owner, "pk", None)
+            if owner_id is None:
+                report.error(line, f"unknown owner {owner_name!r}" if owner_name else "owner is required")
+                continue
+            row.owner_id = owner_id
+            rows.append(row)
+        if rows:
+            with transaction.atomic():
+                IPAddressAllocation.objects.bulk_create(
+                    rows,
+                    update_conflicts=True,
+                    unique_fields=["subnet", "ip"],
+                    update_fields=["ip_int", "ip6_key", "status", "owner", "hostname", "description", "claimed_at", "released_at", "updated_at"],
+                )
+            report.written += len(rows)
+            touched.update(row.subnet_id for row in rows)
+        batch.clear()
+
+    # PENDING only exists while a claim is being probed
+    statuses = {IPAddressAllocation.Status.USED, IPAddressAllocation.Status.RELEASED}
+    for line, record in records:
+        error = _record_error(record)
+        if error:
+            report.error(line, error)
+            continue
+        subnet = subnets.get(_str(record, "subnet"))
+        if subnet is None:
+            report.error(line, f"unknown subnet {_str(record, 'subnet')!r}")
+            continue
+        if subnet.is_supernet:
+            report.error(line, f"{subnet.name} is a supernet; allocations belong to its subnets")
+            continue
+
+        try:
+            addr = ipaddress.ip_address(_str(record, "ip"))
+        except ValueError:
+            report.error(line, f"invalid IP {_str(record, 'ip')!r}")
+            continue
+        if addr.version != subnet.network.version or not subnet.layout.is_host(int(addr)):
+            report.error(line, f"{addr} is not a usable address of {subnet.cidr}")
+            continue
+
+        key = (subnet.id, int(addr))
+        if key in seen:
+            # uniq_ip_per_subnet inside the file itself
+            report.error(line, f"{addr} appears more than once for {subnet.name}")
+            continue
+
+        status = (_str(record, "status") or IPAddressAllocation.Status.USED).upper()
+        if status not in statuses:
+            report.error(line, f"invalid status {status!r}")
+            continue
+
+        try:
+            claimed_at = _datetime(_str(record, "claimed_at")) or timezone.now()
+            released_at = _datetime(_str(record, "released_at"))
+        except ValueError as e:
+            report.error(line, str(e))
+            continue
+
+        seen.add(key)
+        row = IPAddressAllocation(
+            subnet=subnet,
+            ip=str(addr),
+            ip_int=ip_to_int(addr),
+            ip6_key=ip6_key(addr),
+            status=status,
+            hostname=_str(record, "hostname")[:255],
+            description=_str(record, "description"),
+            claimed_at=claimed_at,
+            released_at=released_at if status == IPAddressAllocation.Status.RELEASED else None,
+        )
+        batch.append((line, row, _str(record, "owner")))
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    if touched:
+        rebuild_subnet_stats(touched)
+    return report
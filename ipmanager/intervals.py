@@ -0,0 +1,153 @@
+"""
+Sorted sets of inclusive integer intervals, and the address-range syntax used
+by Subnet.excluded_ips and Subnet.reserved_pools ("10.0.0.5",
+"10.0.0.10-10.0.0.50", "10.0.0.64/27", "2001:db8::100-2001:db8::1ff").
+
+A 50-address range is one interval rather than 50 set members, so a /64 with
+a reserved /80 costs the same as a /24 with a reserved gateway.
+"""
+from __future__ import annotations
+
+import ipaddress
+import re
+from bisect import bisect_right
+from typing import Iterable, Iterator
+
+
+class IntervalSet:
+    """
+    Disjoint, merged [lo, hi] intervals kept as parallel sorted lists plus
+    running sizes: membership, next/previous address outside the set and
+    "how many inside lo..hi" are binary searches.
+    """
+
+    __slots__ = ("starts", "ends", "_cumulative")
+
+    def __init__(self, intervals: Iterable[tuple[int, int]] = ()):
+        merged: list[list[int]] = []
+        for lo, hi in sorted(iv for iv in intervals if iv[0] <= iv[1]):
+            if merged and lo <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], hi)
+            else:
+                merged.append([lo, hi])
+        self.starts = [lo for lo, _ in merged]
+        self.ends = [hi for _, hi in merged]
+        # _cumulative[i]: addresses in intervals 0..i
+        self._cumulative = []
+        total = 0
+        for lo, hi in merged:
+            total += hi - lo + 1
+            self._cumulative.append(total)
+
+    def _index(self, n: int) -> int:
+        i = bisect_right(self.starts, n) - 1
+        return i if i >= 0 and n <= self.ends[i] else -1
+
+    def __contains__(self, n: int) -> bool:
+        return self._index(n) >= 0
+
+    def __iter__(self) -> Iterator[tuple[int, int]]:
+        return zip(self.starts, self.ends)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __bool__(self) -> bool:
+        return bool(self.starts)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, IntervalSet) and self.starts == other.starts and self.ends == other.ends
+
+    def __repr__(self) -> str:
+        return f"IntervalSet({list(self)!r})"
+
+    @property
+    def size(self) -> int:
+        return self._cumulative[-1] if self._cumulative else 0
+
+    def _count_upto(self, n: int) -> int:
+        i = bisect_right(self.starts, n) - 1
+        if i < 0:
+            return 0
+        return self._cumulative[i] - max(self.ends[i] - n, 0)
+
+    def count_within(self, lo: int, hi: int) -> int:
+        if hi < lo:
+            return 0
+        return self._count_upto(hi) - self._count_upto(lo - 1)
+
+    def next_outside(self, n: int) -> int:
+        i = self._index(n)
+        return n if i < 0 else self.ends[i] + 1
+
+    def prev_outside(self, n: int) -> int:
+        i = self._index(n)
+        return n if i < 0 else self.starts[i] - 1
+
+    def clip(self, lo: int, hi: int) -> "IntervalSet":
+        return IntervalSet((max(a, lo), min(b, hi)) for a, b in self if b >= lo and a <= hi)
+
+    def gaps(self, lo: int, hi: int) -> Iterator[tuple[int, int]]:
+        """
+        The complement of the set inside [lo, hi], as intervals in order.
+        """
+        cur = self.next_outside(lo)
+        i = bisect_right(self.starts, cur)
+        while cur <= hi:
+            end = hi if i >= len(self.starts) else min(hi, self.starts[i] - 1)
+            yield cur, end
+            if i >= len(self.starts):
+                return
+            cur = self.ends[i] + 1
+            i += 1
+
+    @classmethod
+    def union(cls, *sets: "IntervalSet") -> "IntervalSet":
+        return cls(iv for s in sets for iv in s)
+
+
+_SPLIT = re.compile(r"[,\n]")
+
+
+def parse_ranges(text: str, network, allow_partial: bool = False) -> tuple[list[tuple[int, int]], list[str]]:
+    """
+    Comma/newline separated addresses, "first-last" ranges and CIDR blocks as
+    integer intervals. With `network`, intervals are clipped to it (a range
+    running past the subnet still excludes its inside part) and entries of the
+    other family are dropped. The second item lists the entries that do not
+    parse or are not entirely inside `network`; with `allow_partial`, only
+    those that miss it altogether.
+    """
+    intervals, bad = [], []
+    for item in _SPLIT.split(text or ""):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            if "/" in item:
+                block = ipaddress.ip_network(item, strict=False)
+                lo, hi, version = int(block.network_address), int(block.broadcast_address), block.version
+            elif "-" in item:
+                first, last = (ipaddress.ip_address(p.strip()) for p in item.split("-", 1))
+                if first.version != last.version or first > last:
+                    raise ValueError(item)
+                lo, hi, version = int(first), int(last), first.version
+            else:
+                addr = ipaddress.ip_address(item)
+                lo = hi = int(addr)
+                version = addr.version
+        except ValueError:
+            bad.append(item)
+            continue
+        if network is not None:
+            if version != network.version:
+                bad.append(item)
+                continue
+            first, last = int(network.network_address), int(network.broadcast_address)
+            if hi < first or lo > last or (not allow_partial and (lo < first or hi > last)):
+                bad.append(item)
+            lo, hi = max(lo, first), min(hi, last)
+            if lo > hi:
+                continue
+        intervals.append((lo, hi))
+    return intervals, bad
@@ -0,0 +1,31 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ipmanager.api import new_api_token
+from ipmanager.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = "Issue (or revoke) a user's API bearer token. A new token replaces the old one."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--revoke", action="store_true", help="Remove the token instead of issuing one")
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options["username"])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No user named {options['username']!r}.")
+        profile, _ = UserProfile.objects.get_or_create(user=user)
+
+        if options["revoke"]:
+            profile.api_token = ""
+            profile.save(update_fields=["api_token"])
+            self.stdout.write(self.style.SUCCESS(f"Revoked the API token of {user.username}."))
+            return
+
+        token, profile.api_token = new_api_token()
+        profile.save(update_fields=["api_token"])
+        # shown once: only its hash is kept
+        self.stdout.write(token)
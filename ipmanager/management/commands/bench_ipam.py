@@ -0,0 +1,193 @@
+import ipaddress
+import json
+import platform
+import random
+import time
+import tracemalloc
+from unittest import mock
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from ipmanager import services, views
+from ipmanager.benchmarking import (
+    FakeNetwork,
+    bench_user,
+    drop_bench_subnets,
+    drop_bench_user,
+    scratch_database_refusal,
+    seed_subnet,
+    summarize_ms,
+)
+from ipmanager.models import IPAddressAllocation, Subnet
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed scratch subnets (/24../16) at given fill levels, run the claim/find/list hot paths "
+        "against a fake LAN and print latency, query counts and peak memory as JSON. "
+        "Creates and deletes 'bench-*' subnets: refuses to run outside a scratch database "
+        "unless given --yes-i-mean-it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--prefixes", type=int, nargs="+", default=[24, 20, 16])
+        parser.add_argument("--fill", type=float, nargs="+", default=[0.5, 0.95], help="Fraction of hosts USED")
+        parser.add_argument("--iterations", type=int, default=20)
+        parser.add_argument("--latency-ms", type=float, default=0.0, help="Fake probe latency per probe call")
+        parser.add_argument("--alive", type=float, default=0.02, help="Fraction of free addresses that answer probes")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--probe-cache", action="store_true", help="Keep the probe result cache on")
+        parser.add_argument("--output", help="Write JSON here instead of stdout")
+        parser.add_argument("--keep", action="store_true", help="Leave the seeded subnets in place")
+        parser.add_argument(
+            "--yes-i-mean-it", action="store_true",
+            help="Run even though the configured database does not look like a scratch one",
+        )
+
+    def handle(self, *args, **options):
+        if any(not 16 <= p <= 30 for p in options["prefixes"]):
+            raise CommandError("prefixes must be between 16 and 30")
+        if len(options["prefixes"]) * len(options["fill"]) > 50:
+            raise CommandError("at most 50 prefix/fill combinations")
+        if any(not 0 <= f < 1 for f in options["fill"]):
+            raise CommandError("fill must be in [0, 1)")
+        refusal = scratch_database_refusal(options["yes_i_mean_it"])
+        if refusal:
+            raise CommandError(refusal)
+
+        network = FakeNetwork(alive=options["alive"], latency=options["latency_ms"] / 1000, seed=options["seed"])
+        ttl = {} if options["probe_cache"] else {"IPAM_PROBE_TTL_USED": 0, "IPAM_PROBE_TTL_FREE": 0}
+        try:
+            user = bench_user()
+        except ValueError as e:
+            raise CommandError(str(e))
+        drop_bench_subnets()
+
+        results = []
+        try:
+            with override_settings(**ttl), mock.patch.object(services, "probe_many", network.probe_many):
+                scenarios = [(p, f) for p in options["prefixes"] for f in options["fill"]]
+                for k, (prefix, fill) in enumerate(scenarios):
+                    # every scenario in its own 10.x.0.0/16 block
+                    cidr = f"10.{200 + k}.0.0/{prefix}"
+                    started = time.perf_counter()
+                    subnet = seed_subnet(f"{prefix}-{fill}", cidr, fill, user, seed=options["seed"])
+                    self.stderr.write(f"seeded {cidr} at {fill:.0%} in {time.perf_counter() - started:.1f}s")
+                    for op, row in self._run(subnet, user, options["iterations"], options["seed"]):
+                        results.append({"prefix": prefix, "fill": fill, "op": op, **row})
+        finally:
+            if not options["keep"]:
+                drop_bench_subnets()
+                drop_bench_user(user)
+
+        report = {
+            "meta": {
+                "vendor": connection.vendor,
+                "django": django.get_version(),
+                "python": platform.python_version(),
+                "iterations": options["iterations"],
+                "latency_ms": options["latency_ms"],
+                "alive": options["alive"],
+                "seed": options["seed"],
+                "probe_cache": options["probe_cache"],
+                "fake_probe_calls": network.calls,
+                "fake_probe_addresses": network.addresses,
+            },
+            "results": results,
+        }
+        body = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                fh.write(body + "\n")
+        else:
+            self.stdout.write(body)
+
+    def _run(self, subnet, user, iterations, seed):
+        rf = RequestFactory()
+        rng = random.Random(seed)
+        net = ipaddress.ip_network(subnet.cidr)
+        search = ".".join(str(net.network_address).split(".")[:3]) + "."
+
+        def request(path, **params):
+            req = rf.get(path, params)
+            req.user = user
+            return req
+
+        def claim_first():
+            alloc = services.claim_first_free_ip(subnet_id=subnet.id, user=user, hostname="bench")
+            return lambda: alloc and services.release_allocation(alloc, released_by=user)
+
+        # random free targets for claim_specific_ip, picked outside the timed section
+        taken = set(
+            IPAddressAllocation.objects.filter(subnet=subnet, status__in=IPAddressAllocation.TAKEN).values_list("ip", flat=True)
+        )
+        layout = subnet.layout
+        targets = []
+        for _ in range(100 * (iterations + 1)):
+            n = rng.randint(layout.first_host, layout.last_host)
+            candidate = str(ipaddress.ip_address(n))
+            if layout.is_host(n) and candidate not in taken:
+                targets.append(candidate)
+                if len(targets) > iterations:
+                    break
+
+        def claim_specific():
+            alloc = targets and services.claim_specific_ip(subnet_id=subnet.id, ip=targets.pop(), user=user)
+            return lambda: alloc and services.release_allocation(alloc, released_by=user)
+
+        ops = {
+            "find_free_ip": lambda: services.find_free_ip(Subnet.objects.get(id=subnet.id)),
+            "claim_first_free_ip": claim_first,
+            "claim_specific_ip": claim_specific,
+            "subnet_list": lambda: views.subnet_list(request("/")),
+            "subnet_detail": lambda: views.subnet_detail(request(f"/subnets/{subnet.id}/"), subnet_id=subnet.id),
+            "subnet_detail_search": lambda: views.subnet_detail(request(f"/subnets/{subnet.id}/", q=search), subnet_id=subnet.id),
+        }
+        for op, fn in ops.items():
+            yield op, self._measure(fn, iterations)
+        yield "release_allocation", self._measure_release(subnet, user, iterations)
+
+    def _call(self, fn):
+        # ops may return a cleanup callable that is not part of the measurement
+        result = fn()
+        return result if callable(result) else None
+
+    def _measure(self, fn, iterations):
+        # one traced run for queries and peak memory, then untraced timings
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as ctx:
+                cleanup = self._call(fn)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        if cleanup:
+            cleanup()
+
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            cleanup = self._call(fn)
+            timings.append(time.perf_counter() - started)
+            if cleanup:
+                cleanup()
+        return {**summarize_ms(timings), "queries": len(ctx.captured_queries), "peak_kib": round(peak / 1024, 1)}
+
+    def _measure_release(self, subnet, user, iterations):
+        timings = []
+        queries = 0
+        for _ in range(iterations):
+            alloc = services.claim_first_free_ip(subnet_id=subnet.id, user=user, hostname="bench")
+            if alloc is None:
+                break
+            alloc = IPAddressAllocation.objects.get(id=alloc.id)
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as ctx:
+                services.release_allocation(alloc, released_by=user)
+            timings.append(time.perf_counter() - started)
+            queries = len(ctx.captured_queries)
+        return {**summarize_ms(timings), "queries": queries, "peak_kib": None}
@@ -0,0 +1,51 @@
+import sys
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from ipmanager.importer import DEFAULT_BATCH_SIZE, import_allocations, import_subnets, iter_records, open_text
+
+
+class Command(BaseCommand):
+    help = "Import subnets or allocations from a CSV, JSON array or NDJSON file (upserts existing rows)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=["subnets", "allocations"])
+        parser.add_argument("path", help="File to import, '-' for stdin")
+        parser.add_argument("--format", choices=["csv", "json", "ndjson"], help="Default: from the file extension")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument("--owner", help="Username for allocation rows without an owner column")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}.get(Path(path).suffix.lower(), "json")
+
+        owner = None
+        if options["owner"]:
+            owner = get_user_model().objects.filter(username=options["owner"]).first()
+            if owner is None:
+                raise CommandError(f"Unknown user {options['owner']!r}")
+
+        if path == "-":
+            report = self._run(options["kind"], open_text(sys.stdin), fmt, options["batch_size"], owner)
+        else:
+            try:
+                with open(path, "rb") as fh:
+                    report = self._run(options["kind"], open_text(fh), fmt, options["batch_size"], owner)
+            except OSError as e:
+                raise CommandError(str(e))
+
+        for line, message in report.errors:
+            self.stderr.write(f"line {line}: {message}")
+        self.stdout.write(self.style.SUCCESS(f"Imported {report.written} {options['kind']}, {report.failed} row(s) rejected."))
+
+    def _run(self, kind, stream, fmt, batch_size, owner):
+        records = iter_records(stream, fmt)
+        try:
+            if kind == "subnets":
+                return import_subnets(records, batch_size=batch_size)
+            return import_allocations(records, batch_size=batch_size, default_owner=owner)
+        except ValueError as e:
+            # malformed JSON aborts the rest of the file; earlier batches stay committed
+            raise CommandError(f"Could not parse {kind} file: {e}")
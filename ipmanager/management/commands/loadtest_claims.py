@@ -0,0 +1,247 @@
+import json
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.db.models import Count
+from django.test import override_settings
+
+from ipmanager import services
+from ipmanager.benchmarking import (
+    FakeNetwork,
+    bench_user,
+    drop_bench_subnets,
+    drop_bench_user,
+    scratch_database_refusal,
+    seed_subnet,
+    summarize_ms,
+)
+from ipmanager.models import IPAddressAllocation, SubnetStats
+from ipmanager.occupancy import first_free_hosts
+
+
+class _Recorder:
+    """
+    Thread-safe tallies: per-op latencies/outcomes, reservation retries and time spent in reservation writes.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = defaultdict(list)
+        self.outcomes = defaultdict(Counter)
+        self.errors = Counter()
+        self.reserve_wait = []
+        self.retries = 0
+        self.rollbacks = 0
+        # ip -> thread currently holding it, to catch double hand-outs as they happen
+        self.held = {}
+        self.double_claims = []
+
+    def op(self, name, seconds, outcome):
+        with self.lock:
+            self.latency[name].append(seconds)
+            self.outcomes[name][outcome] += 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer scratch subnets with concurrent claims and releases from many threads, "
+        "check that no address is handed out twice, and print throughput, latency, "
+        "retries and reservation waits as JSON. Use a scratch PostgreSQL database "
+        "(SQLite serialises writers); refuses any other database unless given --yes-i-mean-it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=16)
+        parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+        parser.add_argument("--subnets", type=int, default=1, help="Scratch subnets to spread claims over")
+        parser.add_argument("--prefix", type=int, default=24)
+        parser.add_argument("--fill", type=float, default=0.5)
+        parser.add_argument("--release-ratio", type=float, default=0.3, help="Share of operations that release")
+        parser.add_argument("--specific-ratio", type=float, default=0.2, help="Share of claims for a specific IP")
+        parser.add_argument("--latency-ms", type=float, default=5.0, help="Fake probe latency per probe call")
+        parser.add_argument("--alive", type=float, default=0.02)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--output", help="Write JSON here instead of stdout")
+        parser.add_argument("--keep", action="store_true", help="Leave the seeded subnets in place")
+        parser.add_argument(
+            "--yes-i-mean-it", action="store_true",
+            help="Run even though the configured database does not look like a scratch one",
+        )
+
+    def handle(self, *args, **options):
+        if not 16 <= options["prefix"] <= 30:
+            raise CommandError("prefix must be between 16 and 30")
+        if not 1 <= options["subnets"] <= 50:
+            raise CommandError("subnets must be between 1 and 50")
+        refusal = scratch_database_refusal(options["yes_i_mean_it"])
+        if refusal:
+            raise CommandError(refusal)
+
+        try:
+            user = bench_user("loadtest")
+        except ValueError as e:
+            raise CommandError(str(e))
+        drop_bench_subnets()
+        network = FakeNetwork(alive=options["alive"], latency=options["latency_ms"] / 1000, seed=options["seed"])
+        rec = _Recorder()
+
+        real_reserve = services._reserve_ip_row
+        real_rollback = services._rollback_reservation
+
+        def reserve(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = real_reserve(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+            with rec.lock:
+                rec.reserve_wait.append(elapsed)
+                # row taken or lost the race: the claim moves on to another candidate / attempt
+                if result is None:
+                    rec.retries += 1
+            return result
+
+        def rollback(*args, **kwargs):
+            with rec.lock:
+                rec.rollbacks += 1
+            return real_rollback(*args, **kwargs)
+
+        try:
+            subnets = [
+                seed_subnet(f"load-{i}", f"10.{200 + i}.0.0/{options['prefix']}", options["fill"], user, seed=options["seed"] + i)
+                for i in range(options["subnets"])
+            ]
+            deadline = time.monotonic() + options["duration"]
+            with override_settings(IPAM_PROBE_TTL_USED=0, IPAM_PROBE_TTL_FREE=0), \
+                    mock.patch.object(services, "probe_many", network.probe_many), \
+                    mock.patch.object(services, "_reserve_ip_row", reserve), \
+                    mock.patch.object(services, "_rollback_reservation", rollback):
+                workers = [
+                    threading.Thread(
+                        target=self._worker,
+                        args=(n, subnets, user, deadline, options, rec),
+                        name=f"loadtest-{n}",
+                    )
+                    for n in range(options["threads"])
+                ]
+                started = time.perf_counter()
+                for w in workers:
+                    w.start()
+                for w in workers:
+                    w.join()
+                elapsed = time.perf_counter() - started
+
+            report = self._report(subnets, elapsed, options, rec, network)
+        finally:
+            if not options["keep"]:
+                drop_bench_subnets()
+                drop_bench_user(user)
+
+        body = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                fh.write(body + "\n")
+        else:
+            self.stdout.write(body)
+        if not report["ok"]:
+            raise CommandError("consistency check failed: see double_claims / duplicate_used_rows / stats_drift")
+
+    def _worker(self, n, subnets, user, deadline, options, rec):
+        rng = random.Random(options["seed"] * 1000 + n)
+        mine = []
+        try:
+            while time.monotonic() < deadline:
+                subnet = rng.choice(subnets)
+                if mine and rng.random() < options["release_ratio"]:
+                    alloc = mine.pop(rng.randrange(len(mine)))
+                    with rec.lock:
+                        rec.held.pop((alloc.subnet_id, alloc.ip), None)
+                    self._timed(rec, "release_allocation", lambda: services.release_allocation(alloc, released_by=user))
+                    continue
+
+                if rng.random() < options["specific_ratio"]:
+                    # contend for the same few addresses on purpose
+                    targets = first_free_hosts(subnet, limit=4)
+                    if not targets:
+                        continue
+                    ip = rng.choice(targets)
+                    op, fn = "claim_specific_ip", lambda: services.claim_specific_ip(subnet_id=subnet.id, ip=ip, user=user)
+                else:
+                    op, fn = "claim_first_free_ip", lambda: services.claim_first_free_ip(subnet_id=subnet.id, user=user)
+
+                alloc = self._timed(rec, op, fn)
+                if alloc is not None:
+                    key = (alloc.subnet_id, alloc.ip)
+                    with rec.lock:
+                        if key in rec.held:
+                            rec.double_claims.append({"ip": alloc.ip, "threads": [rec.held[key], n]})
+                        rec.held[key] = n
+                    mine.append(alloc)
+        finally:
+            # each thread has its own DB connection
+            connection.close()
+
+    def _timed(self, rec, name, fn):
+        started = time.perf_counter()
+        outcome, result = "ok", None
+        try:
+            result = fn()
+            if result is None:
+                outcome = "none"
+        except DatabaseError as e:
+            # e.g. SQLite "database is locked" under concurrent writers
+            outcome = "error"
+            with rec.lock:
+                rec.errors[f"{type(e).__name__}: {e}"] += 1
+        rec.op(name, time.perf_counter() - started, outcome)
+        return result
+
+    def _report(self, subnets, elapsed, options, rec, network):
+        subnet_ids = [s.id for s in subnets]
+        duplicates = list(
+            IPAddressAllocation.objects.filter(subnet_id__in=subnet_ids, status=IPAddressAllocation.Status.USED)
+            .values("subnet_id", "ip")
+            .annotate(n=Count("id"))
+            .filter(n__gt=1)
+        )
+
+        # counters maintained on the hot path vs. a recount
+        kept = {s.subnet_id: (s.used, s.released, s.free) for s in SubnetStats.objects.filter(subnet_id__in=subnet_ids)}
+        services.rebuild_subnet_stats(subnet_ids)
+        recount = {s.subnet_id: (s.used, s.released, s.free) for s in SubnetStats.objects.filter(subnet_id__in=subnet_ids)}
+        stats_drift = {str(k): {"kept": kept.get(k), "recount": v} for k, v in recount.items() if kept.get(k) != v}
+
+        total_ops = sum(len(v) for v in rec.latency.values())
+        return {
+            "meta": {
+                "vendor": connection.vendor,
+                "threads": options["threads"],
+                "duration_s": round(elapsed, 3),
+                "subnets": len(subnets),
+                "prefix": options["prefix"],
+                "fill": options["fill"],
+                "latency_ms": options["latency_ms"],
+                "release_ratio": options["release_ratio"],
+                "specific_ratio": options["specific_ratio"],
+                "seed": options["seed"],
+            },
+            "throughput_ops_s": round(total_ops / elapsed, 2) if elapsed else 0.0,
+            "operations": {
+                name: {**summarize_ms(times), "outcomes": dict(rec.outcomes[name])}
+                for name, times in sorted(rec.latency.items())
+            },
+            "reservation_retries": rec.retries,
+            "reservation_rollbacks": rec.rollbacks,
+            "reservation_wait": {**summarize_ms(rec.reserve_wait), "total_s": round(sum(rec.reserve_wait), 3)},
+            "fake_probe_calls": network.calls,
+            "errors": dict(rec.errors),
+            "double_claims": rec.double_claims,
+            "duplicate_used_rows": duplicates,
+            "stats_drift": stats_drift,
+            "ok": not (rec.double_claims or duplicates or stats_drift),
+        }
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from ipmanager.services import rebuild_subnet_stats
+
+
+class Command(BaseCommand):
+    help = "Recount SubnetStats (used/released/stale/free) from IPAddressAllocation."
+
+    def add_arguments(self, parser):
+        parser.add_argument("subnet_ids", nargs="*", type=int, help="Only these subnets (default: all)")
+
+    def handle(self, *args, **options):
+        count = rebuild_subnet_stats(options["subnet_ids"] or None)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {count} subnet(s)."))
@@ -0,0 +1,42 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ipmanager.models import Subnet
+from ipmanager.services import expire_reservations, sweep_subnet
+
+
+class Command(BaseCommand):
+    help = "Ping every host of the active subnets and record who answered (DiscoveredHost). Runs forever unless --once."
+
+    def add_arguments(self, parser):
+        parser.add_argument("subnet_ids", nargs="*", type=int, help="Only these subnets (default: all active, supernets skipped)")
+        parser.add_argument("--once", action="store_true", help="One pass, then exit")
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=getattr(settings, "IPAM_SWEEP_INTERVAL", 300),
+            help="Seconds between the start of two passes",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            # claims abandoned between reserve and confirm, in subnets nobody claims from
+            expired = expire_reservations()
+            if expired:
+                self.stdout.write(f"expired {expired} abandoned reservation(s)")
+            # supernets are covered by their child subnets
+            subnets = Subnet.objects.filter(is_active=True, is_supernet=False).order_by("name")
+            if options["subnet_ids"]:
+                subnets = subnets.filter(id__in=options["subnet_ids"])
+
+            for subnet in subnets:
+                t0 = time.monotonic()
+                alive = sweep_subnet(subnet)
+                self.stdout.write(f"{subnet.name} ({subnet.cidr}): {alive} alive in {time.monotonic() - t0:.1f}s")
+
+            if options["once"]:
+                return
+            time.sleep(max(0.0, options["interval"] - (time.monotonic() - started)))
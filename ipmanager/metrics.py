@@ -0,0 +1,222 @@
+"""
+In-process counters and latency histograms for claims, searches and LAN probes,
+rendered in the Prometheus text format at /metrics/.
+
+Everything is a no-op unless IPAM_METRICS is true, so the instrumented code
+pays one settings lookup per call. Values are per process: with several
+workers, scrape each one (or sum them on the Prometheus side).
+With IPAM_METRICS_LOG, MetricsMiddleware also logs one summary line per request
+that did any instrumented work.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Optional
+
+from django.conf import settings
+
+logger = logging.getLogger("ipmanager.metrics")
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 1024)
+
+_lock = threading.Lock()
+# per-request totals for IPAM_METRICS_LOG, set by MetricsMiddleware
+_request_totals: ContextVar[Optional[dict]] = ContextVar("ipam_request_totals", default=None)
+
+
+def enabled() -> bool:
+    return bool(getattr(settings, "IPAM_METRICS", False))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.values: dict[tuple, object] = {}
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(key)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with _lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # per-bucket counts (cumulated on render), then sum and count
+                counts = self.values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for key, counts in sorted(self.values.items()):
+            running = 0
+            for bound, n in zip(self.buckets, counts):
+                running += n
+                lines.append(f"{self.name}_bucket{_labels(key + (('le', _num(bound)),))} {running}")
+            lines.append(f"{self.name}_bucket{_labels(key + (('le', '+Inf'),))} {counts[-1]}")
+            lines.append(f"{self.name}_sum{_labels(key)} {counts[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(key)} {counts[-1]}")
+        return lines
+
+
+def _num(value: float) -> str:
+    return repr(float(value))
+
+
+def _labels(key: tuple) -> str:
+    if not key:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in key)
+    return "{" + inner + "}"
+
+
+OPERATIONS = Counter("ipam_operations_total", "Claims and free-address searches by outcome (ok/none/error).")
+OPERATION_SECONDS = Histogram("ipam_operation_seconds", "Wall time of claims and free-address searches.")
+CANDIDATES = Histogram("ipam_claim_candidates", "Candidate addresses reserved or checked per claim.", COUNT_BUCKETS)
+RESERVE_SECONDS = Histogram("ipam_reserve_seconds", "Time in reservation writes, including waits on row locks.")
+PROBE_CALLS = Counter("ipam_probe_calls_total", "netprobe calls.")
+PROBE_SECONDS = Histogram("ipam_probe_seconds", "Wall time of netprobe calls.")
+PROBE_ADDRESSES = Counter("ipam_probe_addresses_total", "Addresses decided by probe_many, per source (neigh, icmp, ndp, subprocess, timeout).")
+PROBE_CACHE = Counter("ipam_probe_cache_total", "Probe result cache lookups by result (hit/miss).")
+
+REGISTRY = (
+    OPERATIONS, OPERATION_SECONDS, CANDIDATES, RESERVE_SECONDS,
+    PROBE_CALLS, PROBE_SECONDS, PROBE_ADDRESSES, PROBE_CACHE,
+)
+
+
+def _add_to_request(name: str, value: float) -> None:
+    totals = _request_totals.get()
+    if totals is not None:
+        totals[name] = totals.get(name, 0) + value
+
+
+def inc(metric: Counter, amount: float = 1, **labels) -> None:
+    if not enabled():
+        return
+    metric.inc(amount, **labels)
+    _add_to_request(metric.name, amount)
+
+
+def observe(metric: Histogram, value: float, **labels) -> None:
+    if not enabled():
+        return
+    metric.observe(value, **labels)
+    _add_to_request(metric.name, value)
+
+
+@contextmanager
+def timer(metric: Histogram, **labels):
+    if not enabled():
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(metric, time.perf_counter() - started, **labels)
+
+
+def timed_operation(op: str):
+    """
+    Count and time a service call; a None result counts as outcome "none".
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            outcome = "error"
+            try:
+                result = func(*args, **kwargs)
+                outcome = "none" if result is None or result == [] else "ok"
+                return result
+            finally:
+                observe(OPERATION_SECONDS, time.perf_counter() - started, op=op)
+                inc(OPERATIONS, op=op, outcome=outcome)
+        return wrapper
+    return decorator
+
+
+def timed_probe(call: str):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled():
+                return func(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(PROBE_SECONDS, time.perf_counter() - started, call=call)
+                inc(PROBE_CALLS, call=call)
+        return wrapper
+    return decorator
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """
+    With IPAM_METRICS_LOG, logs the instrumented totals of each request that had any.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not (enabled() and getattr(settings, "IPAM_METRICS_LOG", False)):
+            return self.get_response(request)
+
+        token = _request_totals.set({})
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            totals = _request_totals.get()
+            _request_totals.reset(token)
+            if totals:
+                summary = " ".join(f"{k}={v:.4g}" for k, v in sorted(totals.items()))
+                logger.info("%s %s %.1fms %s", request.method, request.path, (time.perf_counter() - started) * 1000, summary)
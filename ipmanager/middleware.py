@@ -21,5 +21,9 @@ class ForcePasswordChangeMiddleware(MiddlewareMixin):
         if request.path in allowed_paths:
             return None
 
+        # API clients can't follow a redirect to a form; api_login_required answers them with JSON
+        if request.path.startswith(reverse("api_subnet_list").removesuffix("subnets/")):
+            return None
+
         # IMPORTANT: even if user tries /admin/, force them to /accounts/password_change/
         return redirect("password_change")
\ No newline at end of file
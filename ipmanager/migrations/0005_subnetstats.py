@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-17 22:59
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipmanager', '0004_alter_ipaddressallocation_claimed_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SubnetStats',
+            fields=[
+                ('subnet', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='ipmanager.subnet')),
+                ('used', models.IntegerField(default=0)),
+                ('released', models.IntegerField(default=0)),
+                ('stale', models.IntegerField(default=0)),
+                ('free', models.BigIntegerField(default=0)),
+                ('last_change', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-17 23:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipmanager', '0005_subnetstats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ipaddressallocation',
+            index=models.Index(fields=['subnet', 'claimed_at', 'id'], name='ipmanager_i_subnet__aaa8a6_idx'),
+        ),
+    ]
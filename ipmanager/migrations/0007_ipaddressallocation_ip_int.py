@@ -0,0 +1,55 @@
+# Generated by Django 6.0.1 on 2026-10-17 23:20
+
+import ipaddress
+
+from django.conf import settings
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 2000
+
+
+def backfill_ip_int(apps, schema_editor):
+    """
+    Fill ip_int in id-ordered batches, one short transaction per batch,
+    so large tables are never locked as a whole.
+    """
+    IPAddressAllocation = apps.get_model("ipmanager", "IPAddressAllocation")
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                IPAddressAllocation.objects.filter(id__gt=last_id, ip_int__isnull=True)
+                .order_by("id")
+                .only("id", "ip")[:BATCH_SIZE]
+            )
+            if not batch:
+                return
+            for row in batch:
+                addr = ipaddress.ip_address(row.ip)
+                row.ip_int = int(addr) if addr.version == 4 else None
+            IPAddressAllocation.objects.bulk_update(batch, ["ip_int"])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    # each backfill batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ('ipmanager', '0006_ipaddressallocation_keyset_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ipaddressallocation',
+            name='ip_int',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_ip_int, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ipaddressallocation',
+            index=models.Index(fields=['subnet', 'ip_int'], name='ipmanager_i_subnet__67ca2f_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-17 13:20
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipmanager', '0007_ipaddressallocation_ip_int'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscoveredHost',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip', models.GenericIPAddressField(protocol='IPv4')),
+                ('ip_int', models.BigIntegerField()),
+                ('mac', models.CharField(blank=True, max_length=17)),
+                ('first_seen', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_seen', models.DateTimeField(default=django.utils.timezone.now)),
+                ('subnet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='discovered', to='ipmanager.subnet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['subnet', 'last_seen'], name='ipmanager_d_subnet__d6947d_idx')],
+                'constraints': [models.UniqueConstraint(fields=('subnet', 'ip_int'), name='uniq_discovered_ip_per_subnet')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-17 15:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipmanager', '0008_discoveredhost'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subnet',
+            name='is_supernet',
+            field=models.BooleanField(default=False, help_text='May contain other subnets'),
+        ),
+        migrations.AddField(
+            model_name='subnet',
+            name='parent',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='ipmanager.subnet'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-17 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipmanager', '0009_subnet_hierarchy'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='discoveredhost',
+            name='uniq_discovered_ip_per_subnet',
+        ),
+        migrations.AddField(
+            model_name='subnet',
+            name='allocation_strategy',
+            field=models.CharField(choices=[('sequential', 'Sequential'), ('random', 'Random'), ('eui64', 'EUI-64')], default='sequential', help_text='IPv6 only: lowest free first, random, or derived from the client MAC (EUI-64)', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='discoveredhost',
+            name='ip',
+            field=models.GenericIPAddressField(),
+        ),
+        migrations.AlterField(
+            model_name='discoveredhost',
+            name='ip_int',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='ipaddressallocation',
+            name='ip',
+            field=models.GenericIPAddressField(),
+        ),
+        migrations.AlterField(
+            model_name='subnet',
+            name='cidr',
+            field=models.CharField(max_length=43),
+        ),
+        migrations.AlterField(
+            model_name='subnet',
+            name='excluded_ips',
+            field=models.TextField(blank=True, help_text='Comma-separated addresses to exclude'),
+        ),
+        migrations.AlterField(
+            model_name='subnet',
+            name='gateway',
+            field=models.GenericIPAddressField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='discoveredhost',
+            constraint=models.UniqueConstraint(fields=('subnet', 'ip'), name='uniq_discovered_ip_per_subnet'),
+        ),
+    ]
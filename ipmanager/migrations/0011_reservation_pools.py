@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-17 15:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipmanager', '0010_ipv6_subnets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subnet',
+            name='reserved_pools',
+            field=models.TextField(blank=True, help_text='One pool per line, "name = ranges", e.g. "DHCP = 10.0.0.100-10.0.0.199"'),
+        ),
+        migrations.AlterField(
+            model_name='subnet',
+            name='excluded_ips',
+            field=models.TextField(blank=True, help_text='Comma-separated addresses, ranges (10.0.0.10-10.0.0.50) or CIDR blocks to exclude'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-17 23:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipmanager', '0011_reservation_pools'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ipaddressallocation',
+            name='status',
+            field=models.CharField(choices=[('USED', 'Used'), ('RELEASED', 'Released'), ('PENDING', 'Pending')], default='USED', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='ipaddressallocation',
+            index=models.Index(condition=models.Q(('status', 'PENDING')), fields=['claimed_at'], name='ipalloc_pending_claimed_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 6.0.1 on 2026-10-17 23:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipmanager', '0012_pending_reservations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ipaddressallocation',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='api_token',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddIndex(
+            model_name='ipaddressallocation',
+            index=models.Index(fields=['subnet', 'updated_at'], name='ipmanager_i_subnet__7b42a1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ipaddressallocation',
+            index=models.Index(fields=['updated_at'], name='ipmanager_i_updated_79a62d_idx'),
+        ),
+    ]
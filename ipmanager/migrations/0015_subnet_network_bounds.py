@@ -0,0 +1,47 @@
+# Generated by Django 6.0.1 on 2026-10-18 00:06
+
+import ipaddress
+
+from django.db import migrations, models
+
+
+def backfill_bounds(apps, schema_editor):
+    """
+    Fill net_start/net_end from the CIDR of every existing subnet (a few thousand rows at most).
+    """
+    Subnet = apps.get_model("ipmanager", "Subnet")
+    rows = []
+    for row in Subnet.objects.only("id", "cidr").iterator(chunk_size=2000):
+        try:
+            net = ipaddress.ip_network(row.cidr.strip(), strict=False)
+        except ValueError:
+            continue
+        row.net_start = f"{int(net.network_address):032x}"
+        row.net_end = f"{int(net.broadcast_address):032x}"
+        rows.append(row)
+    Subnet.objects.bulk_update(rows, ["net_start", "net_end"], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ipmanager', '0014_ipaddressallocation_ip6_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='subnet',
+            name='net_end',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.AddField(
+            model_name='subnet',
+            name='net_start',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True),
+        ),
+        migrations.RunPython(backfill_bounds, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='subnet',
+            index=models.Index(fields=['net_start', 'net_end'], name='ipmanager_s_net_sta_a7b419_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 6.0.1 on 2026-10-18 00:08
+
+import ipaddress
+
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 2000
+
+
+def backfill_ip6_key(apps, schema_editor):
+    """
+    Fill ip6_key for IPv6 sightings (the ones without an ip_int) in id-ordered
+    batches, one short transaction per batch.
+    """
+    DiscoveredHost = apps.get_model("ipmanager", "DiscoveredHost")
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            batch = list(
+                DiscoveredHost.objects.filter(id__gt=last_id, ip_int__isnull=True, ip6_key__isnull=True)
+                .order_by("id")
+                .only("id", "ip")[:BATCH_SIZE]
+            )
+            if not batch:
+                return
+            for row in batch:
+                addr = ipaddress.ip_address(row.ip)
+                row.ip6_key = f"{int(addr):032x}" if addr.version == 6 else None
+            DiscoveredHost.objects.bulk_update(batch, ["ip6_key"])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    # each backfill batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ('ipmanager', '0015_subnet_network_bounds'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discoveredhost',
+            name='ip6_key',
+            field=models.CharField(blank=True, max_length=32, null=True),
+        ),
+        migrations.RunPython(backfill_ip6_key, migrations.RunPython.noop),
+    ]
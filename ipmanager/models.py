@@ -1,55 +1,302 @@
-from django.db import models
+from dataclasses import dataclass
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
 import ipaddress
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.utils import timezone
+
+from .intervals import IntervalSet, parse_ranges
+
+
+def ip_to_int(ip) -> int | None:
+    """
+    Integer form of an IPv4 address for IPAddressAllocation.ip_int (None if not IPv4:
+    IPv6 addresses do not fit a BIGINT and are searched through `ip` instead).
+    """
+    try:
+        addr = ipaddress.ip_address(str(ip).strip())
+    except ValueError:
+        return None
+    return int(addr) if addr.version == 4 else None
+
+
+def ip6_key(ip) -> str | None:
+    """
+    Sortable form of an IPv6 address for IPAddressAllocation.ip6_key: 32 zero-padded
+    hex digits, so text order is numeric order (None if not IPv6). Accepts an int too.
+    """
+    if isinstance(ip, int):
+        return f"{ip:032x}"
+    try:
+        addr = ipaddress.ip_address(str(ip).strip())
+    except ValueError:
+        return None
+    return f"{int(addr):032x}" if addr.version == 6 else None
+
+
+def network_bounds(cidr) -> tuple[str | None, str | None]:
+    """
+    First and last address of a CIDR for Subnet.net_start/net_end, as 32 zero-padded
+    hex digits for both families (the ip6_key form); (None, None) if it does not parse.
+    """
+    try:
+        net = ipaddress.ip_network(str(cidr).strip(), strict=False)
+    except ValueError:
+        return None, None
+    return f"{int(net.network_address):032x}", f"{int(net.broadcast_address):032x}"
+
+
+# SubnetStats.free is a BIGINT, an IPv6 /64 has 2**64 - 1 hosts: stored values saturate here
+FREE_MAX = 2**63 - 1
+
+
+def stored_free(n: int) -> int:
+    return min(n, FREE_MAX)
+
+
+def exact_free(free: int, usable: int, used: int) -> int:
+    """
+    SubnetStats.free for display; recomputed from the usable count where the stored value saturated.
+    """
+    return free if usable < FREE_MAX else max(usable - used, 0)
+
+
+@dataclass(frozen=True)
+class ReservationPool:
+    """
+    A named block of addresses held back from claiming (e.g. "DHCP", "infra").
+    """
+    name: str
+    text: str            # ranges as entered
+    ranges: IntervalSet
+
+    @property
+    def size(self) -> int:
+        return self.ranges.size
+
+
+def parse_pools(text: str, network) -> tuple[list[ReservationPool], list[str]]:
+    """
+    One pool per line, "name = ranges" (same range syntax as excluded_ips).
+    Returns the pools and the lines that could not be used.
+    """
+    pools, bad, names = [], [], set()
+    for line in (text or "").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        name, sep, spec = (part.strip() for part in line.partition("="))
+        intervals, bad_ranges = parse_ranges(spec, network)
+        if not sep or not name or name in names or bad_ranges or not intervals:
+            bad.append(line)
+            continue
+        names.add(name)
+        pools.append(ReservationPool(name, spec, IntervalSet(intervals)))
+    return pools, bad
+
+
+@dataclass(frozen=True)
+class SubnetLayout:
+    """
+    Parsed form of a Subnet row: integer bounds and exclusions.
+    Built once per instance (see Subnet.layout) so per-address loops never
+    re-parse the CIDR, the excluded_ips text or the pools. The gateway,
+    exclusions and pools are compiled into one IntervalSet.
+    """
+    network: ipaddress.IPv4Network | ipaddress.IPv6Network
+    base: int          # network address
+    broadcast: int     # last address (IPv6 has no broadcast)
+    first_host: int    # same semantics as network.hosts()
+    last_host: int
+    excluded: IntervalSet          # everything not claimable inside [first_host, last_host]
+    excluded_text: frozenset[str]  # gateway + excluded_ips as entered
+    pools: tuple[ReservationPool, ...] = ()
+
+    @classmethod
+    def parse(cls, cidr: str, gateway, excluded_ips: str, reserved_pools: str = "") -> "SubnetLayout":
+        net = ipaddress.ip_network(cidr, strict=False)
+        base = int(net.network_address)
+        broadcast = int(net.broadcast_address)
+        if net.num_addresses <= 2:
+            # /31, /32, /127, /128: every address is a host
+            first_host, last_host = base, broadcast
+        elif net.version == 6:
+            # only the subnet-router anycast (network) address is reserved
+            first_host, last_host = base + 1, broadcast
+        else:
+            first_host, last_host = base + 1, broadcast - 1
+
+        text = set()
+        if gateway:
+            text.add(str(gateway))
+        if excluded_ips:
+            for item in excluded_ips.replace("\n", ",").split(","):
+                item = item.strip()
+                if item:
+                    text.add(item)
+
+        # entries that do not parse are skipped here; Subnet.clean reports them
+        intervals, _ = parse_ranges(",".join(text), net)
+        pools, _ = parse_pools(reserved_pools, net)
+        excluded = IntervalSet.union(IntervalSet(intervals), *(p.ranges for p in pools))
+
+        return cls(
+            network=net,
+            base=base,
+            broadcast=broadcast,
+            first_host=first_host,
+            last_host=last_host,
+            excluded=excluded.clip(first_host, last_host),
+            excluded_text=frozenset(text),
+            pools=tuple(pools),
+        )
+
+    @property
+    def sparse(self) -> bool:
+        # IPv6: far too large to walk address by address, see occupancy.sparse_free_hosts
+        return self.network.version == 6
+
+    def is_host(self, n: int) -> bool:
+        return self.first_host <= n <= self.last_host and n not in self.excluded
+
+    def usable_count(self) -> int:
+        return max(self.last_host - self.first_host + 1 - self.excluded.size, 0)
+
+    def first_usable(self) -> int | None:
+        n = self.excluded.next_outside(self.first_host)
+        return n if n <= self.last_host else None
+
+    def last_usable(self) -> int | None:
+        n = self.excluded.prev_outside(self.last_host)
+        return n if n >= self.first_host else None
+
+
 class Subnet(models.Model):
+    class Strategy(models.TextChoices):
+        SEQUENTIAL = "sequential"
+        RANDOM = "random"
+        EUI64 = "eui64", "EUI-64"
+
     name = models.CharField(max_length=100, unique=True)
-    cidr = models.CharField(max_length=18)  # IPv4 CIDR e.g. 10.10.1.0/24
-    gateway = models.GenericIPAddressField(protocol="IPv4", null=True, blank=True)
+    cidr = models.CharField(max_length=43)  # e.g. 10.10.1.0/24 or 2001:db8:10::/64
+    gateway = models.GenericIPAddressField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
 
-    # optional: additional exclusions per subnet (comma-separated)
-    excluded_ips = models.TextField(blank=True, help_text="Comma-separated IPv4 addresses to exclude")
+    # how free addresses of IPv6 subnets are picked; IPv4 subnets always go lowest-first
+    allocation_strategy = models.CharField(
+        max_length=10,
+        choices=Strategy.choices,
+        default=Strategy.SEQUENTIAL,
+        help_text="IPv6 only: lowest free first, random, or derived from the client MAC (EUI-64)",
+    )
+
+    # hierarchy: supernets (e.g. a site /16) may contain other subnets; `parent` is
+    # maintained from the prefix trie (see supernets.py), not entered by hand
+    is_supernet = models.BooleanField(default=False, help_text="May contain other subnets")
+    parent = models.ForeignKey(
+        "self",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="children",
+        editable=False,
+    )
+    # first/last address as network_bounds() keys, for the overlap range queries of clean()
+    net_start = models.CharField(max_length=32, null=True, blank=True, editable=False)
+    net_end = models.CharField(max_length=32, null=True, blank=True, editable=False)
+
+    # optional: additional exclusions per subnet (comma-separated addresses, ranges, CIDR blocks)
+    excluded_ips = models.TextField(
+        blank=True,
+        help_text="Comma-separated addresses, ranges (10.0.0.10-10.0.0.50) or CIDR blocks to exclude",
+    )
+    # named exclusions, one per line: "DHCP = 10.0.0.100-10.0.0.199"
+    reserved_pools = models.TextField(
+        blank=True,
+        help_text='One pool per line, "name = ranges", e.g. "DHCP = 10.0.0.100-10.0.0.199"',
+    )
+
+    class Meta:
+        indexes = [models.Index(fields=["net_start", "net_end"])]
 
-    def clean(self):
+    def clean(self, tries=None):
+        """
+        `tries`: see supernets.hierarchy_errors (bulk imports validate against their own).
+        """
         try:
             net = ipaddress.ip_network(self.cidr, strict=False)
         except ValueError as e:
             raise ValidationError({"cidr": str(e)})
 
-        if net.version != 4:
-            raise ValidationError({"cidr": "Only IPv4 is supported."})
-
         if self.gateway:
             gw = ipaddress.ip_address(self.gateway)
             if gw not in net:
                 raise ValidationError({"gateway": "Gateway must be inside the subnet CIDR."})
 
+        if self.allocation_strategy == self.Strategy.EUI64 and (net.version != 6 or net.prefixlen > 64):
+            raise ValidationError({"allocation_strategy": "EUI-64 needs an IPv6 prefix of /64 or shorter."})
+
+        # exclusions reaching past the subnet are clipped to it (see parse_ranges); unparseable ones,
+        # the other family and entries entirely outside are errors
+        errors = {}
+        _, bad = parse_ranges(self.excluded_ips, net, allow_partial=True)
+        if bad:
+            errors["excluded_ips"] = f"Not an address, range or CIDR block overlapping {net}: {', '.join(bad)}"
+        _, bad = parse_pools(self.reserved_pools, net)
+        if bad:
+            errors["reserved_pools"] = f'Expected unique "name = ranges" inside {net}: {"; ".join(bad)}'
+        if errors:
+            raise ValidationError(errors)
+
+        if self.is_supernet and self.pk and self.allocations.filter(status=IPAddressAllocation.Status.USED).exists():
+            raise ValidationError({"is_supernet": "Release the addresses claimed here before making it a supernet."})
+
+        from .supernets import hierarchy_errors
+
+        errors, parent = hierarchy_errors(self, tries=tries)
+        if errors:
+            raise ValidationError(errors)
+        self.parent_id = parent.id if parent else None
+
+    @property
+    def layout(self) -> SubnetLayout:
+        # cached per instance; keyed on the source fields so edits and save() invalidate it
+        key = (self.cidr, self.gateway, self.excluded_ips, self.reserved_pools)
+        cached = self.__dict__.get("_layout")
+        if cached is None or cached[0] != key:
+            cached = (key, SubnetLayout.parse(*key))
+            self.__dict__["_layout"] = cached
+        return cached[1]
+
     @property
     def network(self):
-        return ipaddress.ip_network(self.cidr, strict=False)
+        return self.layout.network
 
     @property
-    def excluded_set(self) -> set[str]:
-        out = set()
-        if self.gateway:
-            out.add(str(self.gateway))
-        if self.excluded_ips:
-            for item in self.excluded_ips.split(","):
-                item = item.strip()
-                if item:
-                    out.add(item)
-        return out
+    def excluded_set(self) -> frozenset[str]:
+        return self.layout.excluded_text
+
+    def usable_count(self) -> int:
+        return self.layout.usable_count()
 
     def usable_range(self) -> tuple[str | None, str | None]:
-        # hosts() excludes network/broadcast automatically for IPv4
-        candidates = [str(ip) for ip in self.network.hosts() if str(ip) not in self.excluded_set]
-        if not candidates:
+        # one binary search per end over the excluded intervals
+        layout = self.layout
+        first, last = layout.first_usable(), layout.last_usable()
+        if first is None:
             return (None, None)
-        return (candidates[0], candidates[-1])
+        return (str(ipaddress.ip_address(first)), str(ipaddress.ip_address(last)))
+
+    def save(self, *args, **kwargs):
+        self.net_start, self.net_end = network_bounds(self.cidr)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "cidr" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "net_start", "net_end"}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.name} ({self.cidr})"
@@ -59,9 +306,18 @@ class IPAddressAllocation(models.Model):
     class Status(models.TextChoices):
         USED = "USED"
         RELEASED = "RELEASED"
+        # reserved by a claim whose LAN probe has not finished; not an allocation yet
+        PENDING = "PENDING"
+
+    # statuses that keep an address from being handed out
+    TAKEN = (Status.USED, Status.PENDING)
 
     subnet = models.ForeignKey(Subnet, on_delete=models.PROTECT, related_name="allocations")
-    ip = models.GenericIPAddressField(protocol="IPv4")
+    ip = models.GenericIPAddressField()
+    # numeric copy of an IPv4 `ip` (kept in sync by save()) for ordering and index range scans; NULL for IPv6
+    ip_int = models.BigIntegerField(null=True, blank=True, editable=False)
+    # the same for an IPv6 `ip`, as fixed-width hex (see ip6_key()); NULL for IPv4
+    ip6_key = models.CharField(max_length=32, null=True, blank=True, editable=False)
     status = models.CharField(max_length=10, choices=Status.choices, default=Status.USED)
 
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT, related_name="ip_allocations")
@@ -77,6 +333,8 @@ class IPAddressAllocation(models.Model):
     on_delete=models.SET_NULL,
     related_name="released_allocations",
     )   
+    # last visible change (claim, release, edit); services set it on their bulk updates too
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         constraints = [
@@ -85,17 +343,126 @@ class IPAddressAllocation(models.Model):
         indexes = [
             models.Index(fields=["subnet", "status"]),
             models.Index(fields=["owner", "status"]),
+            # keyset pagination in subnet_detail
+            models.Index(fields=["subnet", "claimed_at", "id"]),
+            # address ranges, prefix search, next-free-after-X
+            models.Index(fields=["subnet", "ip_int"]),
+            # lowest-free seek on IPv6 subnets
+            models.Index(fields=["subnet", "ip6_key"]),
+            # API ETags: newest change per subnet / overall
+            models.Index(fields=["subnet", "updated_at"]),
+            models.Index(fields=["updated_at"]),
+            # expire_reservations(): only the (few) in-flight claims
+            models.Index(
+                fields=["claimed_at"],
+                condition=models.Q(status="PENDING"),
+                name="ipalloc_pending_claimed_idx",
+            ),
         ]
 
+    def save(self, *args, **kwargs):
+        self.ip_int = ip_to_int(self.ip)
+        self.ip6_key = ip6_key(self.ip)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and "ip" in update_fields:
+            kwargs["update_fields"] = {*update_fields, "ip_int", "ip6_key"}
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.ip} ({self.status})"
 
+class SubnetStats(models.Model):
+    """
+    Denormalised utilisation counters, kept in step by services on claim/release
+    and rebuilt from IPAddressAllocation by `manage.py rebuild_subnet_stats`.
+    `stale` is a snapshot from the last rebuild: rows age into it with no write
+    to count them, so claims and releases leave it alone rather than drift it.
+    `free` saturates at FREE_MAX for IPv6 subnets; read it through exact_free().
+    """
+    subnet = models.OneToOneField(Subnet, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    used = models.IntegerField(default=0)
+    released = models.IntegerField(default=0)
+    stale = models.IntegerField(default=0)
+    free = models.BigIntegerField(default=0)
+    last_change = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.subnet_id}: {self.used} used / {self.free} free"
+
+
+class DiscoveredHost(models.Model):
+    """
+    Liveness learned by the background sweeper (`manage.py sweep_network`):
+    one row per address that has ever answered, with the last time it did.
+    """
+    subnet = models.ForeignKey(Subnet, on_delete=models.CASCADE, related_name="discovered")
+    ip = models.GenericIPAddressField()
+    ip_int = models.BigIntegerField(null=True, blank=True)  # ip_to_int(ip): NULL for IPv6
+    ip6_key = models.CharField(max_length=32, null=True, blank=True)  # ip6_key(ip): NULL for IPv4
+    mac = models.CharField(max_length=17, blank=True)
+    first_seen = models.DateTimeField(default=timezone.now)
+    last_seen = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["subnet", "ip"], name="uniq_discovered_ip_per_subnet"),
+        ]
+        indexes = [
+            models.Index(fields=["subnet", "last_seen"]),
+        ]
+
+    def __str__(self):
+        return f"{self.ip} ({self.mac or 'no MAC'}) seen {self.last_seen:%Y-%m-%d %H:%M}"
+
+
 class UserProfile(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     must_change_password = models.BooleanField(default=True)
+    # sha256 hex of the user's API token (manage.py api_token); the token itself is never stored
+    api_token = models.CharField(max_length=64, blank=True, db_index=True)
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance, must_change_password=True)
 
+
+@receiver(post_save, sender=Subnet)
+def refresh_subnet_free(sender, instance, created, **kwargs):
+    if created:
+        SubnetStats.objects.create(subnet=instance, free=stored_free(instance.usable_count()))
+        return
+    # cidr / exclusions may have changed the usable count
+    SubnetStats.objects.filter(subnet=instance).update(
+        free=Greatest(Value(stored_free(instance.usable_count())) - F("used"), Value(0)),
+        last_change=timezone.now(),
+    )
+
+
+@receiver(post_save, sender=Subnet)
+def refresh_subnet_tree(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    from .supernets import nested_ids, subnet_changed, sync_parents
+
+    def refresh():
+        subnet_changed(instance)
+        # this subnet and everything now nested under it may have a new innermost supernet
+        sync_parents([instance.id, *nested_ids(instance)])
+
+    # a rolled-back save must not reach the trie (or tell other processes to rebuild)
+    transaction.on_commit(refresh)
+
+
+@receiver(post_delete, sender=Subnet)
+def prune_subnet_tree(sender, instance, **kwargs):
+    from .supernets import nested_ids, subnet_changed, sync_parents
+
+    def refresh():
+        subnet_changed(instance, deleted=True)
+        # former children were set to NULL by the FK; re-attach them to the next supernet up
+        ids = nested_ids(instance)
+        if ids:
+            sync_parents(ids)
+
+    transaction.on_commit(refresh)
@@ -1,31 +1,381 @@
+import ipaddress
+import json
+import os
+import socket
+import struct
 import subprocess
-import re
-def seen_in_neigh(ip: str, iface: str) -> bool:
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Iterable, Optional
+
+from . import metrics
+
+# process-wide cap on in-flight probes (forked pings, echo and NDP rounds), shared by every request/batch
+MAX_CONCURRENT_PROBES = 64
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_PROBES, thread_name_prefix="netprobe")
+
+# neighbor table snapshots: iface -> (expires_at, {ip: lladdr})
+NEIGH_TTL = 2.0
+_neigh_cache: dict[str, tuple[float, dict[str, str]]] = {}
+_neigh_lock = threading.Lock()
+
+
+def _read_neigh_table(iface: str) -> dict[str, str]:
     """
-    True if kernel neighbor table has an lladdr for this IP on iface.
-    This is very reliable on same L2 and works even when arping fails on Wi-Fi.
+    One `ip neigh` call for the whole interface, parsed into {ip: lladdr}.
+    Entries without an lladdr (FAILED/INCOMPLETE) are left out.
     """
     res = subprocess.run(
-        ["ip", "neigh", "show", ip, "dev", iface],
+        ["ip", "-j", "neigh", "show", "dev", iface],
+        capture_output=True,
+        text=True,
+    )
+    table = {}
+    if res.returncode == 0 and (res.stdout or "").strip():
+        try:
+            for entry in json.loads(res.stdout):
+                if entry.get("dst") and entry.get("lladdr"):
+                    table[entry["dst"]] = entry["lladdr"]
+            return table
+        except ValueError:
+            pass
+
+    # iproute2 without JSON output
+    res = subprocess.run(
+        ["ip", "neigh", "show", "dev", iface],
         capture_output=True,
         text=True,
     )
-    out = (res.stdout or "").strip()
     # Example: "192.168.1.6 lladdr 42:c6:3c:7a:65:bc STALE"
-    return ("lladdr" in out)
+    for line in (res.stdout or "").splitlines():
+        parts = line.split()
+        if len(parts) >= 3 and "lladdr" in parts:
+            table[parts[0]] = parts[parts.index("lladdr") + 1]
+    return table
 
-def ping_alive(ip: str, timeout: float = 1.0) -> bool:
+
+def neigh_snapshot(iface: str, max_age: float = NEIGH_TTL) -> dict[str, str]:
+    """
+    Cached copy of the kernel neighbor table for iface, refreshed at most every `max_age` seconds.
+    """
+    now = time.monotonic()
+    cached = _neigh_cache.get(iface)
+    if cached and cached[0] > now:
+        return cached[1]
+    with _neigh_lock:
+        # another thread may have refreshed it while we waited
+        cached = _neigh_cache.get(iface)
+        if cached and cached[0] > now:
+            return cached[1]
+        table = _read_neigh_table(iface)
+        _neigh_cache[iface] = (time.monotonic() + max_age, table)
+        return table
+
+
+def seen_in_neigh(ip: str, iface: str) -> bool:
+    """
+    True if kernel neighbor table has an lladdr for this IP on iface.
+    This is very reliable on same L2 and works even when arping fails on Wi-Fi.
+    """
+    return ip in neigh_snapshot(iface)
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMPV6_ECHO_REQUEST = 128
+ICMPV6_ECHO_REPLY = 129
+ICMPV6_NEIGHBOR_SOLICIT = 135
+ICMPV6_NEIGHBOR_ADVERT = 136
+
+
+def _family(ip: str) -> int:
+    return 6 if ":" in ip else 4
+
+
+def _icmp_checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+def _echo_request(ident: int, seq: int, payload: bytes = b"ipmanager", family: int = 4) -> bytes:
+    if family == 6:
+        # the kernel computes ICMPv6 checksums (they cover the IPv6 pseudo-header)
+        return struct.pack("!BBHHH", ICMPV6_ECHO_REQUEST, 0, 0, ident, seq) + payload
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    csum = _icmp_checksum(header + payload)
+    return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, csum, ident, seq) + payload
+
+
+def _open_icmp_socket(family: int = 4) -> socket.socket:
+    """
+    Unprivileged ICMP datagram socket (net.ipv4.ping_group_range, which also
+    covers ICMPv6) if allowed, otherwise a raw socket (root / cap_net_raw).
+    Raises OSError if neither works.
+    """
+    af, proto = (socket.AF_INET, socket.IPPROTO_ICMP) if family == 4 else (socket.AF_INET6, socket.IPPROTO_ICMPV6)
+    try:
+        return socket.socket(af, socket.SOCK_DGRAM, proto)
+    except OSError:
+        return socket.socket(af, socket.SOCK_RAW, proto)
+
+
+class IcmpProber:
+    """
+    Sends one echo request per address over a single socket and collects
+    replies until every address answered or the timeout expires.
+    Honours sub-second timeouts. One address family per prober.
+    `sock` can be any object with sendto/recvfrom/settimeout/close
+    (a fake responder in tests).
+    """
+
+    def __init__(self, sock=None, family: int = 4):
+        self.family = family
+        self.sock = sock if sock is not None else _open_icmp_socket(family)
+        # raw sockets see every ICMP packet on the host, IPv4 ones with the IP header
+        self.raw = getattr(self.sock, "type", None) == socket.SOCK_RAW
+        self.ident = os.getpid() & 0xFFFF
+        self.reply_type = ICMP_ECHO_REPLY if family == 4 else ICMPV6_ECHO_REPLY
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _parse_reply(self, packet: bytes) -> tuple[int, int, int] | None:
+        if self.raw and self.family == 4:
+            if len(packet) < 20:
+                return None
+            packet = packet[(packet[0] & 0x0F) * 4:]
+        if len(packet) < 8:
+            return None
+        icmp_type, _code, _csum, ident, seq = struct.unpack("!BBHHH", packet[:8])
+        return icmp_type, ident, seq
+
+    def ping_many(self, ips, timeout: float = 1.0) -> dict[str, bool]:
+        ips = list(dict.fromkeys(ips))
+        alive = {ip: False for ip in ips}
+        # sequence number -> ip, so replies are matched even if ident is rewritten
+        by_seq = {}
+        for seq, ip in enumerate(ips, start=1):
+            by_seq[seq] = ip
+            try:
+                self.sock.sendto(_echo_request(self.ident, seq, family=self.family), (ip, 0))
+            except OSError:
+                # e.g. unreachable network: leave as not alive
+                by_seq.pop(seq)
+
+        pending = set(by_seq)
+        deadline = time.monotonic() + timeout
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.sock.settimeout(remaining)
+            try:
+                packet, addr = self.sock.recvfrom(2048)
+            except (socket.timeout, BlockingIOError):
+                break
+            reply = self._parse_reply(packet)
+            if reply is None:
+                continue
+            icmp_type, ident, seq = reply
+            if icmp_type != self.reply_type or seq not in pending:
+                continue
+            # datagram sockets get their ident rewritten by the kernel; raw ones see other pingers too
+            if self.raw and ident != self.ident:
+                continue
+            if not _same_address(by_seq[seq], addr[0]):
+                continue
+            alive[by_seq[seq]] = True
+            pending.discard(seq)
+        return alive
+
+
+def _same_address(ip: str, host: str) -> bool:
+    if ip == host:
+        return True
+    # IPv6 text forms vary (case, zero runs) and link-local sources carry a %scope
+    try:
+        return ipaddress.ip_address(ip) == ipaddress.ip_address(host.split("%")[0])
+    except ValueError:
+        return False
+
+
+_icmp_ok: dict[int, bool] = {}
+
+
+def icmp_available(family: int = 4) -> bool:
+    """
+    Whether this process may open an ICMP socket of that family; checked once and remembered.
+    """
+    if family not in _icmp_ok:
+        try:
+            _open_icmp_socket(family).close()
+            _icmp_ok[family] = True
+        except OSError:
+            _icmp_ok[family] = False
+    return _icmp_ok[family]
+
+
+_SOLICITED_NODE_PREFIX = int(ipaddress.IPv6Address("ff02::1:ff00:0"))
+
+
+def _solicited_node(addr: ipaddress.IPv6Address) -> str:
+    # ff02::1:ffXX:XXXX, the multicast group a host joins for each of its addresses
+    return str(ipaddress.IPv6Address(_SOLICITED_NODE_PREFIX | (int(addr) & 0xFFFFFF)))
+
+
+def _iface_mac(iface: str) -> bytes:
+    try:
+        with open(f"/sys/class/net/{iface}/address") as fh:
+            return bytes.fromhex(fh.read().strip().replace(":", ""))
+    except (OSError, ValueError):
+        return b""
+
+
+def _lladdr_option(options: bytes, wanted: int = 2) -> str:
+    # NDP options are (type, length in 8-byte units, value); type 2 is the target link-layer address
+    while len(options) >= 8:
+        kind, units = options[0], options[1]
+        if not units:
+            break
+        if kind == wanted:
+            return ":".join(f"{b:02x}" for b in options[2:8])
+        options = options[units * 8:]
+    return ""
+
+
+class NdpProber:
+    """
+    IPv6 counterpart of the ARP gate: one Neighbor Solicitation per address,
+    sent to its solicited-node multicast group on `iface`, then Neighbor
+    Advertisements are collected until the timeout. On-link hosts have to
+    answer these even when they drop echo requests. Needs a raw ICMPv6
+    socket (root / cap_net_raw); `sock` can be a fake responder in tests.
+    """
+
+    def __init__(self, iface: str, sock=None):
+        self.scope = socket.if_nametoindex(iface)
+        self.mac = _iface_mac(iface)
+        if sock is None:
+            sock = socket.socket(socket.AF_INET6, socket.SOCK_RAW, socket.IPPROTO_ICMPV6)
+            # RFC 4861: receivers drop NDP packets whose hop limit is not 255
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_MULTICAST_HOPS, 255)
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_UNICAST_HOPS, 255)
+        self.sock = sock
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _solicitation(self, target: ipaddress.IPv6Address) -> bytes:
+        packet = struct.pack("!BBHI", ICMPV6_NEIGHBOR_SOLICIT, 0, 0, 0) + target.packed
+        if len(self.mac) == 6:
+            # source link-layer address option, required in multicast solicitations
+            packet += struct.pack("!BB", 1, 1) + self.mac
+        return packet
+
+    def solicit_many(self, ips, timeout: float = 1.0) -> dict[str, str]:
+        """
+        {ip: mac} for every address whose owner advertised itself within `timeout`.
+        """
+        targets = {}
+        for ip in dict.fromkeys(ips):
+            try:
+                addr = ipaddress.IPv6Address(ip)
+            except ValueError:
+                continue
+            try:
+                self.sock.sendto(self._solicitation(addr), (_solicited_node(addr), 0, 0, self.scope))
+            except OSError:
+                continue
+            targets[addr] = ip
+
+        found = {}
+        deadline = time.monotonic() + timeout
+        while len(found) < len(targets):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self.sock.settimeout(remaining)
+            try:
+                packet, _addr = self.sock.recvfrom(2048)
+            except (socket.timeout, BlockingIOError):
+                break
+            # raw ICMPv6 sockets get every ICMPv6 packet, without the IPv6 header
+            if len(packet) < 24 or packet[0] != ICMPV6_NEIGHBOR_ADVERT:
+                continue
+            ip = targets.get(ipaddress.IPv6Address(packet[8:24]))
+            if ip is not None and ip not in found:
+                found[ip] = _lladdr_option(packet[24:])
+        return found
+
+
+_ndp_ok: bool | None = None
+
+
+def ndp_available() -> bool:
+    """
+    Whether this process may open a raw ICMPv6 socket for NdpProber; checked once and remembered.
+    """
+    global _ndp_ok
+    if _ndp_ok is None:
+        try:
+            socket.socket(socket.AF_INET6, socket.SOCK_RAW, socket.IPPROTO_ICMPV6).close()
+            _ndp_ok = True
+        except OSError:
+            _ndp_ok = False
+    return _ndp_ok
+
+
+def _solicit(ips: list[str], iface: str, timeout: float) -> dict[str, str]:
+    try:
+        with NdpProber(iface) as prober:
+            return prober.solicit_many(ips, timeout=timeout)
+    except OSError:
+        # unknown interface, or the socket went away: leave it to the echo round
+        return {}
+
+
+def _ping_subprocess(ip: str, timeout: float = 1.0) -> bool:
     """
     True if ping returns success.
     -c 1 one packet, -W timeout seconds
     """
     res = subprocess.run(
-        ["ping", "-c", "1", "-W", str(int(max(1, timeout))), ip],
+        ["ping", "-6" if _family(ip) == 6 else "-4", "-c", "1", "-W", str(int(max(1, timeout))), ip],
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
     )
     return res.returncode == 0
 
+
+@metrics.timed_probe("ping_alive")
+def ping_alive(ip: str, timeout: float = 1.0) -> bool:
+    """
+    True if the address answers an ICMP echo within `timeout`.
+    In-process when an ICMP socket is available, /bin/ping otherwise.
+    """
+    family = _family(ip)
+    if icmp_available(family):
+        with IcmpProber(family=family) as prober:
+            return prober.ping_many([ip], timeout=timeout)[ip]
+    return _ping_subprocess(ip, timeout=timeout)
+
+
 def ip_in_use(ip: str, iface: str, timeout: float = 1.0) -> bool:
     """
     Conservative: treat as in-use if either:
@@ -35,3 +385,132 @@ def ip_in_use(ip: str, iface: str, timeout: float = 1.0) -> bool:
     if seen_in_neigh(ip, iface):
         return True
     return ping_alive(ip, timeout=timeout)
+
+
+@metrics.timed_probe("probe_many")
+def probe_many(ips: Iterable[str], iface: str, timeout: float = 1.0, deadline: Optional[float] = None) -> dict[str, bool]:
+    """
+    ip_in_use() for many addresses at once: one neighbor snapshot, then all
+    echo requests multiplexed on one ICMP socket per address family (or forked
+    pings on the shared worker pool when no ICMP socket is allowed). IPv6
+    addresses are also sent Neighbor Solicitations, in parallel with the echo
+    round, when a raw socket is available. Returns {ip: in_use}. Anything not
+    answered within `deadline` seconds (default: two probe timeouts) is
+    reported as in use, to stay conservative.
+    """
+    ips = list(dict.fromkeys(ips))
+    if not ips:
+        return {}
+    if deadline is None:
+        deadline = 2 * max(1.0, timeout)
+
+    # neighbor gate once for the whole batch
+    neigh = neigh_snapshot(iface)
+    out = {ip: True for ip in ips if ip in neigh}
+    rest = [ip for ip in ips if ip not in neigh]
+    metrics.inc(metrics.PROBE_ADDRESSES, len(out), source="neigh")
+    if not rest:
+        return out
+
+    ends_at = time.monotonic() + deadline
+    v6 = [ip for ip in rest if _family(ip) == 6]
+    ndp = _executor.submit(_solicit, v6, iface, min(timeout, deadline)) if v6 and ndp_available() else None
+
+    # all echo requests of a family multiplexed on one socket; the rounds run on the
+    # shared pool like forked pings, so MAX_CONCURRENT_PROBES caps them process-wide
+    rounds = {}
+    forked = []
+    for family in (4, 6):
+        family_ips = [ip for ip in rest if _family(ip) == family]
+        if not family_ips:
+            continue
+        if not icmp_available(family):
+            forked.extend(family_ips)
+            continue
+        rounds[_executor.submit(_echo_round, family, family_ips, min(timeout, deadline))] = family_ips
+
+    if forked:
+        # no ICMP socket: fall back to forked ping on the shared pool
+        _ping_forked(forked, timeout, max(0.0, ends_at - time.monotonic()), out)
+
+    for fut, family_ips in rounds.items():
+        try:
+            out.update(fut.result(timeout=max(0.0, ends_at - time.monotonic())))
+            metrics.inc(metrics.PROBE_ADDRESSES, len(family_ips), source="icmp")
+        except Exception:
+            # still queued behind the cap at the deadline, or the socket failed: stay conservative
+            fut.cancel()
+            out.update(dict.fromkeys(family_ips, True))
+            metrics.inc(metrics.PROBE_ADDRESSES, len(family_ips), source="timeout")
+
+    if ndp is not None:
+        try:
+            advertised = ndp.result(timeout=max(0.0, ends_at - time.monotonic()))
+        except Exception:
+            advertised = {}
+        hits = [ip for ip in advertised if not out.get(ip)]
+        out.update(dict.fromkeys(hits, True))
+        metrics.inc(metrics.PROBE_ADDRESSES, len(hits), source="ndp")
+    return out
+
+
+def _echo_round(family: int, ips: list[str], timeout: float) -> dict[str, bool]:
+    with IcmpProber(family=family) as prober:
+        return prober.ping_many(ips, timeout=timeout)
+
+
+def _ping_forked(ips: list[str], timeout: float, deadline: float, out: dict[str, bool]) -> None:
+    futures = {_executor.submit(_ping_subprocess, ip, timeout): ip for ip in ips}
+    done, pending = wait(futures, timeout=deadline)
+
+    metrics.inc(metrics.PROBE_ADDRESSES, len(done), source="subprocess")
+    metrics.inc(metrics.PROBE_ADDRESSES, len(pending), source="timeout")
+    for fut in pending:
+        fut.cancel()
+        out[futures[fut]] = True
+    for fut in done:
+        try:
+            out[futures[fut]] = fut.result()
+        except Exception:
+            out[futures[fut]] = True
+
+
+@metrics.timed_probe("discover")
+def discover(ips: Iterable[str], iface: str, timeout: float = 1.0, network=None) -> dict[str, str]:
+    """
+    Sweep helper: {ip: mac} for every address that answered a ping (or, for
+    IPv6, a neighbor solicitation) or has a neighbor entry afterwards (mac is
+    "" when unknown, e.g. routed subnets). Unlike probe_many(), silent
+    addresses are simply left out. With `network`, every neighbor entry inside
+    it is reported too: that is how hosts of an IPv6 /64, which cannot be
+    swept address by address, turn up.
+    """
+    ips = list(dict.fromkeys(ips))
+
+    v6 = [ip for ip in ips if _family(ip) == 6]
+    advertised = _solicit(v6, iface, timeout) if v6 and ndp_available() else {}
+    answered = dict.fromkeys(advertised, True)
+    for family in (4, 6):
+        family_ips = [ip for ip in ips if _family(ip) == family and not answered.get(ip)]
+        if not family_ips:
+            continue
+        if icmp_available(family):
+            answered.update(_executor.submit(_echo_round, family, family_ips, timeout).result())
+        else:
+            answered.update(zip(family_ips, _executor.map(lambda ip: _ping_subprocess(ip, timeout), family_ips)))
+
+    # the probes just (re)populated the neighbor table; read it fresh and refresh the cache
+    neigh = _read_neigh_table(iface)
+    with _neigh_lock:
+        _neigh_cache[iface] = (time.monotonic() + NEIGH_TTL, neigh)
+
+    found = {ip: neigh.get(ip) or advertised.get(ip, "") for ip in ips if answered.get(ip) or ip in neigh}
+    if network is not None:
+        for ip, mac in neigh.items():
+            try:
+                inside = ipaddress.ip_address(ip) in network
+            except ValueError:
+                continue
+            if inside:
+                found.setdefault(ip, mac)
+    return found
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+import ipaddress
+import random
+import re
+from typing import Iterable, Iterator, Optional
+
+from django.conf import settings
+from django.db import connection
+
+from .models import IPAddressAllocation, Subnet, ip6_key
+
+# random picks should not be guessable from earlier ones
+_rng = random.SystemRandom()
+
+# taken IPv6 rows read per round trip by the lowest-free seek
+SEEK_PAGE = 512
+
+
+def _sparse_candidates() -> int:
+    return max(1, int(getattr(settings, "IPAM_SPARSE_CANDIDATES", 256)))
+
+
+def _used_ips(subnet: Subnet, ips: Optional[Iterable[str]] = None):
+    qs = IPAddressAllocation.objects.filter(
+        subnet=subnet,
+        status__in=IPAddressAllocation.TAKEN,
+    )
+    if ips is not None:
+        qs = qs.filter(ip__in=list(ips))
+    return qs
+
+
+def eui64_interface_id(mac: str) -> Optional[int]:
+    """
+    Modified EUI-64 interface identifier (RFC 4291 appendix A) of a 48-bit MAC, or None.
+    """
+    digits = re.sub(r"[:.\-]", "", (mac or "").strip())
+    if not re.fullmatch(r"[0-9a-fA-F]{12}", digits):
+        return None
+    n = int(digits, 16)
+    # ff:fe in the middle, universal/local bit flipped
+    return ((n >> 24) << 40 | 0xFFFE << 24 | (n & 0xFFFFFF)) ^ (1 << 57)
+
+
+def _taken_offsets_from(subnet: Subnet, base: int, start: int) -> Iterator[int]:
+    """
+    Taken host offsets >= `start` in ascending order, read SEEK_PAGE rows at a time
+    with an index seek on (subnet, ip6_key): only as much of the prefix as the caller walks.
+    """
+    qs = _used_ips(subnet).order_by("ip6_key").values_list("ip6_key", flat=True)
+    page = list(qs.filter(ip6_key__gte=ip6_key(base + start))[:SEEK_PAGE])
+    while page:
+        for key in page:
+            yield int(key, 16) - base
+        if len(page) < SEEK_PAGE:
+            return
+        page = list(qs.filter(ip6_key__gt=page[-1])[:SEEK_PAGE])
+
+
+def _taken_among(subnet: Subnet, base: int, offsets: Iterable[int]) -> set[int]:
+    keys = [ip6_key(base + off) for off in offsets]
+    if not keys:
+        return set()
+    return {int(key, 16) - base for key in _used_ips(subnet).filter(ip6_key__in=keys).values_list("ip6_key", flat=True)}
+
+
+def _sequential_free_offsets(subnet: Subnet, start: int, limit: int) -> list[int]:
+    layout = subnet.layout
+    base = layout.base
+    off = max(start, layout.first_host - base)
+    last = layout.last_host - base
+    taken = _taken_offsets_from(subnet, base, off)
+    nxt = next(taken, None)
+    out = []
+    while len(out) < limit:
+        off = layout.excluded.next_outside(base + off) - base
+        if off > last:
+            break
+        while nxt is not None and nxt < off:
+            nxt = next(taken, None)
+        if nxt != off:
+            out.append(off)
+        off += 1
+    return out
+
+
+def _random_free_offsets(subnet: Subnet, count: int) -> list[int]:
+    """
+    Up to `count` distinct free offsets drawn uniformly from the host range, checked
+    with one query on the draws; topped up lowest-first when the subnet is too full
+    for random draws to land.
+    """
+    layout = subnet.layout
+    base = layout.base
+    first = layout.first_host - base
+    span = layout.last_host - layout.first_host + 1
+    draws: dict[int, None] = {}
+    for _ in range(4 * count + 16):
+        if span <= 0:
+            break
+        off = first + _rng.randrange(span)
+        if base + off not in layout.excluded:
+            draws[off] = None
+    taken = _taken_among(subnet, base, draws)
+    picked = [off for off in draws if off not in taken][:count]
+    if len(picked) < count:
+        # at most len(picked) of these repeat a pick
+        seen = set(picked)
+        picked += [off for off in _sequential_free_offsets(subnet, 0, count) if off not in seen][:count - len(picked)]
+    return picked
+
+
+def sparse_free_hosts(subnet: Subnet, limit: int = 1, after: Optional[str] = None, mac: str = "") -> list[str]:
+    """
+    Free hosts of an IPv6 subnet according to its allocation_strategy:
+    sequential - lowest free addresses (after `after`, when given)
+    random     - uniformly random free addresses
+    eui64      - only the address derived from `mac`; random when no MAC is given
+    Never loads the taken addresses of the whole prefix: sequential seeks through
+    them in ip6_key order, random and eui64 look up only the addresses they drew.
+    """
+    if limit < 1:
+        return []
+    layout = subnet.layout
+    base = layout.base
+    address = lambda off: str(ipaddress.ip_address(base + off))
+    strategy = subnet.allocation_strategy
+
+    if strategy == Subnet.Strategy.EUI64 and mac:
+        iid = eui64_interface_id(mac)
+        if iid is None or not layout.first_host <= base + iid <= layout.last_host or base + iid in layout.excluded:
+            return []
+        if _taken_among(subnet, base, [iid]):
+            return []
+        return [address(iid)]
+
+    if strategy in (Subnet.Strategy.RANDOM, Subnet.Strategy.EUI64):
+        return [address(off) for off in _random_free_offsets(subnet, limit)]
+
+    start = 0
+    if after is not None:
+        try:
+            after_off = int(ipaddress.ip_address(after)) - base
+        except ValueError:
+            return []
+        if not 0 <= after_off <= layout.broadcast - base:
+            return []
+        start = after_off + 1
+    return [address(off) for off in _sequential_free_offsets(subnet, start, limit)]
+
+
+def _free_hosts(subnet_id: int, lo: int, hi: int, excluded: list[tuple[int, int]], limit: int) -> list[int]:
+    # gaps between blocked intervals (taken rows, excluded ranges, sentinels) via window
+    # functions, on PostgreSQL and SQLite >= 3.25 alike: the cost follows the taken rows
+    # of the subnet, not its size. The running MAX(e) keeps a taken row inside an
+    # excluded range from reopening the rest of that range.
+    table = IPAddressAllocation._meta.db_table
+    extra = "".join(" UNION ALL SELECT %s, %s" for _ in excluded)
+    sql = f"""
+        WITH blocked(s, e) AS (
+            SELECT ip_int, ip_int FROM {table}
+            WHERE subnet_id = %s AND status IN (%s, %s) AND ip_int BETWEEN %s AND %s
+            UNION ALL SELECT %s, %s
+            UNION ALL SELECT %s, %s{extra}
+        ),
+        gaps AS (
+            SELECT MAX(e) OVER (ORDER BY s, e ROWS UNBOUNDED PRECEDING) + 1 AS gap_start,
+                   LEAD(s) OVER (ORDER BY s, e) - 1 AS gap_end
+            FROM blocked
+        )
+        SELECT gap_start, gap_end FROM gaps
+        WHERE gap_end >= gap_start
+        ORDER BY gap_start
+        LIMIT %s
+    """
+    params = [
+        subnet_id, *IPAddressAllocation.TAKEN, lo, hi,
+        lo - 1, lo - 1, hi + 1, hi + 1,
+        *(n for interval in excluded for n in interval),
+        limit,
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        gaps = cursor.fetchall()
+
+    out = []
+    for start, end in gaps:
+        out.extend(range(start, min(end, start + limit - len(out) - 1) + 1))
+        if len(out) >= limit:
+            break
+    return out
+
+
+def first_free_hosts(subnet: Subnet, limit: int = 1, after: Optional[str] = None, mac: str = "") -> list[str]:
+    """
+    Lowest `limit` hosts of the subnet that are neither USED in DB nor excluded,
+    optionally starting after address `after`, in one round trip: the excluded
+    ranges go into the query as interval bounds, never as single addresses.
+    IPv6 subnets go through sparse_free_hosts() and their allocation strategy.
+    """
+    layout = subnet.layout
+    if layout.sparse:
+        return sparse_free_hosts(subnet, limit=limit, after=after, mac=mac)
+    lo = layout.first_host
+    if after is not None:
+        lo = max(lo, int(ipaddress.ip_address(after)) + 1)
+    hi = layout.last_host
+    if lo > hi or limit < 1:
+        return []
+
+    excluded = layout.excluded.clip(lo, hi)
+    found = _free_hosts(subnet.id, lo, hi, list(excluded), limit)
+    return [str(ipaddress.ip_address(n)) for n in found]
+
+
+def iter_free_hosts(subnet: Subnet, batch: int = 64, mac: str = "") -> Iterator[str]:
+    """
+    Free hosts in address order, fetched `batch` at a time with first_free_hosts().
+    IPv6 subnets yield at most IPAM_SPARSE_CANDIDATES picks of their strategy,
+    so a claim against a /64 whose candidates all answer still ends.
+    """
+    if subnet.layout.sparse:
+        yield from sparse_free_hosts(subnet, limit=_sparse_candidates(), mac=mac)
+        return
+    after = None
+    while True:
+        ips = first_free_hosts(subnet, limit=batch, after=after)
+        if not ips:
+            return
+        yield from ips
+        after = ips[-1]
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import Q
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_cursor(row) -> str:
+    """
+    Opaque (claimed_at, id) position of a model instance or .values() dict.
+    Exact microseconds, no float rounding.
+    """
+    if isinstance(row, dict):
+        claimed_at, pk = row["claimed_at"], row["id"]
+    else:
+        claimed_at, pk = row.claimed_at, row.id
+    return f"{(claimed_at - _EPOCH) // timedelta(microseconds=1)}.{pk}"
+
+
+def decode_cursor(raw: str | None):
+    try:
+        micros, pk = (raw or "").split(".")
+        return _EPOCH + timedelta(microseconds=int(micros)), int(pk)
+    except (ValueError, OverflowError):
+        # malformed, or a timestamp past datetime's range: start from the first page
+        return None
+
+
+def keyset_page(qs, cursor: str | None, per_page: int, descending: bool):
+    """
+    One page ordered on (claimed_at, id), starting after `cursor`.
+    Uses a range condition instead of OFFSET, so cost does not grow with depth.
+    Returns (rows, next_cursor or None).
+    """
+    qs = qs.order_by("-claimed_at", "-id") if descending else qs.order_by("claimed_at", "id")
+    key = decode_cursor(cursor)
+    if key:
+        ts, pk = key
+        if descending:
+            qs = qs.filter(Q(claimed_at__lt=ts) | Q(claimed_at=ts, id__lt=pk))
+        else:
+            qs = qs.filter(Q(claimed_at__gt=ts) | Q(claimed_at=ts, id__gt=pk))
+
+    rows = list(qs[:per_page + 1])
+    next_cursor = encode_cursor(rows[per_page - 1]) if len(rows) > per_page else None
+    return rows[:per_page], next_cursor
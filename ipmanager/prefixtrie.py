@@ -0,0 +1,154 @@
+"""
+Binary prefix trie (one bit per level) mapping IP networks to values.
+
+Every operation walks at most `prefixlen` levels, so lookups cost
+O(prefix length) however many networks are stored. One trie holds one
+address family (width 32 or 128).
+"""
+from __future__ import annotations
+
+import ipaddress
+from typing import Any, Iterator, Optional
+
+
+class _Node:
+    __slots__ = ("children", "value", "has_value")
+
+    def __init__(self):
+        self.children: list[Optional[_Node]] = [None, None]
+        self.value: Any = None
+        self.has_value = False
+
+
+class PrefixTrie:
+    def __init__(self, width: int = 32):
+        self.width = width
+        self._network = ipaddress.IPv4Network if width == 32 else ipaddress.IPv6Network
+        self.root = _Node()
+        self.size = 0
+
+    def _bit(self, addr: int, depth: int) -> int:
+        return (addr >> (self.width - 1 - depth)) & 1
+
+    def _path(self, net) -> Iterator[tuple[int, _Node]]:
+        """
+        (depth, node) from the root down to `net`'s node, stopping early where the path ends.
+        """
+        addr = int(net.network_address)
+        node = self.root
+        yield 0, node
+        for depth in range(net.prefixlen):
+            node = node.children[self._bit(addr, depth)]
+            if node is None:
+                return
+            yield depth + 1, node
+
+    def _find(self, net) -> Optional[_Node]:
+        for depth, node in self._path(net):
+            pass
+        return node if depth == net.prefixlen else None
+
+    def insert(self, net, value) -> None:
+        addr = int(net.network_address)
+        node = self.root
+        for depth in range(net.prefixlen):
+            bit = self._bit(addr, depth)
+            if node.children[bit] is None:
+                node.children[bit] = _Node()
+            node = node.children[bit]
+        if not node.has_value:
+            self.size += 1
+        node.value, node.has_value = value, True
+
+    def remove(self, net) -> None:
+        path = list(self._path(net))
+        depth, node = path[-1]
+        if depth != net.prefixlen or not node.has_value:
+            return
+        node.value, node.has_value = None, False
+        self.size -= 1
+        # prune nodes that no longer lead to a value, so "node exists" == "something below"
+        addr = int(net.network_address)
+        for (parent_depth, parent), (_, child) in zip(reversed(path[:-1]), reversed(path[1:])):
+            if child.has_value or child.children[0] or child.children[1]:
+                break
+            parent.children[self._bit(addr, parent_depth)] = None
+
+    def get(self, net, default=None):
+        node = self._find(net)
+        return node.value if node is not None and node.has_value else default
+
+    def covering(self, net, strict: bool = True) -> list:
+        """
+        Values of every stored network containing `net`, outermost first.
+        """
+        out = []
+        for depth, node in self._path(net):
+            if node.has_value and (depth < net.prefixlen or not strict):
+                out.append(node.value)
+        return out
+
+    def longest_match(self, addr: int):
+        """
+        Value of the most specific stored network containing address `addr` (an int), or None.
+        """
+        best = None
+        node = self.root
+        if node.has_value:
+            best = node.value
+        for depth in range(self.width):
+            node = node.children[self._bit(addr, depth)]
+            if node is None:
+                break
+            if node.has_value:
+                best = node.value
+        return best
+
+    def inside(self, net, strict: bool = True) -> Iterator:
+        """
+        Values of every stored network inside `net`, in address order.
+        """
+        start = self._find(net)
+        if start is None:
+            return
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            if node.has_value and (node is not start or not strict):
+                yield node.value
+            # push 1 before 0 so the lower half comes out first
+            for child in (node.children[1], node.children[0]):
+                if child is not None:
+                    stack.append(child)
+
+    def first_free(self, within, prefixlen: int):
+        """
+        Lowest aligned /prefixlen block inside `within` that overlaps no stored
+        network other than `within` and the networks containing it.
+        """
+        if prefixlen < within.prefixlen or prefixlen > self.width:
+            return None
+        start = self._find(within)
+        base = int(within.network_address)
+        if start is None:
+            return self._network((base, prefixlen))
+
+        def walk(node: _Node, addr: int, depth: int):
+            # a node only exists if a stored network lies at or below it
+            if depth == prefixlen or (node.has_value and depth > within.prefixlen):
+                return None
+            for bit in (0, 1):
+                child_addr = addr | (bit << (self.width - 1 - depth))
+                child = node.children[bit]
+                if child is None:
+                    return child_addr
+                found = walk(child, child_addr, depth + 1)
+                if found is not None:
+                    return found
+            return None
+
+        found = walk(start, base, within.prefixlen)
+        return None if found is None else self._network((found, prefixlen))
+
+    def __len__(self) -> int:
+        return self.size
@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import ipaddress
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import DiscoveredHost, IPAddressAllocation, Subnet
+
+
+def reconcile_window_hours() -> int:
+    return int(getattr(settings, "IPAM_RECONCILE_HOURS", 24))
+
+
+def _as_int(ip_int: Optional[int], ip: str) -> int:
+    # ip_int is only stored for IPv4
+    return ip_int if ip_int is not None else int(ipaddress.ip_address(ip))
+
+
+def _ints(rows: Iterable[tuple[Optional[int], str]]) -> set[int]:
+    return {_as_int(n, ip) for n, ip in rows}
+
+
+@dataclass
+class Reconciliation:
+    """
+    Sweep data vs. USED allocations of one subnet, as sorted integer addresses:
+    rogue    - answered on the LAN, no USED allocation (gateway/excluded are not counted)
+    orphaned - USED allocation that has not answered since `since`
+    matching - both
+    """
+    subnet: Subnet
+    since: datetime
+    rogue: list[int]
+    orphaned: list[int]
+    matching: list[int]
+
+    def _hosts(self):
+        return DiscoveredHost.objects.filter(subnet=self.subnet, last_seen__gte=self.since).order_by("ip_int", "ip6_key")
+
+    def _allocations(self):
+        return IPAddressAllocation.objects.filter(
+            subnet=self.subnet, status=IPAddressAllocation.Status.USED
+        ).order_by("ip_int", "ip6_key")
+
+    def rows(self, status: Optional[str] = None, limit: Optional[int] = None):
+        """
+        (status, ip, mac, last_seen, owner, hostname, claimed_at), address order within each status
+        (ip_int for IPv4, ip6_key for IPv6). Details are read with streaming queries only for
+        the statuses asked for.
+        """
+        statuses = (status,) if status else ("rogue", "orphaned", "matching")
+        for status in statuses:
+            wanted = set(getattr(self, status))
+            if not wanted:
+                continue
+            count = 0
+
+            if status == "rogue":
+                qs = self._hosts().values_list("ip_int", "ip", "mac", "last_seen")
+                rows = ((_as_int(n, ip), (ip, mac, seen, "", "", None)) for n, ip, mac, seen in qs.iterator())
+            else:
+                hosts = {}
+                if status == "matching":
+                    hosts = {
+                        _as_int(n, ip): (mac, seen)
+                        for n, ip, mac, seen in self._hosts().values_list("ip_int", "ip", "mac", "last_seen")
+                    }
+                qs = self._allocations().values_list("ip_int", "ip", "owner__username", "hostname", "claimed_at")
+                rows = (
+                    (_as_int(n, ip), (ip, *hosts.get(_as_int(n, ip), ("", None)), owner, hostname, claimed_at))
+                    for n, ip, owner, hostname, claimed_at in qs.iterator()
+                )
+
+            for n, row in rows:
+                if n not in wanted:
+                    continue
+                yield (status, *row)
+                count += 1
+                if limit is not None and count >= limit:
+                    break
+
+
+def reconcile_subnet(subnet: Subnet, since: Optional[datetime] = None) -> Reconciliation:
+    """
+    Two integer-column scans (DiscoveredHost by last_seen, USED allocations)
+    and set arithmetic on the addresses; a /16 takes well under a second.
+    """
+    if since is None:
+        since = timezone.now() - timedelta(hours=reconcile_window_hours())
+
+    alive = _ints(
+        DiscoveredHost.objects.filter(subnet=subnet, last_seen__gte=since).values_list("ip_int", "ip")
+    )
+    allocated = _ints(
+        IPAddressAllocation.objects.filter(
+            subnet=subnet, status=IPAddressAllocation.Status.USED
+        ).values_list("ip_int", "ip")
+    )
+
+    excluded = subnet.layout.excluded
+    return Reconciliation(
+        subnet=subnet,
+        since=since,
+        rogue=sorted(n for n in alive - allocated if n not in excluded),
+        orphaned=sorted(allocated - alive),
+        matching=sorted(alive & allocated),
+    )
+
+
+def last_sweep(subnet: Subnet) -> Optional[datetime]:
+    return DiscoveredHost.objects.filter(subnet=subnet).order_by("-last_seen").values_list("last_seen", flat=True).first()
@@ -1,12 +1,21 @@
 from __future__ import annotations
 
-from typing import Optional
+from datetime import timedelta
+from itertools import islice
+import re
+from typing import Iterable, Optional
 from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
 from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 import ipaddress
-from .models import IPAddressAllocation, Subnet
-from .netprobe import ip_in_use
+from . import metrics
+from .models import DiscoveredHost, IPAddressAllocation, Subnet, SubnetStats, ip6_key, ip_to_int, stored_free
+from .netprobe import discover, probe_many
+from .occupancy import first_free_hosts, iter_free_hosts
 
 
 def _probe_iface() -> str:
@@ -17,82 +26,410 @@ def _probe_timeout() -> float:
     return float(getattr(settings, "IPAM_PROBE_TIMEOUT", 1.0))
 
 
-def _candidate_ips(subnet: Subnet):
-    for ip_obj in subnet.network.hosts():
-        ip = str(ip_obj)
-        if ip in subnet.excluded_set:
-            continue
-        yield ip
+def _probe_window() -> int:
+    return max(1, int(getattr(settings, "IPAM_PROBE_WINDOW", 16)))
 
 
-def _ip_is_used_in_db(subnet: Subnet, ip: str) -> bool:
-    return IPAddressAllocation.objects.filter(
-        subnet=subnet,
-        ip=ip,
-        status=IPAddressAllocation.Status.USED,
-    ).exists()
+def _probe_deadline() -> Optional[float]:
+    deadline = getattr(settings, "IPAM_PROBE_DEADLINE", None)
+    return None if deadline is None else float(deadline)
+
+
+def _sweep_chunk() -> int:
+    return max(1, int(getattr(settings, "IPAM_SWEEP_CHUNK", 256)))
+
+
+def _sweep_fresh() -> int:
+    return int(getattr(settings, "IPAM_SWEEP_FRESH", 900))
+
+
+def _reservation_ttl() -> int:
+    return int(getattr(settings, "IPAM_RESERVATION_TTL", 60))
 
 
-def _claim_ip_row(subnet: Subnet, ip: str, user, hostname: str, description: str) -> Optional[IPAddressAllocation]:
+def _probe_cache():
+    return caches[getattr(settings, "IPAM_PROBE_CACHE", "default")]
+
+
+def _probe_cache_key(iface: str, ip: str) -> str:
+    return f"ipam:probe:{iface}:{ip}"
+
+
+def _probe(ips: Iterable[str]) -> dict[str, bool]:
     """
-    Claim an IP by REUSING the existing row (because subnet+ip is unique).
+    probe_many() behind a shared cache keyed by (iface, ip): "in use" results are
+    kept IPAM_PROBE_TTL_USED seconds, "free" ones IPAM_PROBE_TTL_FREE, so workers
+    scanning the same subnet within that window send no probes at all.
     """
-    # already used by someone in DB?
-    if _ip_is_used_in_db(subnet, ip):
-        return None
+    ips = list(dict.fromkeys(ips))
+    if not ips:
+        return {}
+    iface = _probe_iface()
+    ttl_used = int(getattr(settings, "IPAM_PROBE_TTL_USED", 30))
+    ttl_free = int(getattr(settings, "IPAM_PROBE_TTL_FREE", 5))
+    if ttl_used <= 0 and ttl_free <= 0:
+        return probe_many(ips, iface=iface, timeout=_probe_timeout(), deadline=_probe_deadline())
+
+    cache = _probe_cache()
+    keys = {_probe_cache_key(iface, ip): ip for ip in ips}
+    cached = cache.get_many(list(keys))
+    out = {keys[k]: v for k, v in cached.items()}
+
+    missing = [ip for ip in ips if ip not in out]
+    metrics.inc(metrics.PROBE_CACHE, len(out), result="hit")
+    metrics.inc(metrics.PROBE_CACHE, len(missing), result="miss")
+    if missing:
+        fresh = probe_many(missing, iface=iface, timeout=_probe_timeout(), deadline=_probe_deadline())
+        out.update(fresh)
+        for in_use, ttl in ((True, ttl_used), (False, ttl_free)):
+            if ttl > 0:
+                cache.set_many({_probe_cache_key(iface, ip): in_use for ip, v in fresh.items() if bool(v) == in_use}, ttl)
+    return out
 
-    # LAN gate
+
+def stale_window_days() -> int:
+    return int(getattr(settings, "IPAM_STALE_DAYS", 30))
+
+
+def stale_cutoff():
+    return timezone.now() - timedelta(days=stale_window_days())
+
+
+def rebuild_subnet_stats(subnet_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Recount SubnetStats from IPAddressAllocation: one aggregate query, one upsert.
+    """
+    USED = IPAddressAllocation.Status.USED
+    RELEASED = IPAddressAllocation.Status.RELEASED
+
+    subnets = Subnet.objects.all()
+    if subnet_ids is not None:
+        subnets = subnets.filter(id__in=list(subnet_ids))
+    subnets = subnets.annotate(
+        used_count=Count("allocations", filter=Q(allocations__status=USED)),
+        released_count=Count("allocations", filter=Q(allocations__status=RELEASED)),
+        stale_count=Count("allocations", filter=Q(allocations__status=USED, allocations__claimed_at__lte=stale_cutoff())),
+    )
+
+    now = timezone.now()
+    stats = [
+        SubnetStats(
+            subnet=s,
+            used=s.used_count,
+            released=s.released_count,
+            stale=s.stale_count,
+            free=stored_free(max(s.usable_count() - s.used_count, 0)),
+            last_change=now,
+        )
+        for s in subnets
+    ]
+    SubnetStats.objects.bulk_create(
+        stats,
+        update_conflicts=True,
+        unique_fields=["subnet"],
+        update_fields=["used", "released", "stale", "free", "last_change"],
+    )
+    return len(stats)
+
+
+def _bump_stats(subnet_id: int, **deltas: int) -> None:
+    """
+    Apply counter deltas with F() so concurrent claims/releases don't lose updates.
+    Call inside the transaction that changed the allocation row.
+    """
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    updated = SubnetStats.objects.filter(subnet_id=subnet_id).update(last_change=timezone.now(), **changes)
+    if not updated:
+        # no stats row yet: a recount already includes this change
+        rebuild_subnet_stats([subnet_id])
+
+
+def _lan_free_windows(candidates: Iterable[str]):
+    """
+    Probe candidates a window at a time, concurrently; yield the ones that look free, in order.
+    """
+    candidates = iter(candidates)
+    while True:
+        window = list(islice(candidates, _probe_window()))
+        if not window:
+            return
+        in_use = _probe(window)
+        for ip in window:
+            if not in_use.get(ip, True):
+                yield ip
+
+
+def _skip_recently_seen(subnet: Subnet, candidates: Iterable[str]):
+    """
+    Drop candidates the sweeper saw alive within IPAM_SWEEP_FRESH seconds,
+    without probing them again; one indexed query per window.
+    """
+    if _sweep_fresh() <= 0:
+        yield from candidates
+        return
+    candidates = iter(candidates)
+    cutoff = timezone.now() - timedelta(seconds=_sweep_fresh())
+    while True:
+        window = list(islice(candidates, _probe_window()))
+        if not window:
+            return
+        seen = set(
+            DiscoveredHost.objects.filter(
+                subnet=subnet,
+                ip__in=window,
+                last_seen__gte=cutoff,
+            ).values_list("ip", flat=True)
+        )
+        for ip in window:
+            if ip not in seen:
+                yield ip
+
+
+def _known_hosts(subnet: Subnet):
+    allocated = IPAddressAllocation.objects.filter(
+        subnet=subnet, status=IPAddressAllocation.Status.USED
+    ).values_list("ip", flat=True)
+    seen = DiscoveredHost.objects.filter(subnet=subnet).values_list("ip", flat=True)
+    return iter(dict.fromkeys([*allocated, *seen]))
+
+
+def sweep_subnet(subnet: Subnet) -> int:
+    """
+    Ping every host of the subnet, IPAM_SWEEP_CHUNK addresses at a time, and
+    upsert a DiscoveredHost row for each one that answered. Returns how many did.
+    IPv6 subnets cannot be walked: the addresses already allocated or seen are
+    re-checked, and the neighbor table is harvested for anything else in the prefix.
+    Supernets are left to their child subnets and return 0.
+    """
+    if subnet.is_supernet:
+        return 0
+    layout = subnet.layout
+    if layout.sparse:
+        hosts = _known_hosts(subnet)
+        harvest = layout.network
+    else:
+        hosts = (str(ipaddress.ip_address(n)) for n in range(layout.first_host, layout.last_host + 1))
+        harvest = None
     iface = _probe_iface()
     timeout = _probe_timeout()
-    if ip_in_use(ip, iface=iface, timeout=timeout):
-        return None
+
+    alive = 0
+    while True:
+        chunk = list(islice(hosts, _sweep_chunk()))
+        if not chunk and harvest is None:
+            return alive
+        found = discover(chunk, iface=iface, timeout=timeout, network=harvest)
+        harvest = None
+        now = timezone.now()
+        rows = [
+            DiscoveredHost(
+                subnet=subnet, ip=ip, ip_int=ip_to_int(ip), ip6_key=ip6_key(ip), mac=mac, first_seen=now, last_seen=now
+            )
+            for ip, mac in found.items()
+        ]
+        # a sighting without a MAC (routed hop, expired neighbor entry) keeps the last known one
+        for batch, fields in (
+            ([r for r in rows if r.mac], ["mac", "last_seen"]),
+            ([r for r in rows if not r.mac], ["last_seen"]),
+        ):
+            DiscoveredHost.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=["subnet", "ip"],
+                update_fields=fields,
+            )
+        alive += len(found)
+
+
+# values written when a row is (re)claimed, as attnames so they can be restored verbatim
+_CLAIM_FIELDS = ("status", "owner_id", "hostname", "description", "claimed_at", "released_at", "released_by_id")
+
+
+class _Reservation:
+    """
+    A claim written optimistically (row PENDING) before the LAN probe.
+    `previous` holds the RELEASED row values to restore on rollback; None if the row was created.
+    """
+
+    def __init__(self, row: IPAddressAllocation, previous: Optional[dict] = None):
+        self.row = row
+        self.previous = previous
+
+
+def _reserve_ip_row(subnet: Subnet, ip: str, user, hostname: str, description: str) -> Optional[_Reservation]:
+    """
+    Reserve an IP as PENDING by REUSING the existing row (because subnet+ip is unique).
+    Each write is its own short statement: a RELEASED row is flipped with a
+    conditional UPDATE, a missing row is INSERTed and the unique constraint
+    decides races, so no Subnet row lock is held. Stats are only counted once
+    the claim is confirmed.
+    """
+    now = timezone.now()
+    values = {
+        "status": IPAddressAllocation.Status.PENDING,
+        "owner_id": user.pk,
+        "hostname": hostname,
+        "description": description,
+        "claimed_at": now,
+    }
 
     # row exists? reuse it
     row = IPAddressAllocation.objects.filter(subnet=subnet, ip=ip).first()
     if row:
         if row.status != IPAddressAllocation.Status.RELEASED:
             return None
-
-        row.status = IPAddressAllocation.Status.USED
-        row.owner = user
-        row.hostname = hostname
-        row.description = description
-        row.claimed_at = timezone.now()
-        row.released_at = None
-        row.released_by = None
-        row.save(update_fields=[
-            "status", "owner", "hostname", "description",
-            "claimed_at", "released_at", "released_by"
-        ])
-        return row
+        previous = {f: getattr(row, f) for f in _CLAIM_FIELDS}
+        # released_at stays set while PENDING: it tells expire_reservations() the row was reused
+        if not IPAddressAllocation.objects.filter(
+            id=row.id, status=IPAddressAllocation.Status.RELEASED
+        ).update(released_at=Coalesce(F("released_at"), Value(now)), **values):
+            return None
+        for f, v in values.items():
+            setattr(row, f, v)
+        return _Reservation(row, previous)
 
     # if no row exists at all, create it
     try:
-        return IPAddressAllocation.objects.create(
-            subnet=subnet,
-            ip=ip,
-            status=IPAddressAllocation.Status.USED,
-            owner=user,
-            hostname=hostname,
-            description=description,
-            claimed_at=timezone.now(),
-        )
+        # savepoint, so a lost race does not poison an outer transaction
+        with transaction.atomic():
+            row = IPAddressAllocation.objects.create(subnet=subnet, ip=ip, **values)
     except IntegrityError:
         return None
+    return _Reservation(row)
 
 
-def claim_first_free_ip(*, subnet_id: int, user, hostname: str = "", description: str = "") -> Optional[IPAddressAllocation]:
-    for _ in range(5):
-        with transaction.atomic():
-            subnet = Subnet.objects.select_for_update().get(id=subnet_id, is_active=True)
+def _pending(row: IPAddressAllocation):
+    # claimed_at guard: only ever touch our own reservation
+    return IPAddressAllocation.objects.filter(
+        id=row.id, status=IPAddressAllocation.Status.PENDING, claimed_at=row.claimed_at
+    )
+
+
+def _confirm_reservation(reservation: _Reservation) -> bool:
+    """
+    PENDING -> USED and count it. False if the reservation expired and was undone meanwhile.
+    """
+    row = reservation.row
+    values = {
+        "status": IPAddressAllocation.Status.USED, "released_at": None, "released_by_id": None,
+        "updated_at": timezone.now(),
+    }
+    with transaction.atomic():
+        if not _pending(row).update(**values):
+            return False
+        _bump_stats(row.subnet_id, used=1, free=-1, released=-1 if reservation.previous else 0)
+    for f, v in values.items():
+        setattr(row, f, v)
+    return True
+
+
+def _rollback_reservation(reservation: _Reservation) -> None:
+    qs = _pending(reservation.row)
+    if reservation.previous is None:
+        qs.delete()
+    else:
+        qs.update(**reservation.previous)
+
+
+def expire_reservations(subnet_id: Optional[int] = None) -> int:
+    """
+    Undo PENDING claims older than IPAM_RESERVATION_TTL seconds, left behind by a
+    worker that died or timed out between reserve and confirm: rows the claim
+    created are deleted, reused rows go back to RELEASED (keeping the abandoned
+    claim's owner/hostname). Stats never counted them. Returns how many were undone.
+    """
+    qs = IPAddressAllocation.objects.filter(
+        status=IPAddressAllocation.Status.PENDING,
+        claimed_at__lt=timezone.now() - timedelta(seconds=_reservation_ttl()),
+    )
+    if subnet_id is not None:
+        qs = qs.filter(subnet_id=subnet_id)
+    # nearly always empty: one read on the partial index before any write
+    expired = list(qs.values_list("id", "released_at"))
+    if not expired:
+        return 0
+    created = [pk for pk, released_at in expired if released_at is None]
+    reused = [pk for pk, released_at in expired if released_at is not None]
+    # status filter again: a late confirm wins over the reaper
+    undone = qs.filter(id__in=created).delete()[0]
+    undone += qs.filter(id__in=reused).update(status=IPAddressAllocation.Status.RELEASED, updated_at=timezone.now())
+    return undone
+
+
+def _confirm_first_clean(reservations: list[_Reservation]) -> Optional[IPAddressAllocation]:
+    """
+    LAN gate for reserved rows, run with no DB lock held: probe them concurrently,
+    keep the first clean one (in address order) and roll back the others.
+    Rows stay PENDING until then, so lists, exports and stats never show them.
+    """
+    winner = None
+    try:
+        in_use = _probe([r.row.ip for r in reservations])
+    except BaseException:
+        for r in reservations:
+            _rollback_reservation(r)
+        raise
+
+    for r in reservations:
+        if winner is None and not in_use.get(r.row.ip, True) and _confirm_reservation(r):
+            winner = r.row
+            continue
+        _rollback_reservation(r)
+    return winner
+
+
+def _claim_clean_ip(subnet: Subnet, ip: str, user, hostname: str, description: str) -> Optional[IPAddressAllocation]:
+    """
+    Claim an address that already passed the LAN gate: the conditional
+    UPDATE/INSERT of _reserve_ip_row() and the confirm in one transaction,
+    so the PENDING state is never visible to anyone else. None if it was taken.
+    """
+    with transaction.atomic():
+        reservation = _reserve_ip_row(subnet, ip, user, hostname, description)
+        if reservation is None or not _confirm_reservation(reservation):
+            return None
+    return reservation.row
 
-            for ip in _candidate_ips(subnet):
-                alloc = _claim_ip_row(subnet, ip, user, hostname, description)
-                if alloc:
-                    return alloc
+
+# supernets are never claimed from: their addresses belong to the child subnets
+# carved out of them, which would otherwise hand out the same IPs a second time
+
+
+@metrics.timed_operation("claim_first_free_ip")
+def claim_first_free_ip(
+    *, subnet_id: int, user, hostname: str = "", description: str = "", mac: str = ""
+) -> Optional[IPAddressAllocation]:
+    """
+    `mac` only matters for IPv6 subnets with the EUI-64 strategy: the claim is then for the address derived from it.
+    """
+    subnet = Subnet.objects.get(id=subnet_id, is_active=True)
+    if subnet.is_supernet:
+        return None
+    expire_reservations(subnet.id)
+
+    scanned = 0
+    for _ in range(5):
+        # free hosts come from the DB-side gap query (the ip6_key seek for IPv6) and are
+        # probed a window at a time with nothing written; addresses the sweeper just saw
+        # alive are skipped without a probe. Only the first clean one is claimed.
+        lost_race = False
+        candidates = _skip_recently_seen(subnet, iter_free_hosts(subnet, batch=_probe_window(), mac=mac))
+        for ip in _lan_free_windows(candidates):
+            scanned += 1
+            with metrics.timer(metrics.RESERVE_SECONDS):
+                alloc = _claim_clean_ip(subnet, ip, user, hostname, description)
+            if alloc:
+                metrics.observe(metrics.CANDIDATES, scanned, op="claim_first_free_ip")
+                return alloc
+            # taken since the gap query: fall through to the next clean one
+            lost_race = True
+        if not lost_race:
+            break
+    metrics.observe(metrics.CANDIDATES, scanned, op="claim_first_free_ip")
     return None
 
 
+@metrics.timed_operation("claim_specific_ip")
 def claim_specific_ip(*, subnet_id: int, ip: str, user, hostname: str = "", description: str = "") -> Optional[IPAddressAllocation]:
     ip = ip.strip()
 
@@ -101,81 +438,219 @@ def claim_specific_ip(*, subnet_id: int, ip: str, user, hostname: str = "", desc
     except ValueError:
         return None
 
-    for _ in range(3):
-        with transaction.atomic():
-            subnet = Subnet.objects.select_for_update().get(id=subnet_id, is_active=True)
-
-            # must be IPv4 inside subnet
-            if ip_obj.version != 4:
-                return None
-            if ip_obj not in subnet.network:
-                return None
-
-            # exclude special addresses + excluded list
-            if ip in subnet.excluded_set:
-                return None
-            if ip_obj == subnet.network.network_address or ip_obj == subnet.network.broadcast_address:
-                return None
-
-            # already USED in DB?
-            if IPAddressAllocation.objects.filter(
-                subnet=subnet, ip=ip, status=IPAddressAllocation.Status.USED
-            ).exists():
-                return None
-
-            # LAN gate
-            if ip_in_use(ip, iface=_probe_iface(), timeout=_probe_timeout()):
-                return None
-
-            # reuse RELEASED row if exists (because unique constraint)
-            row = IPAddressAllocation.objects.filter(subnet=subnet, ip=ip).first()
-            if row:
-                if row.status != IPAddressAllocation.Status.RELEASED:
-                    return None
-                row.status = IPAddressAllocation.Status.USED
-                row.owner = user
-                row.hostname = hostname
-                row.description = description
-                row.claimed_at = timezone.now()
-                row.released_at = None
-                row.released_by = None
-                row.save(update_fields=[
-                    "status","owner","hostname","description",
-                    "claimed_at","released_at","released_by"
-                ])
-                return row
-
-            # create new row
-            return IPAddressAllocation.objects.create(
-                subnet=subnet,
-                ip=ip,
-                status=IPAddressAllocation.Status.USED,
-                owner=user,
-                hostname=hostname,
-                description=description,
-                claimed_at=timezone.now(),
-            )
+    subnet = Subnet.objects.get(id=subnet_id, is_active=True)
+    if subnet.is_supernet:
+        return None
 
-    return None
+    # same family as the subnet; canonical text so rows, probes and cache keys agree
+    if ip_obj.version != subnet.network.version:
+        return None
+    # outside the subnet, network/broadcast, excluded or in a reserved pool: no query needed
+    if not subnet.layout.is_host(int(ip_obj)):
+        return None
+    ip = str(ip_obj)
+    expire_reservations(subnet.id)
 
-def find_free_ip(subnet: Subnet) -> Optional[str]:
-    iface = _probe_iface()
-    timeout = _probe_timeout()
+    for _ in range(3):
+        # already USED (or reserved) in DB
+        if IPAddressAllocation.objects.filter(subnet=subnet, ip=ip, status__in=IPAddressAllocation.TAKEN).exists():
+            return None
 
-    for ip in _candidate_ips(subnet):
-        # not USED in DB?
-        if IPAddressAllocation.objects.filter(subnet=subnet, ip=ip, status=IPAddressAllocation.Status.USED).exists():
+        with metrics.timer(metrics.RESERVE_SECONDS):
+            reservation = _reserve_ip_row(subnet, ip, user, hostname, description)
+        if reservation is None:
+            # lost the insert race; the winner may still roll back after its probe
             continue
+
         # LAN gate
-        if ip_in_use(ip, iface=iface, timeout=timeout):
+        return _confirm_first_clean([reservation])
+
+    return None
+
+
+class _BulkConflict(Exception):
+    """
+    An address picked for a bulk claim was taken before the write; the whole batch rolls back.
+    """
+
+
+def _bulk_claim_rows(subnet: Subnet, ips: list[str], user, hostnames: list[str], description: str) -> list[IPAddressAllocation]:
+    """
+    Write every claim in one transaction: RELEASED rows are reused with bulk_update,
+    missing ones inserted with bulk_create.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        existing = {
+            row.ip: row
+            for row in IPAddressAllocation.objects.select_for_update().filter(subnet=subnet, ip__in=ips)
+        }
+        if any(row.status != IPAddressAllocation.Status.RELEASED for row in existing.values()):
+            raise _BulkConflict
+
+        rows, reused, created = [], [], []
+        for ip, hostname in zip(ips, hostnames):
+            row = existing.get(ip)
+            if row is None:
+                row = IPAddressAllocation(subnet=subnet, ip=ip, ip_int=ip_to_int(ip), ip6_key=ip6_key(ip))
+                created.append(row)
+            else:
+                reused.append(row)
+            row.status = IPAddressAllocation.Status.USED
+            row.owner = user
+            row.hostname = hostname
+            row.description = description
+            row.claimed_at = now
+            row.released_at = None
+            row.released_by = None
+            row.updated_at = now
+            rows.append(row)
+
+        if reused:
+            IPAddressAllocation.objects.bulk_update(reused, [
+                "status", "owner", "hostname", "description",
+                "claimed_at", "released_at", "released_by", "updated_at",
+            ])
+        if created:
+            try:
+                with transaction.atomic():
+                    IPAddressAllocation.objects.bulk_create(created)
+            except IntegrityError:
+                raise _BulkConflict
+        _bump_stats(subnet.id, used=len(rows), released=-len(reused), free=-len(rows))
+    return rows
+
+
+@metrics.timed_operation("claim_many")
+def claim_many(*, subnet_id: int, count: int, user, hostnames: Optional[list[str]] = None, description: str = "") -> list[IPAddressAllocation]:
+    """
+    Claim `count` addresses at once, all or nothing: pick free hosts with the gap query,
+    probe them concurrently, then write every row in a single transaction.
+    Returns [] if the subnet cannot supply `count` clean addresses.
+    """
+    hostnames = list(hostnames or [])
+    if hostnames and len(hostnames) != count:
+        raise ValueError("hostnames must have exactly one entry per address")
+    if count < 1:
+        return []
+    hostnames = hostnames or [""] * count
+
+    subnet = Subnet.objects.get(id=subnet_id, is_active=True)
+    if subnet.is_supernet:
+        return []
+    expire_reservations(subnet.id)
+
+    for _ in range(3):
+        clean = []
+        tried = set()
+        after = None
+        while len(clean) < count:
+            # random IPv6 picks ignore `after` and may repeat; stop once nothing new comes back
+            candidates = [ip for ip in first_free_hosts(subnet, limit=count - len(clean), after=after) if ip not in tried]
+            if not candidates:
+                return []
+            tried.update(candidates)
+            after = candidates[-1]
+            # LAN gate for the whole batch at once
+            in_use = _probe(candidates)
+            clean.extend(ip for ip in candidates if not in_use.get(ip, True))
+
+        try:
+            with metrics.timer(metrics.RESERVE_SECONDS):
+                return _bulk_claim_rows(subnet, clean, user, hostnames, description)
+        except _BulkConflict:
+            # someone claimed one of them meanwhile; pick again
             continue
+    return []
+
+
+@metrics.timed_operation("find_free_ip")
+def find_free_ip(subnet: Subnet) -> Optional[str]:
+    if subnet.is_supernet:
+        return None
+    # not USED in DB / excluded: answered by the DB-side gap query
+    candidates = _skip_recently_seen(subnet, iter_free_hosts(subnet, batch=_probe_window()))
+    # LAN gate, one concurrent window at a time
+    for ip in _lan_free_windows(candidates):
         return ip
     return None
 
 
 def release_allocation(allocation, released_by=None):
+    now = timezone.now()
+    with transaction.atomic():
+        # conditional UPDATE so a double release doesn't count twice
+        if IPAddressAllocation.objects.filter(
+            id=allocation.id, status=IPAddressAllocation.Status.USED
+        ).update(status=IPAddressAllocation.Status.RELEASED, released_at=now, released_by=released_by, updated_at=now):
+            # `stale` is left to rebuild_subnet_stats (see SubnetStats)
+            _bump_stats(allocation.subnet_id, used=-1, released=1, free=1)
+
     allocation.status = allocation.Status.RELEASED
-    allocation.released_at = timezone.now()
+    allocation.released_at = now
     allocation.released_by = released_by
-    allocation.save(update_fields=["status", "released_at", "released_by"])
     return allocation
+
+
+def _glob_regex(pattern: str) -> str:
+    # hostname glob ("rack12-*", "web-??") as an anchored regex both PostgreSQL and SQLite accept
+    out = []
+    for ch in pattern:
+        if ch == "*":
+            out.append(".*")
+        elif ch == "?":
+            out.append(".")
+        else:
+            out.append(re.escape(ch))
+    return "^" + "".join(out) + "$"
+
+
+def release_many(
+    *,
+    user,
+    ids: Optional[Iterable[int]] = None,
+    subnet_id: Optional[int] = None,
+    owner_id: Optional[int] = None,
+    hostname_pattern: str = "",
+) -> int:
+    """
+    Release every USED allocation matching the filters with a single UPDATE.
+    Non-staff users may only release their own rows: explicit ids owned by
+    someone else raise PermissionDenied (one query), filters are narrowed to
+    the user's rows. Returns the number of rows released.
+    """
+    if ids is None and subnet_id is None and owner_id is None and not hostname_pattern:
+        raise ValueError("release_many needs ids or at least one filter")
+
+    qs = IPAddressAllocation.objects.filter(status=IPAddressAllocation.Status.USED)
+    if ids is not None:
+        ids = list(ids)
+        qs = qs.filter(id__in=ids)
+    if subnet_id is not None:
+        qs = qs.filter(subnet_id=subnet_id)
+    if owner_id is not None:
+        qs = qs.filter(owner_id=owner_id)
+    if hostname_pattern:
+        qs = qs.filter(hostname__regex=_glob_regex(hostname_pattern))
+
+    if not user.is_staff:
+        if ids is not None and IPAddressAllocation.objects.filter(id__in=ids).exclude(owner=user).exists():
+            raise PermissionDenied
+        qs = qs.filter(owner=user)
+
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(qs.select_for_update().values_list("id", "subnet_id"))
+        if not rows:
+            return 0
+        released = IPAddressAllocation.objects.filter(
+            id__in=[pk for pk, _ in rows], status=IPAddressAllocation.Status.USED
+        ).update(status=IPAddressAllocation.Status.RELEASED, released_at=now, released_by=user, updated_at=now)
+
+        # counter deltas per subnet; `stale` is left to rebuild_subnet_stats
+        per_subnet: dict[int, int] = {}
+        for _, sid in rows:
+            per_subnet[sid] = per_subnet.get(sid, 0) + 1
+        for sid, n in per_subnet.items():
+            _bump_stats(sid, used=-n, released=n, free=n)
+    return released
@@ -0,0 +1,255 @@
+"""
+Subnet hierarchy backed by an in-memory prefix trie of the active subnets:
+"which subnet owns this IP" lookups, parent links and carving child
+networks out of a supernet. Overlap validation (Subnet.clean) reads the
+overlapping subnets from the DB instead (range queries on their stored
+bounds), so it never acts on a stale trie.
+
+The trie is built once per process and patched in place when a Subnet save
+or delete made by this process commits. Other processes notice through a
+stamp in the default cache (a file cache unless DEBUG; see the ipmanager.W001
+check) and rebuild; without a shared cache they rebuild at least every
+IPAM_TRIE_MAX_AGE seconds.
+"""
+from __future__ import annotations
+
+import ipaddress
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Subnet, network_bounds
+from .prefixtrie import PrefixTrie
+
+_STAMP_KEY = "ipam:subnet-trie"
+_lock = threading.Lock()
+_state = {"tries": None, "networks": {}, "stamp": None, "built": 0.0}
+
+
+@dataclass(frozen=True)
+class SubnetEntry:
+    id: int
+    name: str
+    cidr: str
+    is_supernet: bool
+
+
+def _max_age() -> float:
+    return float(getattr(settings, "IPAM_TRIE_MAX_AGE", 60))
+
+
+def _parse(cidr: str):
+    try:
+        return ipaddress.ip_network(cidr, strict=False)
+    except ValueError:
+        return None
+
+
+def _entry(subnet) -> SubnetEntry:
+    return SubnetEntry(subnet.id, subnet.name, subnet.cidr, subnet.is_supernet)
+
+
+def db_trie(version: int) -> PrefixTrie:
+    """
+    Trie of the active subnets of one address family, read from the DB now.
+    Costs one pass over the subnet table; used for validation, not lookups.
+    """
+    trie = PrefixTrie(32 if version == 4 else 128)
+    rows = Subnet.objects.filter(is_active=True)
+    rows = rows.filter(cidr__contains=":") if version == 6 else rows.exclude(cidr__contains=":")
+    for pk, name, cidr, is_supernet in rows.values_list("id", "name", "cidr", "is_supernet").iterator(chunk_size=5000):
+        net = _parse(cidr)
+        if net is not None and net.version == version:
+            trie.insert(net, SubnetEntry(pk, name, cidr, is_supernet))
+    return trie
+
+
+def overlapping_trie(net) -> PrefixTrie:
+    """
+    Trie of the active subnets that overlap `net`, read from the DB now. Prefixes
+    either nest or are disjoint, so that is the ones starting inside it plus the
+    ones covering it, whose starts are the network addresses of its supernets.
+    """
+    trie = PrefixTrie(net.max_prefixlen)
+    start, end = network_bounds(net)
+    covering = {network_bounds(net.supernet(new_prefix=p))[0] for p in range(net.prefixlen)}
+    rows = Subnet.objects.filter(is_active=True).filter(
+        Q(net_start__gte=start, net_start__lte=end) | Q(net_start__in=covering, net_end__gte=end)
+    )
+    for pk, name, cidr, is_supernet in rows.values_list("id", "name", "cidr", "is_supernet"):
+        other = _parse(cidr)
+        # the keys of both families share one column
+        if other is not None and other.version == net.version:
+            trie.insert(other, SubnetEntry(pk, name, cidr, is_supernet))
+    return trie
+
+
+def _build() -> tuple[dict[int, PrefixTrie], dict[int, object]]:
+    tries = {4: PrefixTrie(32), 6: PrefixTrie(128)}
+    networks = {}
+    rows = Subnet.objects.filter(is_active=True).values_list("id", "name", "cidr", "is_supernet")
+    for pk, name, cidr, is_supernet in rows.iterator(chunk_size=5000):
+        net = _parse(cidr)
+        if net is None:
+            continue
+        tries[net.version].insert(net, SubnetEntry(pk, name, cidr, is_supernet))
+        networks[pk] = net
+    return tries, networks
+
+
+def subnet_tries() -> dict[int, PrefixTrie]:
+    """
+    {4: trie, 6: trie} of the active subnets, keyed by network, valued by SubnetEntry.
+    """
+    stamp = cache.get(_STAMP_KEY)
+    with _lock:
+        if (
+            _state["tries"] is None
+            or _state["stamp"] != stamp
+            or time.monotonic() - _state["built"] > _max_age()
+        ):
+            _state["tries"], _state["networks"] = _build()
+            _state["stamp"] = stamp
+            _state["built"] = time.monotonic()
+        return _state["tries"]
+
+
+def _bump_stamp() -> None:
+    stamp = uuid.uuid4().hex
+    cache.set(_STAMP_KEY, stamp, None)
+    _state["stamp"] = stamp
+
+
+def subnet_changed(subnet: Subnet, deleted: bool = False) -> None:
+    """
+    Patch this process's trie for one saved/deleted subnet and tell the other processes to rebuild.
+    """
+    with _lock:
+        if _state["tries"] is not None:
+            old = _state["networks"].pop(subnet.id, None)
+            if old is not None:
+                _state["tries"][old.version].remove(old)
+            net = _parse(subnet.cidr)
+            if net is not None and subnet.is_active and not deleted:
+                _state["tries"][net.version].insert(net, _entry(subnet))
+                _state["networks"][subnet.id] = net
+        _bump_stamp()
+
+
+def invalidate_subnet_tries() -> None:
+    # after bulk writes that skip signals (imports)
+    with _lock:
+        _state["tries"] = None
+        _bump_stamp()
+
+
+def subnet_for_ip(ip) -> Optional[SubnetEntry]:
+    """
+    Most specific active subnet containing `ip`, or None.
+    """
+    try:
+        addr = ipaddress.ip_address(str(ip).strip())
+    except ValueError:
+        return None
+    return subnet_tries()[addr.version].longest_match(int(addr))
+
+
+def hierarchy_errors(subnet: Subnet, tries: Optional[dict[int, PrefixTrie]] = None) -> tuple[dict[str, str], Optional[SubnetEntry]]:
+    """
+    Overlap rules for Subnet.clean: no duplicate CIDR; only supernets may contain
+    other subnets. Returns (field errors, the supernet that should be the parent).
+    Checked against the overlapping rows in the DB, or against `tries` ({version: trie})
+    when a caller such as the importer keeps its own, including rows it has not written yet.
+    """
+    net = _parse(subnet.cidr)
+    if net is None:
+        return {}, None
+    trie = tries[net.version] if tries is not None else overlapping_trie(net)
+
+    same = trie.get(net)
+    if same is not None and same.id != subnet.pk:
+        return {"cidr": f"{same.cidr} is already used by {same.name}."}, None
+
+    containers = [e for e in trie.covering(net) if e.id != subnet.pk]
+    for e in containers:
+        if not e.is_supernet:
+            return {"cidr": f"Overlaps {e.name} ({e.cidr}); only supernets may contain other subnets."}, None
+
+    if not subnet.is_supernet:
+        for e in trie.inside(net):
+            if e.id != subnet.pk:
+                return {"cidr": f"Contains {e.name} ({e.cidr}); mark this subnet as a supernet to nest it."}, None
+
+    return {}, (containers[-1] if containers else None)
+
+
+def sync_parents(subnet_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Point `parent` at the innermost active supernet containing each subnet
+    (all subnets, or only `subnet_ids`). Returns how many rows changed.
+    """
+    tries = subnet_tries()
+    qs = Subnet.objects.only("id", "cidr", "parent_id")
+    if subnet_ids is not None:
+        qs = qs.filter(id__in=list(subnet_ids))
+
+    changed = []
+    for s in qs.iterator(chunk_size=2000):
+        net = _parse(s.cidr)
+        if net is None:
+            continue
+        supernets = [e for e in tries[net.version].covering(net) if e.is_supernet and e.id != s.id]
+        parent_id = supernets[-1].id if supernets else None
+        if s.parent_id != parent_id:
+            s.parent_id = parent_id
+            changed.append(s)
+    Subnet.objects.bulk_update(changed, ["parent"], batch_size=1000)
+    return len(changed)
+
+
+def nested_ids(subnet: Subnet) -> list[int]:
+    net = _parse(subnet.cidr)
+    if net is None:
+        return []
+    return [e.id for e in subnet_tries()[net.version].inside(net)]
+
+
+def carve_subnet(supernet: Subnet, prefixlen: int, name: str, **fields) -> Optional[Subnet]:
+    """
+    Create subnet `name` on the lowest free /prefixlen inside `supernet`, or
+    return None when no such block is left. The supernet row is locked for the
+    duration, so concurrent carves from the same supernet queue up instead of
+    picking the same block.
+    """
+    if not supernet.is_supernet:
+        raise ValueError(f"{supernet.name} is not a supernet")
+
+    with transaction.atomic():
+        supernet = Subnet.objects.select_for_update().get(pk=supernet.pk)
+        net = supernet.network
+        if not net.prefixlen < prefixlen <= net.max_prefixlen:
+            raise ValueError(f"/{prefixlen} does not fit inside {supernet.cidr}")
+
+        # direct children straight from the DB (not the cached trie), under the lock
+        local = PrefixTrie(net.max_prefixlen)
+        local.insert(net, supernet.id)
+        for cidr in supernet.children.values_list("cidr", flat=True):
+            child = _parse(cidr)
+            if child is not None and child.version == net.version:
+                local.insert(child, None)
+
+        block = local.first_free(net, prefixlen)
+        if block is None:
+            return None
+
+        subnet = Subnet(name=name, cidr=str(block), parent=supernet, **fields)
+        subnet.full_clean()
+        subnet.save()
+    return subnet
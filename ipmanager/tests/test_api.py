@@ -0,0 +1,97 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from ipmanager import services
+from ipmanager.api import hash_api_token
+from ipmanager.models import IPAddressAllocation, Subnet, UserProfile
+
+from .test_views import _login
+
+
+def _all_free(ips, **kwargs):
+    return {ip: False for ip in ips}
+
+
+class EtagTests(TestCase):
+    def setUp(self):
+        self.user = _login(self.client, "alice")
+        self.subnet = Subnet.objects.create(name="lan", cidr="10.0.0.0/24")
+        self.url = reverse("api_subnet_allocations", args=[self.subnet.id])
+
+    def etag(self, **params):
+        resp = self.client.get(self.url, params)
+        self.assertEqual(resp.status_code, 200)
+        return resp["ETag"]
+
+    def test_unchanged_data_gives_304(self):
+        tag = self.etag()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=tag).status_code, 304)
+
+    def test_allocation_edit_changes_the_etag(self):
+        alloc = IPAddressAllocation.objects.create(subnet=self.subnet, ip="10.0.0.5", owner=self.user)
+        tag = self.etag()
+        alloc.hostname = "renamed"
+        alloc.save()
+        self.assertNotEqual(self.etag(), tag)
+
+    def test_ageing_into_the_stale_filter_changes_the_etag(self):
+        alloc = IPAddressAllocation.objects.create(subnet=self.subnet, ip="10.0.0.5", owner=self.user)
+        tag = self.etag(stale="1")
+        # no write to the row: it only got older than the cutoff
+        with mock.patch("ipmanager.api.stale_cutoff", return_value=timezone.now() + timedelta(seconds=1)):
+            self.assertNotEqual(self.etag(stale="1"), tag)
+        self.assertEqual(alloc.claimed_at, IPAddressAllocation.objects.get(id=alloc.id).claimed_at)
+
+
+@override_settings(IPAM_PROBE_TTL_USED=0, IPAM_PROBE_TTL_FREE=0)
+@mock.patch.object(services, "probe_many", _all_free)
+class AuthTests(TestCase):
+    def setUp(self):
+        self.subnet = Subnet.objects.create(name="lan", cidr="10.0.0.0/24")
+        self.claim_url = reverse("api_claim", args=[self.subnet.id])
+        self.user = get_user_model().objects.create_user("bot")
+
+    def token(self):
+        out = StringIO()
+        call_command("api_token", "bot", stdout=out)
+        return out.getvalue().strip()
+
+    def test_token_posts_without_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        # a fresh account: the forced password change must not redirect API calls
+        resp = client.post(self.claim_url, "{}", content_type="application/json", HTTP_AUTHORIZATION=f"Bearer {self.token()}")
+        self.assertEqual(resp.status_code, 201, resp.content)
+        self.assertEqual(resp.json()["owner"], "bot")
+
+        resp = client.post(reverse("api_claim_many", args=[self.subnet.id]), '{"count": 2}',
+                           content_type="application/json", HTTP_AUTHORIZATION=f"Bearer {self.token()}")
+        self.assertEqual(resp.status_code, 201, resp.content)
+
+    def test_bad_or_revoked_token(self):
+        token = self.token()
+        # only the hash is stored
+        self.assertEqual(UserProfile.objects.get(user=self.user).api_token, hash_api_token(token))
+        call_command("api_token", "bot", "--revoke", stdout=StringIO())
+        resp = self.client.get(reverse("api_subnet_list"), HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(resp.status_code, 401)
+
+    def test_session_posts_still_need_csrf(self):
+        client = Client(enforce_csrf_checks=True)
+        _login(client, "alice")
+        resp = client.post(self.claim_url, "{}", content_type="application/json")
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(resp.json(), {"error": "CSRF check failed."})
+
+    def test_session_with_pending_password_change_gets_json(self):
+        self.client.force_login(self.user)
+        resp = self.client.get(reverse("api_subnet_list"))
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(resp.json(), {"error": "Password change required."})
+        self.assertEqual(self.client.get(reverse("subnet_list")).status_code, 302)
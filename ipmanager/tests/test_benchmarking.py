@@ -0,0 +1,34 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from ipmanager.benchmarking import bench_user
+from ipmanager.models import Subnet
+
+
+class BenchSafetyTests(TestCase):
+    def test_refuses_a_non_scratch_database(self):
+        Subnet.objects.create(name="bench-prod", cidr="10.0.0.0/24")
+        with mock.patch("ipmanager.benchmarking.is_scratch_database", return_value=False):
+            for command in ("bench_ipam", "loadtest_claims"):
+                with self.assertRaisesMessage(CommandError, "--yes-i-mean-it"):
+                    call_command(command, stdout=StringIO(), stderr=StringIO())
+        self.assertTrue(Subnet.objects.filter(name="bench-prod").exists())
+
+    def test_bench_user_cannot_log_in_and_is_removed(self):
+        call_command("bench_ipam", "--prefixes", "28", "--fill", "0.5", "--iterations", "1", stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(get_user_model().objects.filter(username="bench").exists())
+        self.assertFalse(Subnet.objects.filter(name__startswith="bench-").exists())
+
+        user = bench_user()
+        self.assertFalse(user.has_usable_password())
+        self.assertFalse(user.is_staff)
+
+    def test_never_borrows_a_real_account(self):
+        get_user_model().objects.create_user("bench", password="hunter2")
+        with self.assertRaisesMessage(CommandError, "real account"):
+            call_command("bench_ipam", "--prefixes", "28", stdout=StringIO(), stderr=StringIO())
@@ -0,0 +1,22 @@
+from django.test import SimpleTestCase, override_settings
+
+from ipmanager.checks import shared_cache_check
+
+LOCMEM = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+FILE = {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": "/tmp/ipam-test-cache"}
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    @override_settings(DEBUG=False, IPAM_PROBE_CACHE="probes", CACHES={"default": FILE, "probes": LOCMEM})
+    def test_per_process_cache_warns_outside_debug(self):
+        warnings = shared_cache_check(None)
+        self.assertEqual([w.id for w in warnings], ["ipmanager.W001"])
+        self.assertIn('"probes"', warnings[0].msg)
+
+    @override_settings(DEBUG=True, IPAM_PROBE_CACHE="probes", CACHES={"default": LOCMEM, "probes": LOCMEM})
+    def test_debug_may_use_locmem(self):
+        self.assertEqual(shared_cache_check(None), [])
+
+    @override_settings(DEBUG=False, IPAM_PROBE_CACHE="probes", CACHES={"default": FILE, "probes": FILE})
+    def test_shared_caches_pass(self):
+        self.assertEqual(shared_cache_check(None), [])
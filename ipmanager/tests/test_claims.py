@@ -0,0 +1,231 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import PermissionDenied
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from ipmanager import services
+from ipmanager.filters import filter_allocations
+from ipmanager.models import IPAddressAllocation, Subnet, SubnetStats
+
+PENDING = IPAddressAllocation.Status.PENDING
+RELEASED = IPAddressAllocation.Status.RELEASED
+USED = IPAddressAllocation.Status.USED
+
+
+def _all_free(ips, **kwargs):
+    return {ip: False for ip in ips}
+
+
+@override_settings(IPAM_PROBE_TTL_USED=0, IPAM_PROBE_TTL_FREE=0, IPAM_RESERVATION_TTL=60)
+@mock.patch.object(services, "probe_many", _all_free)
+class ReservationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("alice")
+        self.subnet = Subnet.objects.create(name="lan", cidr="10.0.0.0/29")
+
+    def stats(self):
+        return SubnetStats.objects.get(subnet=self.subnet)
+
+    def test_first_free_claim_writes_nothing_while_probing(self):
+        seen = {}
+
+        def probe(ips, **kwargs):
+            seen["rows"] = IPAddressAllocation.objects.count()
+            return _all_free(ips)
+
+        with mock.patch.object(services, "probe_many", probe):
+            services.claim_first_free_ip(subnet_id=self.subnet.id, user=self.user)
+
+        self.assertEqual(seen, {"rows": 0})
+        self.assertEqual(list(IPAddressAllocation.objects.values_list("ip", "status")), [("10.0.0.1", USED)])
+        self.assertEqual((self.stats().used, self.stats().free), (1, 5))
+
+    def test_specific_claim_is_pending_and_uncounted_while_probing(self):
+        seen = {}
+
+        def probe(ips, **kwargs):
+            seen["statuses"] = set(IPAddressAllocation.objects.values_list("status", flat=True))
+            seen["listed"] = filter_allocations(IPAddressAllocation.objects.all()).count()
+            seen["used"] = self.stats().used
+            return _all_free(ips)
+
+        with mock.patch.object(services, "probe_many", probe):
+            alloc = services.claim_specific_ip(subnet_id=self.subnet.id, ip="10.0.0.4", user=self.user)
+
+        self.assertEqual(seen, {"statuses": {PENDING}, "listed": 0, "used": 0})
+        self.assertEqual((alloc.ip, alloc.status), ("10.0.0.4", USED))
+        self.assertEqual((self.stats().used, self.stats().free), (1, 5))
+
+    def test_first_free_claim_writes_one_row(self):
+        subnet = Subnet.objects.create(name="big", cidr="10.1.0.0/24")
+        with CaptureQueriesContext(connection) as ctx:
+            services.claim_first_free_ip(subnet_id=subnet.id, user=self.user)
+        writes = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith(("INSERT", "UPDATE", "DELETE"))]
+        self.assertEqual(len([w for w in writes if "ipaddressallocation" in w]), 2)
+        self.assertFalse(any(w.startswith("DELETE") for w in writes))
+        self.assertLess(len(ctx.captured_queries), 20)
+
+    def test_probe_failure_rolls_back(self):
+        def boom(ips, **kwargs):
+            raise RuntimeError("probe died")
+
+        with mock.patch.object(services, "probe_many", boom), self.assertRaises(RuntimeError):
+            services.claim_specific_ip(subnet_id=self.subnet.id, ip="10.0.0.3", user=self.user)
+        self.assertFalse(IPAddressAllocation.objects.exists())
+        self.assertEqual(self.stats().used, 0)
+
+    def test_abandoned_reservations_expire(self):
+        old = timezone.now() - timedelta(seconds=120)
+        created = IPAddressAllocation.objects.create(subnet=self.subnet, ip="10.0.0.1", owner=self.user, status=PENDING, claimed_at=old)
+        reused = IPAddressAllocation.objects.create(
+            subnet=self.subnet, ip="10.0.0.2", owner=self.user, status=PENDING, claimed_at=old, released_at=old,
+        )
+        fresh = IPAddressAllocation.objects.create(subnet=self.subnet, ip="10.0.0.3", owner=self.user, status=PENDING)
+
+        self.assertEqual(services.expire_reservations(self.subnet.id), 2)
+        self.assertFalse(IPAddressAllocation.objects.filter(id=created.id).exists())
+        self.assertEqual(IPAddressAllocation.objects.get(id=reused.id).status, RELEASED)
+        self.assertEqual(IPAddressAllocation.objects.get(id=fresh.id).status, PENDING)
+
+    def test_claim_reaps_before_searching(self):
+        IPAddressAllocation.objects.create(
+            subnet=self.subnet, ip="10.0.0.1", owner=self.user, status=PENDING,
+            claimed_at=timezone.now() - timedelta(seconds=120),
+        )
+        alloc = services.claim_specific_ip(subnet_id=self.subnet.id, ip="10.0.0.1", user=self.user)
+        self.assertEqual((alloc.ip, alloc.status), ("10.0.0.1", USED))
+
+    def test_reclaiming_a_released_row(self):
+        alloc = services.claim_first_free_ip(subnet_id=self.subnet.id, user=self.user, hostname="a")
+        services.release_allocation(alloc, released_by=self.user)
+        self.assertEqual((self.stats().used, self.stats().released), (0, 1))
+
+        again = services.claim_specific_ip(subnet_id=self.subnet.id, ip=alloc.ip, user=self.user, hostname="b")
+        row = IPAddressAllocation.objects.get(id=again.id)
+        self.assertEqual((row.id, row.status, row.hostname, row.released_at), (alloc.id, USED, "b", None))
+        self.assertEqual((self.stats().used, self.stats().released, self.stats().free), (1, 0, 5))
+
+
+@override_settings(IPAM_PROBE_TTL_USED=0, IPAM_PROBE_TTL_FREE=0, IPAM_STALE_DAYS=30)
+@mock.patch.object(services, "probe_many", _all_free)
+class StatsTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("alice")
+        self.subnet = Subnet.objects.create(name="lan", cidr="10.0.0.0/29")
+
+    def stats(self):
+        return SubnetStats.objects.get(subnet=self.subnet)
+
+    def counters(self):
+        s = self.stats()
+        return s.used, s.released, s.stale, s.free
+
+    def test_counters_follow_claims_and_releases(self):
+        allocs = services.claim_many(subnet_id=self.subnet.id, count=3, user=self.user)
+        self.assertEqual(self.counters(), (3, 0, 0, 3))
+        services.release_allocation(allocs[0], released_by=self.user)
+        self.assertEqual(self.counters(), (2, 1, 0, 4))
+        self.assertEqual(services.release_many(user=self.user, subnet_id=self.subnet.id), 2)
+        self.assertEqual(self.counters(), (0, 3, 0, 6))
+        services.rebuild_subnet_stats([self.subnet.id])
+        self.assertEqual(self.counters(), (0, 3, 0, 6))
+
+    def test_release_after_aging_never_goes_negative(self):
+        a, b = services.claim_many(subnet_id=self.subnet.id, count=2, user=self.user)
+        services.rebuild_subnet_stats([self.subnet.id])
+        # both age past the stale window without any write to the counters
+        IPAddressAllocation.objects.update(claimed_at=timezone.now() - timedelta(days=60))
+        a.refresh_from_db()
+        services.release_allocation(a, released_by=self.user)
+        services.release_many(user=self.user, ids=[b.id])
+        self.assertEqual(self.stats().stale, 0)
+        services.rebuild_subnet_stats([self.subnet.id])
+        self.assertEqual(self.counters(), (0, 2, 0, 6))
+
+    def test_rebuild_counts_stale(self):
+        services.claim_many(subnet_id=self.subnet.id, count=2, user=self.user)
+        IPAddressAllocation.objects.filter(ip="10.0.0.1").update(claimed_at=timezone.now() - timedelta(days=60))
+        services.rebuild_subnet_stats([self.subnet.id])
+        self.assertEqual(self.counters(), (2, 0, 1, 4))
+
+
+@override_settings(IPAM_PROBE_TTL_USED=0, IPAM_PROBE_TTL_FREE=0)
+@mock.patch.object(services, "probe_many", _all_free)
+class RaceTests(TestCase):
+    def setUp(self):
+        self.alice = get_user_model().objects.create_user("alice")
+        self.bob = get_user_model().objects.create_user("bob")
+        self.subnet = Subnet.objects.create(name="lan", cidr="10.0.0.0/29")
+
+    def stats(self):
+        s = SubnetStats.objects.get(subnet=self.subnet)
+        return s.used, s.released, s.free
+
+    def during_probe(self, action):
+        # run `action` once while the first probe is in flight, as another worker would
+        calls = []
+
+        def probe(ips, **kwargs):
+            if not calls:
+                calls.append(ips)
+                action()
+            return _all_free(ips)
+        return mock.patch.object(services, "probe_many", probe)
+
+    def test_concurrent_first_free_claims_get_different_addresses(self):
+        # bob claims while alice's window is being probed: she loses 10.0.0.1 and takes the next clean one
+        other = []
+        with self.during_probe(lambda: other.append(services.claim_first_free_ip(subnet_id=self.subnet.id, user=self.bob))):
+            mine = services.claim_first_free_ip(subnet_id=self.subnet.id, user=self.alice)
+        self.assertEqual((other[0].ip, mine.ip), ("10.0.0.1", "10.0.0.2"))
+        self.assertEqual(IPAddressAllocation.objects.filter(status=USED).count(), 2)
+        self.assertEqual(self.stats(), (2, 0, 4))
+
+    def test_specific_claim_of_a_reserved_address_fails(self):
+        other = []
+        with self.during_probe(lambda: other.append(
+            services.claim_specific_ip(subnet_id=self.subnet.id, ip="10.0.0.1", user=self.bob)
+        )):
+            mine = services.claim_specific_ip(subnet_id=self.subnet.id, ip="10.0.0.1", user=self.alice)
+        self.assertEqual((mine.owner_id, other), (self.alice.id, [None]))
+        self.assertEqual(self.stats(), (1, 0, 5))
+
+    def test_bulk_claim_picks_again_after_losing_an_address(self):
+        def steal():
+            IPAddressAllocation.objects.create(subnet=self.subnet, ip="10.0.0.1", owner=self.bob)
+
+        with self.during_probe(steal):
+            rows = services.claim_many(subnet_id=self.subnet.id, count=3, user=self.alice, hostnames=["a", "b", "c"])
+        self.assertEqual([r.ip for r in rows], ["10.0.0.2", "10.0.0.3", "10.0.0.4"])
+        self.assertEqual(IPAddressAllocation.objects.filter(owner=self.alice, status=USED).count(), 3)
+
+    def test_bulk_claim_is_all_or_nothing(self):
+        self.assertEqual(services.claim_many(subnet_id=self.subnet.id, count=7, user=self.alice), [])
+        self.assertFalse(IPAddressAllocation.objects.exists())
+        rows = services.claim_many(subnet_id=self.subnet.id, count=6, user=self.alice)
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(self.stats(), (6, 0, 0))
+
+    def test_double_release_counts_once(self):
+        alloc = services.claim_first_free_ip(subnet_id=self.subnet.id, user=self.alice)
+        services.release_allocation(alloc, released_by=self.alice)
+        services.release_allocation(IPAddressAllocation.objects.get(id=alloc.id), released_by=self.alice)
+        self.assertEqual(services.release_many(user=self.alice, ids=[alloc.id]), 0)
+        self.assertEqual(self.stats(), (0, 1, 6))
+
+    def test_release_many_permissions_and_filters(self):
+        mine = services.claim_many(subnet_id=self.subnet.id, count=2, user=self.alice, hostnames=["web-1", "db-1"])
+        theirs = services.claim_first_free_ip(subnet_id=self.subnet.id, user=self.bob, hostname="web-2")
+        with self.assertRaises(PermissionDenied):
+            services.release_many(user=self.alice, ids=[mine[0].id, theirs.id])
+        # filters are narrowed to the caller's own rows
+        self.assertEqual(services.release_many(user=self.alice, hostname_pattern="web-*"), 1)
+        self.assertEqual(IPAddressAllocation.objects.get(id=theirs.id).status, USED)
+        self.assertEqual(self.stats(), (2, 1, 4))
+        with self.assertRaises(ValueError):
+            services.release_many(user=self.alice)
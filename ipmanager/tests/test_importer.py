@@ -0,0 +1,46 @@
+import io
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+
+from ipmanager.importer import import_allocations, import_subnets, iter_records
+from ipmanager.models import IPAddressAllocation, Subnet, UserProfile
+
+
+class JsonRecordTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("alice")
+        Subnet.objects.create(name="lan", cidr="10.0.0.0/24")
+
+    def test_non_object_records_are_reported(self):
+        report = import_subnets(iter_records(io.StringIO("[1, 2]"), "json"))
+        self.assertEqual((report.written, report.failed), (0, 2))
+        self.assertEqual(report.errors[0], (1, "expected an object, got int"))
+
+    def test_bad_ndjson_line_does_not_abort_the_file(self):
+        text = (
+            '{"subnet": "lan", "ip": "10.0.0.5"}\n'
+            '{"subnet": "lan", "ip": \n'
+            '"just a string"\n'
+            '{"subnet": "lan", "ip": "10.0.0.6"}\n'
+        )
+        report = import_allocations(iter_records(io.StringIO(text), "ndjson"), default_owner=self.user)
+        self.assertEqual(report.written, 2)
+        self.assertEqual([line for line, _ in report.errors], [2, 3])
+        self.assertTrue(report.errors[0][1].startswith("invalid JSON"))
+        self.assertEqual(sorted(IPAddressAllocation.objects.values_list("ip", flat=True)), ["10.0.0.5", "10.0.0.6"])
+
+    def test_upload_view_reports_instead_of_crashing(self):
+        UserProfile.objects.filter(user=self.user).update(must_change_password=False)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        resp = self.client.post(reverse("import_data"), {
+            "kind": "allocations",
+            "format": "json",
+            "file": SimpleUploadedFile("a.json", b"[1, 2]"),
+        })
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.context["report"].failed, 2)
@@ -0,0 +1,87 @@
+import ipaddress
+
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase, TestCase
+
+from ipmanager.intervals import IntervalSet, parse_ranges
+from ipmanager.models import Subnet, SubnetLayout
+
+
+class IntervalSetTests(SimpleTestCase):
+    # overlapping, adjacent and reversed input: merged to [2-5], [8-8], [10-12]
+    s = IntervalSet([(4, 5), (2, 3), (10, 12), (8, 8), (11, 10), (3, 4)])
+    members = {2, 3, 4, 5, 8, 10, 11, 12}
+
+    def test_merging(self):
+        self.assertEqual(list(self.s), [(2, 5), (8, 8), (10, 12)])
+        self.assertEqual(self.s.size, 8)
+        self.assertFalse(IntervalSet())
+        self.assertEqual(IntervalSet.union(IntervalSet([(1, 2)]), IntervalSet([(3, 3)])), IntervalSet([(1, 3)]))
+
+    def test_count_within(self):
+        for lo in range(0, 15):
+            for hi in range(lo - 1, 15):
+                expected = sum(1 for n in range(lo, hi + 1) if n in self.members)
+                self.assertEqual(self.s.count_within(lo, hi), expected, (lo, hi))
+
+    def test_next_and_prev_outside(self):
+        for n in range(0, 15):
+            nxt = next(m for m in range(n, 20) if m not in self.members)
+            prev = next(m for m in range(n, -5, -1) if m not in self.members)
+            self.assertEqual((self.s.next_outside(n), self.s.prev_outside(n)), (nxt, prev), n)
+
+    def test_gaps(self):
+        self.assertEqual(list(self.s.gaps(0, 14)), [(0, 1), (6, 7), (9, 9), (13, 14)])
+        # bounds inside intervals, and a range with no gap at all
+        self.assertEqual(list(self.s.gaps(3, 11)), [(6, 7), (9, 9)])
+        self.assertEqual(list(self.s.gaps(2, 5)), [])
+        self.assertEqual(list(IntervalSet().gaps(1, 3)), [(1, 3)])
+        for lo in range(0, 15):
+            for hi in range(lo, 15):
+                free = [n for lo_, hi_ in self.s.gaps(lo, hi) for n in range(lo_, hi_ + 1)]
+                self.assertEqual(free, [n for n in range(lo, hi + 1) if n not in self.members], (lo, hi))
+
+    def test_clip(self):
+        self.assertEqual(list(self.s.clip(4, 10)), [(4, 5), (8, 8), (10, 10)])
+
+
+class ParseRangesTests(SimpleTestCase):
+    net = ipaddress.ip_network("10.0.0.0/24")
+
+    def test_entries_reaching_outside_are_clipped(self):
+        intervals, bad = parse_ranges("10.0.0.200-10.0.1.10, 10.0.0.0/16, 10.0.5.0/24", self.net)
+        base = int(self.net.network_address)
+        self.assertEqual(intervals, [(base + 200, base + 255), (base, base + 255)])
+        self.assertEqual(bad, ["10.0.0.200-10.0.1.10", "10.0.0.0/16", "10.0.5.0/24"])
+
+        intervals, bad = parse_ranges("10.0.0.200-10.0.1.10, 10.0.0.0/16, 10.0.5.0/24, 2001:db8::1", self.net, allow_partial=True)
+        self.assertEqual(intervals, [(base + 200, base + 255), (base, base + 255)])
+        self.assertEqual(bad, ["10.0.5.0/24", "2001:db8::1"])
+
+    def test_syntax(self):
+        intervals, bad = parse_ranges("10.0.0.5\n10.0.0.7 - 10.0.0.9, 10.0.0.9-10.0.0.3, bogus, 2001:db8::1", self.net)
+        base = int(self.net.network_address)
+        self.assertEqual(intervals, [(base + 5, base + 5), (base + 7, base + 9)])
+        self.assertEqual(bad, ["10.0.0.9-10.0.0.3", "bogus", "2001:db8::1"])
+
+    def test_layout_excludes_the_clipped_part(self):
+        layout = SubnetLayout.parse("10.0.0.0/24", None, "10.0.0.200-10.0.1.10")
+        self.assertEqual(layout.usable_count(), 199)
+        self.assertEqual(layout.last_usable(), int(ipaddress.ip_address("10.0.0.199")))
+
+        layout = SubnetLayout.parse("10.0.0.0/24", None, "10.0.0.0/16")
+        self.assertEqual(layout.usable_count(), 0)
+        self.assertIsNone(layout.first_usable())
+
+
+class ExcludedIpsValidationTests(TestCase):
+    def clean(self, excluded_ips):
+        Subnet(name="lan", cidr="10.0.0.0/24", excluded_ips=excluded_ips).full_clean()
+
+    def test_entries_must_overlap_the_subnet(self):
+        for entry in ("10.0.5.7", "10.0.1.0-10.0.1.9", "2001:db8::/64", "bogus"):
+            with self.assertRaisesMessage(ValidationError, entry):
+                self.clean(f"10.0.0.5, {entry}")
+
+    def test_partial_overlap_is_clipped(self):
+        self.clean("10.0.0.200-10.0.1.10, 10.0.0.0/16")
@@ -0,0 +1,151 @@
+import ipaddress
+import socket
+import struct
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from ipmanager import netprobe
+from ipmanager.netprobe import IcmpProber, NdpProber
+
+
+class FakeSocket:
+    """
+    Records what is sent; recvfrom() hands out the queued (packet, addr) pairs,
+    then waits out the timeout like an idle socket.
+    """
+
+    def __init__(self, replies=(), raw=False):
+        self.type = socket.SOCK_RAW if raw else socket.SOCK_DGRAM
+        self.replies = list(replies)
+        self.sent = []
+        self.timeout = None
+        self.closed = False
+
+    def sendto(self, packet, addr):
+        self.sent.append((packet, addr))
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def recvfrom(self, size):
+        if self.replies:
+            return self.replies.pop(0)
+        time.sleep(self.timeout)
+        raise socket.timeout
+
+    def close(self):
+        self.closed = True
+
+
+def echo_reply(ident, seq, icmp_type=netprobe.ICMP_ECHO_REPLY):
+    return struct.pack("!BBHHH", icmp_type, 0, 0, ident, seq) + b"ipmanager"
+
+
+def ipv4_header(ihl=5):
+    return bytes([0x40 | ihl]) + bytes(ihl * 4 - 1)
+
+
+class IcmpProberTests(SimpleTestCase):
+    def test_replies_are_matched_by_sequence_and_source(self):
+        sock = FakeSocket([
+            (echo_reply(999, 2), ("10.0.0.2", 0)),
+            # right sequence, wrong source
+            (echo_reply(999, 3), ("10.0.0.9", 0)),
+            (b"\x00\x00", ("10.0.0.1", 0)),
+        ])
+        alive = IcmpProber(sock).ping_many(["10.0.0.1", "10.0.0.2", "10.0.0.3"], timeout=0.05)
+        self.assertEqual(alive, {"10.0.0.1": False, "10.0.0.2": True, "10.0.0.3": False})
+        self.assertEqual([addr for _, addr in sock.sent], [("10.0.0.1", 0), ("10.0.0.2", 0), ("10.0.0.3", 0)])
+        # datagram sockets: the kernel rewrites ident, so it is not checked
+        self.assertEqual(struct.unpack("!BBHHH", sock.sent[0][0][:8])[4], 1)
+
+    def test_raw_socket_strips_the_ip_header_and_filters_ident(self):
+        prober = IcmpProber(FakeSocket(raw=True))
+        prober.sock.replies = [
+            # another pinger on the host, and our own request looping back
+            (ipv4_header() + echo_reply(prober.ident ^ 1, 1), ("10.0.0.1", 0)),
+            (ipv4_header() + echo_reply(prober.ident, 1, netprobe.ICMP_ECHO_REQUEST), ("10.0.0.1", 0)),
+            (ipv4_header(6) + echo_reply(prober.ident, 2), ("10.0.0.2", 0)),
+            (ipv4_header()[:10], ("10.0.0.1", 0)),
+        ]
+        self.assertEqual(prober.ping_many(["10.0.0.1", "10.0.0.2"], timeout=0.05), {"10.0.0.1": False, "10.0.0.2": True})
+
+    def test_timeout_is_honoured(self):
+        started = time.monotonic()
+        alive = IcmpProber(FakeSocket()).ping_many(["10.0.0.1"], timeout=0.1)
+        self.assertEqual(alive, {"10.0.0.1": False})
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_stops_once_everything_answered(self):
+        sock = FakeSocket([(echo_reply(1, 1), ("10.0.0.1", 0))])
+        started = time.monotonic()
+        self.assertEqual(IcmpProber(sock).ping_many(["10.0.0.1"], timeout=5), {"10.0.0.1": True})
+        self.assertLess(time.monotonic() - started, 1)
+
+    def test_ipv6_source_forms(self):
+        sock = FakeSocket([(echo_reply(1, 1, netprobe.ICMPV6_ECHO_REPLY), ("2001:DB8:0:0::7", 0, 0, 0))])
+        self.assertEqual(IcmpProber(sock, family=6).ping_many(["2001:db8::7"], timeout=0.05), {"2001:db8::7": True})
+
+
+def neighbor_advert(target, mac=b"\x01\x02\x03\x04\x05\x06"):
+    packet = struct.pack("!BBHI", netprobe.ICMPV6_NEIGHBOR_ADVERT, 0, 0, 0x60000000)
+    return packet + ipaddress.IPv6Address(target).packed + struct.pack("!BB", 2, 1) + mac
+
+
+class NdpProberTests(SimpleTestCase):
+    def prober(self, replies):
+        return NdpProber("lo", sock=FakeSocket(replies, raw=True))
+
+    def test_advertisements_are_parsed(self):
+        prober = self.prober([
+            # solicitation looping back, a stranger's advert, a truncated packet
+            (struct.pack("!BBHI", netprobe.ICMPV6_NEIGHBOR_SOLICIT, 0, 0, 0) + ipaddress.IPv6Address("2001:db8::5").packed, ("fe80::1", 0)),
+            (neighbor_advert("2001:db8::99"), ("fe80::99", 0)),
+            (neighbor_advert("2001:db8::5")[:20], ("fe80::5", 0)),
+            (neighbor_advert("2001:db8::5"), ("fe80::5", 0)),
+        ])
+        found = prober.solicit_many(["2001:db8::5", "2001:db8::6", "not-an-ip"], timeout=0.05)
+        self.assertEqual(found, {"2001:db8::5": "01:02:03:04:05:06"})
+
+        sent = prober.sock.sent
+        self.assertEqual([addr[0] for _, addr in sent], ["ff02::1:ff00:5", "ff02::1:ff00:6"])
+        self.assertEqual(sent[0][0][0], netprobe.ICMPV6_NEIGHBOR_SOLICIT)
+
+    def test_advert_without_lladdr_option(self):
+        packet = neighbor_advert("2001:db8::5")[:24]
+        found = self.prober([(packet, ("fe80::5", 0))]).solicit_many(["2001:db8::5"], timeout=0.05)
+        self.assertEqual(found, {"2001:db8::5": ""})
+
+
+@mock.patch.object(netprobe, "neigh_snapshot", lambda iface: {})
+@mock.patch.object(netprobe, "icmp_available", lambda family=4: True)
+@mock.patch.object(netprobe, "ndp_available", lambda: False)
+class ProbeManyTests(SimpleTestCase):
+    def test_echo_rounds_run_on_the_shared_pool(self):
+        threads = []
+
+        def round_(family, ips, timeout):
+            threads.append(threading.current_thread().name)
+            return {ip: ip.endswith("1") for ip in ips}
+
+        with mock.patch.object(netprobe, "_echo_round", round_):
+            out = netprobe.probe_many(["10.0.0.1", "10.0.0.2", "2001:db8::1"], "lo", timeout=0.1)
+        self.assertEqual(out, {"10.0.0.1": True, "10.0.0.2": False, "2001:db8::1": True})
+        self.assertTrue(all(name.startswith("netprobe") for name in threads))
+
+    def test_round_past_the_deadline_counts_as_in_use(self):
+        release = threading.Event()
+
+        def stuck(family, ips, timeout):
+            release.wait(2)
+            return dict.fromkeys(ips, False)
+
+        try:
+            with mock.patch.object(netprobe, "_echo_round", stuck):
+                out = netprobe.probe_many(["10.0.0.1"], "lo", timeout=0.05, deadline=0.1)
+        finally:
+            release.set()
+        self.assertEqual(out, {"10.0.0.1": True})
@@ -0,0 +1,107 @@
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+
+from ipmanager.models import IPAddressAllocation, Subnet
+from ipmanager.occupancy import first_free_hosts, iter_free_hosts
+
+
+class FirstFreeHostsTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("alice")
+
+    def subnet(self, cidr="10.0.0.0/24", **fields):
+        return Subnet.objects.create(name=cidr, cidr=cidr, **fields)
+
+    def use(self, subnet, *ips, status=IPAddressAllocation.Status.USED):
+        for ip in ips:
+            IPAddressAllocation.objects.create(subnet=subnet, ip=ip, owner=self.user, status=status)
+
+    def test_edge_gaps(self):
+        subnet = self.subnet()
+        self.assertEqual(first_free_hosts(subnet, limit=2), ["10.0.0.1", "10.0.0.2"])
+        self.use(subnet, "10.0.0.1", "10.0.0.2", "10.0.0.4")
+        self.assertEqual(first_free_hosts(subnet, limit=3), ["10.0.0.3", "10.0.0.5", "10.0.0.6"])
+        self.assertEqual(first_free_hosts(subnet, limit=2, after="10.0.0.252"), ["10.0.0.253", "10.0.0.254"])
+        self.assertEqual(first_free_hosts(subnet, limit=2, after="10.0.0.254"), [])
+
+    def test_released_is_free_and_pending_is_taken(self):
+        subnet = self.subnet()
+        self.use(subnet, "10.0.0.1", status=IPAddressAllocation.Status.RELEASED)
+        self.use(subnet, "10.0.0.2", status=IPAddressAllocation.Status.PENDING)
+        self.assertEqual(first_free_hosts(subnet, limit=2), ["10.0.0.1", "10.0.0.3"])
+
+    def test_excluded_ranges_cost_one_query(self):
+        # every other host excluded, every remaining one used: the answer is "none"
+        excluded = ",".join(f"10.0.0.{n}" for n in range(2, 255, 2))
+        subnet = self.subnet(excluded_ips=excluded)
+        self.use(subnet, *(f"10.0.0.{n}" for n in range(1, 255, 2)))
+        subnet = Subnet.objects.get(id=subnet.id)
+        subnet.layout
+        with self.assertNumQueries(1):
+            self.assertEqual(first_free_hosts(subnet, limit=16), [])
+
+    def test_used_row_inside_an_excluded_range(self):
+        # claimed before the range was reserved: must not reopen the rest of the range
+        subnet = self.subnet(excluded_ips="10.0.0.1-10.0.0.20")
+        self.use(subnet, "10.0.0.5")
+        self.assertEqual(first_free_hosts(subnet, limit=2), ["10.0.0.21", "10.0.0.22"])
+
+    @skipUnless(connection.vendor == "postgresql", "PostgreSQL only")
+    def test_gap_query_on_postgresql(self):
+        # a /8 with its low half excluded: the gap query must not walk the address space
+        subnet = self.subnet("10.0.0.0/8", excluded_ips="10.0.0.1-10.127.255.255")
+        self.use(subnet, "10.128.0.0", "10.128.0.2", "10.200.0.1")
+        subnet = Subnet.objects.get(id=subnet.id)
+        subnet.layout
+        with self.assertNumQueries(1):
+            self.assertEqual(first_free_hosts(subnet, limit=3), ["10.128.0.1", "10.128.0.3", "10.128.0.4"])
+        self.assertEqual(first_free_hosts(subnet, limit=1, after="10.200.0.0"), ["10.200.0.2"])
+
+    def test_iter_free_hosts_walks_past_pools(self):
+        subnet = self.subnet("10.0.0.0/28", reserved_pools="dhcp = 10.0.0.3-10.0.0.12")
+        self.use(subnet, "10.0.0.1")
+        self.assertEqual(list(iter_free_hosts(subnet, batch=2)), ["10.0.0.2", "10.0.0.13", "10.0.0.14"])
+
+
+class SparseFreeHostsTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("alice")
+
+    def subnet(self, cidr="2001:db8::/64", **fields):
+        return Subnet.objects.create(name=cidr, cidr=cidr, **fields)
+
+    def use(self, subnet, *ips):
+        for ip in ips:
+            IPAddressAllocation.objects.create(subnet=subnet, ip=ip, owner=self.user)
+
+    def test_sequential_seeks_in_pages(self):
+        subnet = self.subnet(excluded_ips="2001:db8::8-2001:db8::f")
+        # text order would put ::10 before ::2; the hex key keeps numeric order
+        self.use(subnet, "2001:db8::1", "2001:db8::2", "2001:db8::3", "2001:db8::5", "2001:db8::10", "2001:db8::9")
+        with mock.patch("ipmanager.occupancy.SEEK_PAGE", 2):
+            self.assertEqual(
+                first_free_hosts(subnet, limit=4),
+                ["2001:db8::4", "2001:db8::6", "2001:db8::7", "2001:db8::11"],
+            )
+            self.assertEqual(first_free_hosts(subnet, limit=2, after="2001:db8::7"), ["2001:db8::11", "2001:db8::12"])
+
+    def test_sequential_reads_only_what_it_walks(self):
+        subnet = self.subnet()
+        self.use(subnet, "2001:db8::1", *(f"2001:db8::1:{n:x}" for n in range(50)))
+        with self.assertNumQueries(1):
+            self.assertEqual(first_free_hosts(subnet, limit=1), ["2001:db8::2"])
+
+    def test_random_and_eui64_check_only_their_picks(self):
+        subnet = self.subnet("2001:db8::/126", allocation_strategy=Subnet.Strategy.RANDOM)
+        self.use(subnet, "2001:db8::1")
+        # /126: only ::1-::3 are hosts; whatever the draws miss is topped up lowest-first
+        self.assertEqual(sorted(first_free_hosts(subnet, limit=4)), ["2001:db8::2", "2001:db8::3"])
+
+        subnet = self.subnet("2001:db8:1::/64", allocation_strategy=Subnet.Strategy.EUI64)
+        mac = "52:54:00:aa:bb:cc"
+        self.assertEqual(first_free_hosts(subnet, mac=mac), ["2001:db8:1:0:5054:ff:feaa:bbcc"])
+        self.use(subnet, "2001:db8:1:0:5054:ff:feaa:bbcc")
+        self.assertEqual(first_free_hosts(subnet, mac=mac), [])
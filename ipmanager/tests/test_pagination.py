@@ -0,0 +1,15 @@
+from datetime import datetime, timezone
+
+from django.test import SimpleTestCase
+
+from ipmanager.pagination import decode_cursor, encode_cursor
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        row = {"claimed_at": datetime(2026, 1, 2, 3, 4, 5, 678901, tzinfo=timezone.utc), "id": 42}
+        self.assertEqual(decode_cursor(encode_cursor(row)), (row["claimed_at"], 42))
+
+    def test_garbage_is_ignored(self):
+        for raw in (None, "", "abc", "1.2.3", "1.x", "99999999999999999999.1", "-99999999999999999999.1"):
+            self.assertIsNone(decode_cursor(raw), raw)
@@ -0,0 +1,157 @@
+import io
+import ipaddress
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from ipmanager import services
+from ipmanager.importer import import_subnets, iter_records
+from ipmanager.models import IPAddressAllocation, Subnet, UserProfile
+from ipmanager.prefixtrie import PrefixTrie
+from ipmanager.supernets import invalidate_subnet_tries, overlapping_trie, subnet_for_ip, subnet_tries
+
+
+def _all_free(ips, **kwargs):
+    return {ip: False for ip in ips}
+
+
+@override_settings(IPAM_PROBE_TTL_USED=0, IPAM_PROBE_TTL_FREE=0)
+@mock.patch.object(services, "probe_many", _all_free)
+class SupernetClaimTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("alice")
+        self.site = Subnet.objects.create(name="site", cidr="10.9.0.0/23", is_supernet=True)
+        self.child = Subnet.objects.create(name="child", cidr="10.9.0.0/24")
+
+    def test_supernet_is_not_claimable(self):
+        self.assertIsNone(services.claim_first_free_ip(subnet_id=self.site.id, user=self.user))
+        self.assertIsNone(services.claim_specific_ip(subnet_id=self.site.id, ip="10.9.1.5", user=self.user))
+        self.assertEqual(services.claim_many(subnet_id=self.site.id, count=2, user=self.user), [])
+        self.assertIsNone(services.find_free_ip(self.site))
+        self.assertFalse(IPAddressAllocation.objects.filter(subnet=self.site).exists())
+
+    def test_child_hands_out_each_address_once(self):
+        first = services.claim_first_free_ip(subnet_id=self.child.id, user=self.user)
+        self.assertEqual(first.ip, "10.9.0.1")
+        services.claim_first_free_ip(subnet_id=self.site.id, user=self.user)
+        self.assertEqual(IPAddressAllocation.objects.filter(ip="10.9.0.1").count(), 1)
+
+    def test_supernet_is_not_swept_or_reconciled(self):
+        with mock.patch.object(services, "discover") as discover:
+            self.assertEqual(services.sweep_subnet(self.site), 0)
+        discover.assert_not_called()
+        staff = get_user_model().objects.create_user("admin", is_staff=True)
+        UserProfile.objects.filter(user=staff).update(must_change_password=False)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get(reverse("reconcile_report", args=[self.site.id])).status_code, 404)
+
+    def test_subnet_with_claims_cannot_become_supernet(self):
+        other = Subnet.objects.create(name="other", cidr="10.8.0.0/24")
+        services.claim_first_free_ip(subnet_id=other.id, user=self.user)
+        other.is_supernet = True
+        with self.assertRaises(ValidationError):
+            other.full_clean()
+
+
+class PrefixTrieTests(SimpleTestCase):
+    def setUp(self):
+        self.trie = PrefixTrie(32)
+        for cidr in ("10.0.0.0/8", "10.1.0.0/16", "10.1.2.0/24", "10.2.0.0/16"):
+            self.trie.insert(ipaddress.ip_network(cidr), cidr)
+
+    def test_longest_match(self):
+        match = lambda ip: self.trie.longest_match(int(ipaddress.ip_address(ip)))
+        self.assertEqual(match("10.1.2.3"), "10.1.2.0/24")
+        self.assertEqual(match("10.1.3.3"), "10.1.0.0/16")
+        self.assertEqual(match("10.200.0.1"), "10.0.0.0/8")
+        self.assertIsNone(match("11.0.0.1"))
+
+    def test_covering_and_inside(self):
+        net = ipaddress.ip_network("10.1.2.0/24")
+        self.assertEqual(self.trie.covering(net), ["10.0.0.0/8", "10.1.0.0/16"])
+        self.assertEqual(list(self.trie.inside(ipaddress.ip_network("10.0.0.0/8"))), ["10.1.0.0/16", "10.1.2.0/24", "10.2.0.0/16"])
+
+    def test_first_free(self):
+        self.assertEqual(str(self.trie.first_free(ipaddress.ip_network("10.0.0.0/8"), 16)), "10.0.0.0/16")
+        self.assertEqual(str(self.trie.first_free(ipaddress.ip_network("10.1.0.0/16"), 23)), "10.1.0.0/23")
+        self.assertEqual(str(self.trie.first_free(ipaddress.ip_network("10.1.0.0/16"), 22)), "10.1.4.0/22")
+
+    def test_remove_prunes(self):
+        self.trie.remove(ipaddress.ip_network("10.1.2.0/24"))
+        self.assertEqual(len(self.trie), 3)
+        self.assertEqual(list(self.trie.inside(ipaddress.ip_network("10.1.0.0/16"))), [])
+        self.assertEqual(str(self.trie.first_free(ipaddress.ip_network("10.1.0.0/16"), 24)), "10.1.0.0/24")
+
+
+class HierarchyTests(TestCase):
+    def setUp(self):
+        invalidate_subnet_tries()
+
+    def check(self, **fields):
+        subnet = Subnet(**fields)
+        subnet.full_clean()
+        return subnet
+
+    def test_overlaps_are_checked_against_the_db(self):
+        # load the per-process trie first, then write behind its back (another worker)
+        subnet_tries()
+        Subnet.objects.create(name="a", cidr="10.60.0.0/24")
+        with self.assertRaisesMessage(ValidationError, "already used"):
+            self.check(name="dup", cidr="10.60.0.0/24")
+        with self.assertRaisesMessage(ValidationError, "only supernets"):
+            self.check(name="inner", cidr="10.60.0.0/25")
+        with self.assertRaisesMessage(ValidationError, "mark this subnet as a supernet"):
+            self.check(name="outer", cidr="10.60.0.0/16")
+        self.check(name="site", cidr="10.60.0.0/16", is_supernet=True)
+
+    def test_overlap_check_reads_only_overlapping_rows(self):
+        Subnet.objects.create(name="site", cidr="10.60.0.0/16", is_supernet=True)
+        Subnet.objects.create(name="a", cidr="10.60.1.0/24")
+        Subnet.objects.create(name="far", cidr="10.99.0.0/24")
+        # same bound keys as 10.60.1.0/24, other family
+        Subnet.objects.create(name="v6", cidr="::a3c:100/120")
+        net = ipaddress.ip_network("10.60.0.0/20")
+        self.assertEqual(sorted(e.name for e in overlapping_trie(net).covering(net)), ["site"])
+        self.assertEqual([e.name for e in overlapping_trie(net).inside(net)], ["a"])
+        with self.assertNumQueries(1):
+            subnet = Subnet(name="b", cidr="10.60.2.0/24")
+            subnet.clean_fields()
+            subnet.clean()
+        self.assertEqual(subnet.parent_id, Subnet.objects.get(name="site").id)
+
+    def test_parent_links_follow_commits(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            site = Subnet.objects.create(name="site", cidr="10.70.0.0/16", is_supernet=True)
+            child = Subnet.objects.create(name="child", cidr="10.70.1.0/24")
+        child.refresh_from_db()
+        self.assertEqual(child.parent_id, site.id)
+        self.assertEqual(subnet_for_ip("10.70.1.9").id, child.id)
+        self.assertEqual(subnet_for_ip("10.70.9.9").id, site.id)
+
+    def test_uncommitted_save_leaves_the_trie_alone(self):
+        subnet_tries()
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            Subnet.objects.create(name="x", cidr="10.80.0.0/24")
+        self.assertIsNone(subnet_for_ip("10.80.0.1"))
+        self.assertEqual(len(callbacks), 1)
+
+    def test_import_checks_rows_against_each_other(self):
+        Subnet.objects.create(name="kept", cidr="10.61.0.0/24")
+        csv_text = (
+            "name,cidr\n"
+            "a,10.60.0.0/24\n"
+            "b,10.60.0.0/25\n"
+            "kept,10.61.0.0/24\n"
+            "c,10.61.0.128/25\n"
+        )
+        report = import_subnets(iter_records(io.StringIO(csv_text), "csv"))
+        self.assertEqual(report.written, 2)
+        self.assertEqual([line for line, _ in report.errors], [3, 5])
+        self.assertFalse(Subnet.objects.filter(name__in=["b", "c"]).exists())
+        self.assertEqual(
+            Subnet.objects.filter(name="a").values_list("net_start", "net_end").get(),
+            (f"{0x0a3c0000:032x}", f"{0x0a3c00ff:032x}"),
+        )
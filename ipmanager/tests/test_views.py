@@ -0,0 +1,104 @@
+import json
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ipmanager import services
+from ipmanager.models import DiscoveredHost, IPAddressAllocation, Subnet, UserProfile, ip6_key
+from ipmanager.reconcile import reconcile_subnet
+
+
+def _login(client, username, **fields):
+    user = get_user_model().objects.create_user(username, **fields)
+    UserProfile.objects.filter(user=user).update(must_change_password=False)
+    client.force_login(user)
+    return user
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.subnet = Subnet.objects.create(name="lan", cidr="10.0.0.0/24")
+        self.url = reverse("export_allocations")
+
+    def test_non_staff_needs_a_subnet_and_no_stale_filter(self):
+        user = _login(self.client, "alice")
+        IPAddressAllocation.objects.create(subnet=self.subnet, ip="10.0.0.5", owner=user)
+        sid = str(self.subnet.id)
+
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(self.url, {"subnet": sid, "stale": "1"}).status_code, 403)
+        resp = self.client.get(self.url, {"subnet": sid})
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn("10.0.0.5", b"".join(resp.streaming_content).decode())
+
+    def test_ipv6_rows_come_in_address_order(self):
+        user = _login(self.client, "root", is_staff=True)
+        subnet = Subnet.objects.create(name="v6", cidr="2001:db8::/64")
+        # text order would be ::10, ::9, ::a
+        ips = ["2001:db8::a", "2001:db8::10", "2001:db8::9"]
+        for ip in ips:
+            IPAddressAllocation.objects.create(subnet=subnet, ip=ip, owner=user)
+            DiscoveredHost.objects.create(subnet=subnet, ip=ip, ip6_key=ip6_key(ip))
+        expected = ["2001:db8::9", "2001:db8::a", "2001:db8::10"]
+
+        resp = self.client.get(self.url, {"subnet": str(subnet.id), "format": "ndjson"})
+        lines = b"".join(resp.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)["ip"] for line in lines], expected)
+        self.assertEqual([row[1] for row in reconcile_subnet(subnet).rows()], expected)
+
+    def test_staff_may_export_everything(self):
+        _login(self.client, "root", is_staff=True)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.client.get(self.url, {"stale": "1", "format": "ndjson"}).status_code, 200)
+
+
+@override_settings(IPAM_PROBE_TTL_USED=0, IPAM_PROBE_TTL_FREE=0)
+@mock.patch.object(services, "probe_many", lambda ips, **kwargs: dict.fromkeys(ips, False))
+class ClaimManyTests(TestCase):
+    def setUp(self):
+        _login(self.client, "alice")
+        self.subnet = Subnet.objects.create(name="lan", cidr="10.0.0.0/24")
+        self.url = reverse("claim_many_ips", args=[self.subnet.id])
+
+    def post(self, payload):
+        return self.client.post(self.url, json.dumps(payload), content_type="application/json")
+
+    def test_count_must_be_a_json_integer(self):
+        for count in (True, 2.9, 2.0, "2", None, [2]):
+            resp = self.post({"count": count})
+            self.assertEqual(resp.status_code, 400, count)
+            self.assertEqual(resp.json(), {"error": "count must be an integer."})
+        self.assertFalse(IPAddressAllocation.objects.exists())
+
+    def test_count_defaults_to_the_hostnames(self):
+        resp = self.post({"hostnames": ["a", "b"]})
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual([a["hostname"] for a in resp.json()["allocations"]], ["a", "b"])
+        self.assertEqual(self.post({"count": 0}).status_code, 400)
+        self.assertEqual(self.post({"count": 3, "hostnames": ["a"]}).status_code, 400)
+
+
+class ReleaseManyTests(TestCase):
+    def setUp(self):
+        self.user = _login(self.client, "alice")
+        self.subnet = Subnet.objects.create(name="lan", cidr="10.0.0.0/24")
+        self.alloc = IPAddressAllocation.objects.create(subnet=self.subnet, ip="10.0.0.1", owner=self.user)
+
+    def post(self, payload):
+        return self.client.post(reverse("release_many_ips"), json.dumps(payload), content_type="application/json")
+
+    def test_ids_and_subnet_must_be_json_integers(self):
+        for ids in ([True], [1.0], ["1"], 1):
+            resp = self.post({"ids": ids})
+            self.assertEqual(resp.status_code, 400, ids)
+            self.assertEqual(resp.json(), {"error": "ids must be a list of integers."})
+        for subnet in (True, "1"):
+            self.assertEqual(self.post({"subnet": subnet}).status_code, 400, subnet)
+        self.assertEqual(IPAddressAllocation.objects.get(id=self.alloc.id).status, IPAddressAllocation.Status.USED)
+
+    def test_release_by_id(self):
+        resp = self.post({"ids": [self.alloc.id]})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(IPAddressAllocation.objects.get(id=self.alloc.id).status, IPAddressAllocation.Status.RELEASED)
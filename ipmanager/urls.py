@@ -5,6 +5,15 @@ urlpatterns = [
     path("", views.subnet_list, name="subnet_list"),
     path("subnets/<int:subnet_id>/", views.subnet_detail, name="subnet_detail"),
     path("subnets/<int:subnet_id>/claim/", views.claim_ip, name="claim_ip"),
+    path("subnets/<int:subnet_id>/claim-many/", views.claim_many_ips, name="claim_many_ips"),
+    path("subnets/<int:subnet_id>/release/", views.release_selected, name="release_selected"),
     path("allocations/<int:allocation_id>/release/", views.release_ip, name="release_ip"),
+    path("allocations/release-many/", views.release_many_ips, name="release_many_ips"),
      path("subnets/<int:subnet_id>/stale.csv", views.stale_csv, name="stale_csv"),
+    path("subnets/<int:subnet_id>/reconcile/", views.reconcile_report, name="reconcile_report"),
+    path("subnets/<int:subnet_id>/reconcile.csv", views.reconcile_csv, name="reconcile_csv"),
+    path("import/", views.import_data, name="import_data"),
+    path("export/allocations/", views.export_allocations, name="export_allocations"),
+    path("metrics/", views.metrics_view, name="metrics"),
+    path("api/v1/", include("ipmanager.api_urls")),
 ]
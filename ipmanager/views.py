@@ -1,32 +1,81 @@
-from datetime import timedelta
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
 import csv
+import json
+from django.conf import settings
 from django.contrib import messages
+from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-from django.http import HttpResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
 from django.views.decorators.http import require_POST
 from django.core.exceptions import PermissionDenied
-from .forms import ClaimForm
-from .models import IPAddressAllocation, Subnet
-from .services import claim_first_free_ip, claim_specific_ip,release_allocation, find_free_ip
+from django.utils.crypto import constant_time_compare
+from . import metrics
+from .filters import filter_allocations
+from .forms import ClaimForm, ImportForm
+from .importer import import_allocations, import_subnets, iter_records, open_text
+from .pagination import keyset_page
+from .reconcile import last_sweep, reconcile_subnet, reconcile_window_hours
+from .models import IPAddressAllocation, Subnet, exact_free
+from .services import (
+    claim_first_free_ip,
+    claim_many,
+    claim_specific_ip,
+    find_free_ip,
+    rebuild_subnet_stats,
+    release_allocation,
+    release_many,
+    stale_window_days,
+)
+
+
+User = get_user_model()
+
+PAGE_SIZES = (25, 50, 100, 250)
+DEFAULT_PAGE_SIZE = 50
+
+
+def _page_size(request) -> int:
+    try:
+        size = int(request.GET.get("per_page") or DEFAULT_PAGE_SIZE)
+    except ValueError:
+        return DEFAULT_PAGE_SIZE
+    return size if size in PAGE_SIZES else DEFAULT_PAGE_SIZE
+
+
+def _query_with(request, **changes) -> str:
+    """
+    Current query string with some params replaced (None drops the param).
+    """
+    params = request.GET.copy()
+    for key, value in changes.items():
+        if value is None:
+            params.pop(key, None)
+        else:
+            params[key] = value
+    return "?" + urlencode(params, doseq=True) if params else "?"
 
 
 @login_required
 def subnet_list(request):
-    subnets = Subnet.objects.filter(is_active=True).order_by("name")
+    qs = Subnet.objects.filter(is_active=True).select_related("stats").order_by("name")
+    subnets = list(qs)
+
+    # counters are maintained on claim/release; only subnets never counted need a rebuild
+    missing = [s.id for s in subnets if not hasattr(s, "stats")]
+    if missing:
+        rebuild_subnet_stats(missing)
+        subnets = list(qs.all())
 
     rows = []
     for s in subnets:
-        used_count = IPAddressAllocation.objects.filter(
-            subnet=s, status=IPAddressAllocation.Status.USED
-        ).count()
+        used_count = s.stats.used
 
-        # /23-/24 is small: OK to compute in memory
-        candidates = [str(ip) for ip in s.network.hosts() if str(ip) not in s.excluded_set]
-        usable_count = len(candidates)
-        free_count = max(usable_count - used_count, 0)
+        # arithmetic on the parsed layout, no per-host iteration (a /64 costs the same as a /24)
+        usable_count = s.usable_count()
+        free_count = exact_free(s.stats.free, usable_count, used_count)
 
         first_ip, last_ip = s.usable_range()
 
@@ -42,9 +91,34 @@ def subnet_list(request):
     return render(request, "ipmanager/subnet_list.html", {"rows": rows})
 
 
+@login_required
+def import_data(request):
+    """
+    Staff upload of a subnets/allocations file (same columns as the export); rows are upserted in batches.
+    """
+    if not request.user.is_staff:
+        raise PermissionDenied
+
+    report = None
+    form = ImportForm(request.POST or None, request.FILES or None)
+    if request.method == "POST" and form.is_valid():
+        records = iter_records(open_text(form.cleaned_data["file"].file), form.cleaned_data["format"])
+        try:
+            if form.cleaned_data["kind"] == "subnets":
+                report = import_subnets(records)
+            else:
+                report = import_allocations(records, default_owner=request.user)
+        except (ValueError, UnicodeDecodeError) as e:
+            messages.error(request, f"Could not parse the file: {e}")
+        else:
+            messages.success(request, f"Imported {report.written} row(s), {report.failed} rejected.")
+
+    return render(request, "ipmanager/import.html", {"form": form, "report": report})
+
+
 @login_required
 def subnet_detail(request, subnet_id: int):
-    subnet = get_object_or_404(Subnet, id=subnet_id, is_active=True)
+    subnet = get_object_or_404(Subnet.objects.select_related("parent"), id=subnet_id, is_active=True)
 
     # filters
     q = (request.GET.get("q") or "").strip()
@@ -52,43 +126,34 @@ def subnet_detail(request, subnet_id: int):
     used_only = request.GET.get("used") == "1"
     stale_only = request.GET.get("stale") == "1"
 
-    stale_days = 30
+    stale_days = stale_window_days()
     stale_cutoff = timezone.now() - timedelta(days=stale_days)
 
     first_ip, last_ip = subnet.usable_range()
 
-    allocations = IPAddressAllocation.objects.filter(subnet=subnet).select_related("owner")
-
-    if q:
-        allocations = allocations.filter(
-            Q(ip__icontains=q) |
-            Q(owner__username__icontains=q) |
-            Q(hostname__icontains=q) |
-            Q(description__icontains=q)
-        )
-
-    if mine:
-        allocations = allocations.filter(owner=request.user)
-
-    if used_only:
-        allocations = allocations.filter(status=IPAddressAllocation.Status.USED)
-
-    if stale_only:
-        allocations = allocations.filter(
-            status=IPAddressAllocation.Status.USED,
-            claimed_at__lte=stale_cutoff
-        )
+    allocations = filter_allocations(
+        IPAddressAllocation.objects.filter(subnet=subnet).select_related("owner"),
+        q=q,
+        owner=request.user if mine else None,
+        used_only=used_only,
+        stale_cutoff=stale_cutoff if stale_only else None,
+    )
 
-    allocations = allocations.order_by("-claimed_at")
+    # keyset pages: newest first for the main table, oldest first for the stale report
+    per_page = _page_size(request)
+    cursor = request.GET.get("after")
+    allocations, next_cursor = keyset_page(allocations, cursor, per_page, descending=True)
 
     # stale list for admin section + banner count
-    stale_allocations = IPAddressAllocation.objects.filter(
+    stale_qs = IPAddressAllocation.objects.filter(
         subnet=subnet,
         status=IPAddressAllocation.Status.USED,
         claimed_at__lte=stale_cutoff
-    ).select_related("owner").order_by("claimed_at")
+    ).select_related("owner")
 
-    stale_count = stale_allocations.count()
+    stale_count = stale_qs.count()
+    stale_cursor = request.GET.get("stale_after")
+    stale_allocations, stale_next_cursor = keyset_page(stale_qs, stale_cursor, per_page, descending=False)
 
     # Free-IP check (IMPORTANT: find_free_ip must include ip_in_use() gate)
     free_ip = None
@@ -113,8 +178,16 @@ def subnet_detail(request, subnet_id: int):
             "stale_cutoff": stale_cutoff,
             "stale_count": stale_count,
             "stale_allocations": stale_allocations,
+            "per_page": per_page,
+            "page_sizes": PAGE_SIZES,
+            "next_url": _query_with(request, after=next_cursor) if next_cursor else None,
+            "first_url": _query_with(request, after=None) if cursor else None,
+            "stale_next_url": _query_with(request, stale_after=stale_next_cursor) if stale_next_cursor else None,
+            "stale_first_url": _query_with(request, stale_after=None) if stale_cursor else None,
+            "export_query": _query_with(request, after=None, stale_after=None, per_page=None, check_free=None, subnet=str(subnet.id)),
             "free_ip": free_ip,
             "form": form,
+            "children": subnet.children.filter(is_active=True).order_by("cidr") if subnet.is_supernet else [],
         },
     )
 
@@ -129,9 +202,14 @@ def claim_ip(request, subnet_id: int):
         messages.error(request, "Please fix the form errors.")
         return redirect("subnet_detail", subnet_id=subnet.id)
 
+    if subnet.is_supernet:
+        messages.error(request, f"{subnet.name} is a supernet; claim from one of its subnets.")
+        return redirect("subnet_detail", subnet_id=subnet.id)
+
     requested_ip = (form.cleaned_data.get("requested_ip") or "").strip()
     hostname = (form.cleaned_data.get("hostname") or "").strip()
     description = (form.cleaned_data.get("description") or "").strip()
+    mac = (form.cleaned_data.get("mac") or "").strip()
 
     if requested_ip:
         alloc = claim_specific_ip(
@@ -151,6 +229,7 @@ def claim_ip(request, subnet_id: int):
             user=request.user,
             hostname=hostname,
             description=description,
+            mac=mac,
         )
         if alloc:
             messages.success(request, f"Claimed {alloc.ip}.")
@@ -159,6 +238,55 @@ def claim_ip(request, subnet_id: int):
 
     return redirect("subnet_detail", subnet_id=subnet.id)
 
+@login_required
+@require_POST
+def claim_many_ips(request, subnet_id: int):
+    """
+    JSON bulk claim: {"count": N, "hostnames": [...], "description": "..."}.
+    """
+    subnet = get_object_or_404(Subnet, id=subnet_id, is_active=True)
+    if subnet.is_supernet:
+        return JsonResponse({"error": f"{subnet.name} is a supernet; claim from one of its subnets."}, status=409)
+
+    try:
+        payload = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "Body must be JSON."}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({"error": "Body must be a JSON object."}, status=400)
+
+    hostnames = payload.get("hostnames") or []
+    if not isinstance(hostnames, list) or not all(isinstance(h, str) for h in hostnames):
+        return JsonResponse({"error": "hostnames must be a list of strings."}, status=400)
+    # JSON integers only: int() would also take true, 2.9 or "3"
+    count = payload.get("count", len(hostnames))
+    if not isinstance(count, int) or isinstance(count, bool):
+        return JsonResponse({"error": "count must be an integer."}, status=400)
+
+    max_count = int(getattr(settings, "IPAM_BULK_CLAIM_MAX", 1000))
+    if not 1 <= count <= max_count:
+        return JsonResponse({"error": f"count must be between 1 and {max_count}."}, status=400)
+    if hostnames and len(hostnames) != count:
+        return JsonResponse({"error": "hostnames must have exactly one entry per address."}, status=400)
+
+    allocations = claim_many(
+        subnet_id=subnet.id,
+        count=count,
+        user=request.user,
+        hostnames=[h.strip() for h in hostnames],
+        description=str(payload.get("description") or "").strip(),
+    )
+    if not allocations:
+        return JsonResponse({"error": f"Could not claim {count} free IP(s) in {subnet.name}."}, status=409)
+
+    return JsonResponse(
+        {
+            "subnet": subnet.id,
+            "allocations": [{"id": a.id, "ip": a.ip, "hostname": a.hostname} for a in allocations],
+        },
+        status=201,
+    )
+
 @login_required
 @require_POST
 def release_ip(request, allocation_id: int):
@@ -172,6 +300,146 @@ def release_ip(request, allocation_id: int):
     return redirect("subnet_detail", subnet_id=allocation.subnet_id)
 
 
+@login_required
+@require_POST
+def release_selected(request, subnet_id: int):
+    """
+    Multi-select release from subnet_detail.
+    """
+    subnet = get_object_or_404(Subnet, id=subnet_id, is_active=True)
+    try:
+        ids = [int(pk) for pk in request.POST.getlist("ids")]
+    except ValueError:
+        ids = []
+
+    if not ids:
+        messages.error(request, "Select at least one allocation to release.")
+        return redirect("subnet_detail", subnet_id=subnet.id)
+
+    count = release_many(user=request.user, ids=ids, subnet_id=subnet.id)
+    messages.success(request, f"Released {count} IP(s).")
+    return redirect("subnet_detail", subnet_id=subnet.id)
+
+
+@login_required
+@require_POST
+def release_many_ips(request):
+    """
+    JSON bulk release: {"ids": [...]} and/or filters {"subnet": id, "owner": "username", "hostname": "rack12-*"}.
+    """
+    try:
+        payload = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "Body must be JSON."}, status=400)
+    if not isinstance(payload, dict):
+        return JsonResponse({"error": "Body must be a JSON object."}, status=400)
+
+    ids = payload.get("ids")
+    if ids is not None and (not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids)):
+        return JsonResponse({"error": "ids must be a list of integers."}, status=400)
+
+    subnet_id = payload.get("subnet")
+    if subnet_id is not None and (not isinstance(subnet_id, int) or isinstance(subnet_id, bool)):
+        return JsonResponse({"error": "subnet must be an integer id."}, status=400)
+
+    owner_id = None
+    if payload.get("owner"):
+        owner = User.objects.filter(username=payload["owner"]).first()
+        if owner is None:
+            return JsonResponse({"error": "Unknown owner."}, status=400)
+        owner_id = owner.id
+
+    hostname_pattern = str(payload.get("hostname") or "").strip()
+    if ids is None and subnet_id is None and owner_id is None and not hostname_pattern:
+        return JsonResponse({"error": "Give ids or at least one of subnet/owner/hostname."}, status=400)
+
+    count = release_many(
+        user=request.user,
+        ids=ids,
+        subnet_id=subnet_id,
+        owner_id=owner_id,
+        hostname_pattern=hostname_pattern,
+    )
+    return JsonResponse({"released": count})
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_FIELDS = (
+    "subnet__name", "subnet__cidr", "ip", "status", "owner__username", "hostname",
+    "claimed_at", "released_at", "released_by__username", "description",
+)
+EXPORT_HEADER = ("subnet", "cidr", "ip", "status", "owner", "hostname", "claimed_at", "released_at", "released_by", "description")
+
+
+class _Echo:
+    # csv.writer target that hands each formatted line back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def _csv_stream(header, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat(timespec="seconds")
+    if isinstance(value, str):
+        return value.replace("\n", " ").strip()
+    return value
+
+
+@login_required
+def export_allocations(request):
+    """
+    Streams allocations as CSV (default) or NDJSON (?format=ndjson) with constant memory.
+    Filters: subnet=<id> (repeatable, default all active), q, mine, used, stale, status.
+    Staff only for stale reports and all-subnet dumps, like stale_csv.
+    """
+    fmt = request.GET.get("format", "csv")
+    if fmt not in ("csv", "ndjson"):
+        return HttpResponse("format must be csv or ndjson", status=400)
+
+    subnet_ids = [int(s) for s in request.GET.getlist("subnet") if s.isdigit()]
+    if not request.user.is_staff and (request.GET.get("stale") == "1" or not subnet_ids):
+        return HttpResponse("Forbidden", status=403)
+
+    qs = IPAddressAllocation.objects.filter(subnet__is_active=True)
+    if subnet_ids:
+        qs = qs.filter(subnet_id__in=subnet_ids)
+    if request.GET.get("status"):
+        qs = qs.filter(status=request.GET["status"].upper())
+
+    stale_cutoff = timezone.now() - timedelta(days=stale_window_days())
+    qs = filter_allocations(
+        qs,
+        q=(request.GET.get("q") or "").strip(),
+        owner=request.user if request.GET.get("mine") == "1" else None,
+        used_only=request.GET.get("used") == "1",
+        stale_cutoff=stale_cutoff if request.GET.get("stale") == "1" else None,
+    )
+
+    # address order through the (subnet, ip_int) and (subnet, ip6_key) indexes;
+    # iterator() streams from the DB cursor in chunks
+    rows = (
+        [_export_value(v) for v in row]
+        for row in qs.order_by("subnet_id", "ip_int", "ip6_key").values_list(*EXPORT_FIELDS).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+
+    stamp = timezone.now().strftime("%Y%m%d-%H%M%S")
+    if fmt == "ndjson":
+        body = (json.dumps(dict(zip(EXPORT_HEADER, row))) + "\n" for row in rows)
+        resp = StreamingHttpResponse(body, content_type="application/x-ndjson")
+    else:
+        resp = StreamingHttpResponse(_csv_stream(EXPORT_HEADER, rows), content_type="text/csv")
+    resp["Content-Disposition"] = f'attachment; filename="allocations_{stamp}.{fmt}"'
+    return resp
+
+
 @login_required
 def stale_csv(request, subnet_id: int):
     if not request.user.is_staff:
@@ -179,34 +447,97 @@ def stale_csv(request, subnet_id: int):
 
     subnet = get_object_or_404(Subnet, id=subnet_id, is_active=True)
 
-    stale_days = 30
+    stale_days = stale_window_days()
     stale_cutoff = timezone.now() - timedelta(days=stale_days)
 
     qs = IPAddressAllocation.objects.filter(
         subnet=subnet,
         status=IPAddressAllocation.Status.USED,
         claimed_at__lte=stale_cutoff
-    ).select_related("owner").order_by("claimed_at")
-
-    resp = HttpResponse(content_type="text/csv")
-    resp["Content-Disposition"] = f'attachment; filename="stale_{subnet.name}_{stale_days}d.csv"'
+    ).order_by("claimed_at").values_list("ip", "owner__username", "hostname", "claimed_at", "description")
 
-    w = csv.writer(resp)
-    w.writerow(["subnet", "cidr", "ip", "owner", "hostname", "claimed_at", "age_days", "description"])
     now = timezone.now()
-
-    for a in qs:
-        age_days = (now - a.claimed_at).days
-        w.writerow([
+    rows = (
+        [
             subnet.name,
             subnet.cidr,
-            a.ip,
-            a.owner.username,
-            a.hostname,
-            a.claimed_at.isoformat(timespec="seconds"),
-            age_days,
-            (a.description or "").replace("\n", " ").strip(),
-        ])
+            ip,
+            owner,
+            hostname,
+            claimed_at.isoformat(timespec="seconds"),
+            (now - claimed_at).days,
+            (description or "").replace("\n", " ").strip(),
+        ]
+        for ip, owner, hostname, claimed_at, description in qs.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    )
+    header = ["subnet", "cidr", "ip", "owner", "hostname", "claimed_at", "age_days", "description"]
 
+    resp = StreamingHttpResponse(_csv_stream(header, rows), content_type="text/csv")
+    resp["Content-Disposition"] = f'attachment; filename="stale_{subnet.name}_{stale_days}d.csv"'
+    return resp
+
+
+RECONCILE_DISPLAY_LIMIT = 500
+RECONCILE_HEADER = ("status", "ip", "mac", "last_seen", "owner", "hostname", "claimed_at")
+
+
+@login_required
+def reconcile_report(request, subnet_id: int):
+    """
+    Rogue (answering, not allocated) / orphaned (allocated, silent) / matching addresses from sweep data.
+    """
+    if not request.user.is_staff:
+        raise PermissionDenied
+
+    # supernets are not swept; their hosts are reported by the child subnets
+    subnet = get_object_or_404(Subnet, id=subnet_id, is_active=True, is_supernet=False)
+    report = reconcile_subnet(subnet)
+    sections = [
+        {
+            "status": status,
+            "count": len(getattr(report, status)),
+            "rows": [dict(zip(RECONCILE_HEADER, r)) for r in report.rows(status, limit=RECONCILE_DISPLAY_LIMIT)],
+        }
+        for status in ("rogue", "orphaned")
+    ]
+
+    return render(request, "ipmanager/reconcile.html", {
+        "subnet": subnet,
+        "report": report,
+        "sections": sections,
+        "matching_count": len(report.matching),
+        "window_hours": reconcile_window_hours(),
+        "last_sweep": last_sweep(subnet),
+        "display_limit": RECONCILE_DISPLAY_LIMIT,
+    })
+
+
+@login_required
+def reconcile_csv(request, subnet_id: int):
+    if not request.user.is_staff:
+        return HttpResponse("Forbidden", status=403)
+
+    subnet = get_object_or_404(Subnet, id=subnet_id, is_active=True, is_supernet=False)
+    rows = ([_export_value(v) for v in row] for row in reconcile_subnet(subnet).rows())
+
+    resp = StreamingHttpResponse(_csv_stream(RECONCILE_HEADER, rows), content_type="text/csv")
+    resp["Content-Disposition"] = f'attachment; filename="reconcile_{subnet.name}.csv"'
     return resp
 
+
+def metrics_view(request):
+    """
+    Prometheus text format. Scrapers send `Authorization: Bearer <IPAM_METRICS_TOKEN>`;
+    without a token configured only logged-in staff can read it.
+    """
+    if not metrics.enabled():
+        raise Http404
+
+    token = getattr(settings, "IPAM_METRICS_TOKEN", "")
+    if token:
+        if not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return HttpResponse("Forbidden", status=403)
+    elif not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponse("Forbidden", status=403)
+
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")